@@ -6,19 +6,26 @@ AI 偵測系統 - Streamlit Web 介面 (雲端優化版)
 
 import streamlit as st
 import pandas as pd
-import numpy as np
 from pathlib import Path
+import os
 import sys
-import time
 import json
 
 # 添加專案路徑
 sys.path.insert(0, str(Path(__file__).parent))
 
 from utils.feature_extractor import FeatureExtractor
+from utils.feature_cache import FeatureCache
+from utils.model_registry import memory_report
 from utils.data_manager import create_dataset, create_json_dataset, load_dataset
 from utils.xai_visualizer import XAIVisualizer
+from utils.heuristic_scorer import HeuristicScorer
+from utils.text_analysis import get_pos_tagger
+from utils.latency import LatencyBudget
+from utils.model_bundle import ModelBundle
+from utils.lm_backends import backend_from_spec
 from models.ai_detector import AIDetector
+from models.cascade_detector import CascadeDetector, FAST_MODEL_PATH, DEFAULT_UNCERTAINTY_BAND
 
 
 # ===== 頁面配置 =====
@@ -80,11 +87,138 @@ st.sidebar.markdown("---")
 # 語言選擇
 language = st.sidebar.radio("Language / 語言", ["English", "中文"])
 
-# 初始化 Streamlit session state
-if 'detector' not in st.session_state:
-    st.session_state.detector = None
-if 'feature_extractor' not in st.session_state:
-    st.session_state.feature_extractor = FeatureExtractor()
+# 延遲預算：超出時截短困惑度視窗、略過詞性標註
+latency_budget_ms = st.sidebar.number_input(
+    "Latency budget (ms)", min_value=100, max_value=30000, value=1000, step=100
+)
+
+# 串接偵測：快速模型的 AI 機率落在不確定區間內才計算困惑度
+use_cascade = st.sidebar.checkbox("Early-exit cascade", value=False)
+uncertainty_band = st.sidebar.slider(
+    "Uncertainty band", min_value=0.0, max_value=1.0, value=DEFAULT_UNCERTAINTY_BAND, step=0.01,
+    disabled=not use_cascade,
+)
+
+# ===== 行程層級共用資源 =====
+# 以 st.cache_resource 快取的物件在所有瀏覽器 session 之間共用，
+# 新使用者不必重新載入語言模型與 NLTK 標註器，記憶體也不會隨 session 數增加。
+MODEL_PATH = "models/ai_detector_model.pkl"
+
+# 設定後所有模型與 NLTK 資料只從離線模型包載入 (見 utils/model_bundle.py)
+BUNDLE_DIR = os.environ.get('AI_DETECTOR_BUNDLE')
+
+# 語言模型推論精度 ('fp32'、'bf16' 或 'int8')；偏差可用 benchmarks/precision_validation.py 量測
+LM_PRECISION = os.environ.get('AI_DETECTOR_PRECISION', 'fp32')
+
+# 困惑度評分後端，例如 "onnx:models/lm_onnx" 或 "ngram:models/lm.arpa" (見 utils/lm_backends.py)
+LM_BACKEND = os.environ.get('AI_DETECTOR_LM_BACKEND')
+
+# 設定時合併各 session 同時送出的困惑度前向傳播，值為最長等待毫秒數 (見 utils/micro_batcher.py)
+MICRO_BATCH_MS = os.environ.get('AI_DETECTOR_MICRO_BATCH_MS')
+
+
+def model_file_version(model_path: str = MODEL_PATH):
+    """模型檔案的修改時間；作為快取鍵的一部分，檔案更新後偵測器會重新載入"""
+    path = Path(model_path)
+    return path.stat().st_mtime_ns if path.exists() else None
+
+
+@st.cache_resource(show_spinner=False)
+def load_model_bundle():
+    """開啟並驗證離線模型包"""
+    return ModelBundle(BUNDLE_DIR)
+
+
+@st.cache_resource(show_spinner=False)
+def load_pos_tagger():
+    """共用的 NLTK 詞性標註器"""
+    return get_pos_tagger()
+
+
+@st.cache_resource(show_spinner=False)
+def load_heuristic_scorer():
+    """啟發式評分器 (標記比對規則已預先編譯)"""
+    return HeuristicScorer()
+
+
+@st.cache_resource(show_spinner=False)
+def load_feature_extractor():
+    """共用的特徵提取器 (含 distilgpt2 與特徵快取)"""
+    cache = FeatureCache(max_entries=512, db_path='data/feature_cache.sqlite')
+    if BUNDLE_DIR:
+        extractor = load_model_bundle().create_feature_extractor(cache=cache, precision=LM_PRECISION)
+    elif LM_BACKEND:
+        extractor = FeatureExtractor(cache=cache, backend=backend_from_spec(LM_BACKEND, precision=LM_PRECISION))
+    else:
+        extractor = FeatureExtractor(cache=cache, precision=LM_PRECISION)
+    if MICRO_BATCH_MS:
+        extractor.enable_micro_batching(max_wait_ms=float(MICRO_BATCH_MS))
+    load_pos_tagger()
+    return extractor
+
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def load_detector(model_path: str, model_version):
+    """
+    共用的偵測器
+    
+    Args:
+        model_path: 模型檔案路徑
+        model_version: model_file_version() 的結果，只用於區分快取項目
+    
+    Returns:
+        已載入分類器的 AIDetector；模型不存在時為未訓練的 AIDetector
+    """
+    extractor = load_feature_extractor()
+    if model_version is None:
+        return AIDetector(feature_extractor=extractor)
+    try:
+        return AIDetector(model_path=model_path, feature_extractor=extractor)
+    except Exception as e:
+        print(f"Warning: failed to load model from {model_path}: {e}")
+        return AIDetector(feature_extractor=extractor)
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def load_cascade(model_path: str, model_version, fast_model_version, band: tuple):
+    """
+    包住共用偵測器的串接偵測器 (每個不確定區間一份，快速模型很小)
+    
+    Args:
+        model_path / model_version: 同 load_detector
+        fast_model_version: 快速模型檔案的修改時間，只用於區分快取項目
+        band: 不確定區間 (low, high)
+    
+    Returns:
+        CascadeDetector
+    """
+    return CascadeDetector(load_detector(model_path, model_version), model_path=FAST_MODEL_PATH,
+                           uncertainty_band=band)
+
+
+def get_cascade(band: tuple):
+    """取得串接偵測器；沒有已訓練的分類器或快速模型時為 None"""
+    fast_model_version = model_file_version(FAST_MODEL_PATH)
+    if fast_model_version is None or BUNDLE_DIR or get_detector().classifier is None:
+        return None
+    return load_cascade(MODEL_PATH, model_file_version(MODEL_PATH), fast_model_version, tuple(band))
+
+
+def get_detector() -> AIDetector:
+    """取得與磁碟上模型檔案一致的偵測器 (使用模型包時只用包內的分類器)"""
+    if BUNDLE_DIR:
+        classifier_path = load_model_bundle().classifier_path
+        if classifier_path is None:
+            return load_detector(None, None)
+        model_path = str(classifier_path)
+    else:
+        model_path = MODEL_PATH
+    return load_detector(model_path, model_file_version(model_path))
+
+
+heuristic_scorer = load_heuristic_scorer()
+
+# 初始化 Streamlit session state (只保存每個使用者自己的結果)
 if 'prediction_result' not in st.session_state:
     st.session_state.prediction_result = None
 if 'input_text' not in st.session_state:
@@ -251,210 +385,32 @@ with tab1:
             st.error("⚠️ Please enter or upload text to analyze.")
         else:
             try:
-                # 載入或初始化模型
-                model_path = "models/ai_detector_model.pkl"
+                budget = LatencyBudget(budget_ms=latency_budget_ms)
                 
-                if st.session_state.detector is None:
-                    with st.spinner(lang_str['analyzing']):
-                        try:
-                            st.session_state.detector = AIDetector(model_path=model_path)
-                        except:
-                            # 如果模型不存在，創建新的偵測器
-                            st.session_state.detector = AIDetector()
+                # 載入偵測器 (行程內共用，僅第一次或模型檔案更新後才會實際載入)
+                with st.spinner(lang_str['analyzing']), budget.stage('model_load'):
+                    detector = get_detector()
+                    cascade = get_cascade(uncertainty_band) if use_cascade else None
                 
                 # 進行預測
                 with st.spinner(lang_str['analyzing']):
-                    time.sleep(0.5)
-                    
-                    if st.session_state.detector.classifier is not None:
-                        prediction = st.session_state.detector.predict(input_text)
+                    if cascade is not None:
+                        prediction = cascade.predict(input_text, budget=budget, return_token_scores=True)
+                    elif detector.classifier is not None:
+                        prediction = detector.predict(input_text, budget=budget, return_token_scores=True)
                     else:
                         # 只進行特徵分析 - 使用最優化的評分邏輯
-                        features = st.session_state.feature_extractor.extract_all_features(input_text)
+                        features, token_scores = detector.feature_extractor.extract_all_features(
+                            input_text, budget=budget, return_token_scores=True
+                        )
                         
                         # ===== 最優化的 AI 偵測評分邏輯 =====
-                        ai_score = 0
-                        score_factors = {}
-                        
-                        # 清理和準備文本
-                        words = input_text.split()
-                        words_lower = [w.lower() for w in words]
-                        
-                        # 1. 詞彙多樣性 (31% ↑)
-                        if len(words_lower) > 0:
-                            unique_words = len(set(words_lower))
-                            vocab_ratio = unique_words / len(words_lower)
-                            vocab_score = max(0, min((vocab_ratio - 0.54) / 0.26, 1)) * 0.31
-                            ai_score += vocab_score
-                            score_factors['vocabulary_diversity'] = vocab_score
-                        
-                        # 2. 句子一致性 (29% ↓)
-                        sentences = [s.strip() for s in 
-                                   input_text.replace('。', '.|').replace('！', '!|').replace('？', '?|')
-                                           .replace('.', '.|').replace('!', '!|').replace('?', '?|')
-                                           .split('|') if s.strip()]
-                        if len(sentences) > 1:
-                            sent_lengths = [len(s.split()) for s in sentences]
-                            mean_len = np.mean(sent_lengths)
-                            std_len = np.std(sent_lengths)
-                            cv = std_len / (mean_len + 1e-6) if mean_len > 0 else 0
-                            consistency_score = max(0, 1 - min(cv, 1.3) / 1.3) * 0.29
-                            ai_score += consistency_score
-                            score_factors['sentence_consistency'] = consistency_score
-                        
-                        # 3. 英文功能詞 (8%)
-                        if any(ord(c) < 128 for c in input_text):
-                            function_words = {'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'of',
-                                            'is', 'are', 'was', 'were', 'be', 'been', 'have', 'has', 'had'}
-                            if len(words_lower) > 0:
-                                func_word_count = sum(1 for w in words_lower if w in function_words)
-                                func_ratio = func_word_count / len(words_lower)
-                                func_score = min(func_ratio / 0.30, 1) * 0.08
-                                ai_score += func_score
-                                score_factors['function_words'] = func_score
-                        
-                        # 4. 標點符號密度 (6%)
-                        punct_chars = '.,!?;:\'"—-。！？；：''""'
-                        total_punct = sum(1 for c in input_text if c in punct_chars)
-                        punct_density = total_punct / max(len(input_text), 1)
-                        
-                        if punct_density < 0.015:
-                            punct_score = 0.0
-                        elif punct_density < 0.03:
-                            punct_score = 0.03
-                        else:
-                            punct_score = 0.06
-                        
-                        ai_score += punct_score
-                        score_factors['punctuation_pattern'] = punct_score
-                        
-                        # 5. 古文/經典文學檢測 (10% ↓)
-                        import re
-                        
-                        # 古文/經典文學標記 (應該懲罰)
-                        classical_literary_markers = {
-                            # 中文古文詞彙
-                            '然而', '既然', '莫若', '其實', '況且', '而況', '不料', '豈料',
-                            '想不到', '怎料', '誰知', '卻', '竟', '竟然', '偏偏', '恰好',
-                            '恰恰', '正好', '湊巧', '怪不得', '也難怪', '也怪得',
-                            '橫豎', '仔細', '戰慄', '歪歪斜斜', '吃人', '字縫',
-                            '翻開', '歷史', '仁義', '道德', '滿本',
-                            # 英文古典詞彙
-                            'alas', 'behold', 'hark', 'lo', 'methinks', 'perchance',
-                            'forsooth', 'thus', 'verily', 'hence', 'whence', 'thence',
-                            'thee', 'thou', 'thy', 'hath', 'doth', 'wherefore',
-                        }
-                        
-                        classical_count = 0
-                        text_lower = input_text.lower()
-                        
-                        for marker in classical_literary_markers:
-                            if '\u4e00' <= marker[0] <= '\u9fff':
-                                if marker in text_lower:
-                                    classical_count += 1
-                            elif ord(marker[0]) < 128:
-                                if re.search(r'\b' + marker + r'\b', text_lower):
-                                    classical_count += 1
-                        
-                        if classical_count > 0:
-                            classical_penalty = min(classical_count * 0.25, 0.40)
-                            ai_score -= classical_penalty
-                            score_factors['literary_style'] = -classical_penalty
-                        else:
-                            score_factors['literary_style'] = 0.0
-                        
-                        # 5.5 浪漫/情感內容檢測 (不懲罰,僅作為標籤)
-                        # 檢測現代浪漫/感情詞彙 - 這不應該被視為古文標記
-                        romantic_emotional_words = {
-                            # 英文浪漫詞彙
-                            'love', 'heart', 'smile', 'warmth', 'embrace', 'promise',
-                            'fire', 'silence', 'perfect', 'familiar', 'softly', 'closer',
-                            'traced', 'whisper', 'blurred', 'watercolors', 'amber', 'glow',
-                            'breathing', 'murmured', 'kissing', 'admitted', 'troubled',
-                            'borrowed', 'countered', 'foreheads', 'scent', 'clung',
-                            'sweater', 'stillness', 'chaos', 'undeniable', 'pensive',
-                            'wrapped', 'completely', 'whispered', 'storms', 'waiting',
-                            'tightening', 'moon', 'vow', 'fireworks', 'solidity',
-                            'surveillance', 'tender', 'gentle', 'passionate', 'desire',
-                            'longing', 'yearning', 'adore', 'cherish', 'beloved',
-                            # 中文浪漫詞彙
-                            '愛', '心', '溫暖', '擁抱', '承諾', '火', '沉默', '完美',
-                            '熟悉', '輕輕', '靠近', '描繪', '低語', '親吻', '承認',
-                        }
-                        
-                        romantic_count = 0
-                        words_list = input_text.lower().split()
-                        for word in words_list:
-                            clean_word = word.strip('.,!?;:\'"')
-                            if clean_word in romantic_emotional_words:
-                                romantic_count += 1
-                        
-                        # 檢查中文浪漫詞
-                        for marker in romantic_emotional_words:
-                            if '\u4e00' <= marker[0] <= '\u9fff':
-                                if marker in text_lower:
-                                    romantic_count += 1
-                        
-                        score_factors['romantic_content'] = romantic_count
-                        # 注意: 不會減少 ai_score,因為浪漫內容可以與 AI 生成並存
-                        
-                        # 6. 人性化標記 (7%)
-                        humanization_score = 0
-                        
-                        question_count = input_text.count('?') + input_text.count('？')
-                        question_ratio = question_count / max(len(sentences), 1)
-                        if question_ratio > 0.15:
-                            humanization_score += 0.035
-                        
-                        ellipsis_count = input_text.count('...') + input_text.count('。。。')
-                        if ellipsis_count > 0:
-                            humanization_score += 0.02
-                        
-                        personal_words = {'我', '我覺得', '我認為', '我想', '我發現', '我看', 
-                                        'i think', 'i feel', 'i believe', 'in my opinion'}
-                        personal_count = 0
-                        for word in personal_words:
-                            if '\u4e00' <= word[0] <= '\u9fff':
-                                if word in text_lower:
-                                    personal_count += 1
-                            else:
-                                if re.search(r'\b' + word + r'\b', text_lower):
-                                    personal_count += 1
-                        
-                        if personal_count > 1:
-                            humanization_score += min(personal_count * 0.015, 0.015)
-                        
-                        ai_score -= min(humanization_score, 0.07)
-                        score_factors['humanization'] = -min(humanization_score, 0.07)
-                        
-                        # 7. 結構規律性 (9% ↑ to reach 100% total: 31+29+8+6+10+7+9=100%)
-                        paragraphs = [p.strip() for p in input_text.split('\n\n') if p.strip()]
-                        if len(paragraphs) <= 1:
-                            ai_score += 0.045
-                            score_factors['structure'] = 0.045
-                        else:
-                            para_lengths = [len(p.split()) for p in paragraphs]
-                            para_std = np.std(para_lengths)
-                            para_mean = np.mean(para_lengths)
-                            para_cv = para_std / (para_mean + 1e-6) if para_mean > 0 else 0
-                            struct_score = max(0, 1 - min(para_cv, 1)) * 0.09
-                            ai_score += struct_score
-                            score_factors['structure'] = struct_score
-                        
-                        # 確保分數在 [0, 1] 範圍內
-                        ai_prob = max(0, min(ai_score, 1.0))
-                        
-                        # 計算置信度
-                        confidence = max(abs(ai_prob - 0.5) * 2, 0.5)
-                        
-                        prediction = {
-                            'prediction': 1 if ai_prob >= 0.5 else 0,
-                            'ai_probability': ai_prob,
-                            'human_probability': 1 - ai_prob,
-                            'confidence': confidence,
-                            'extracted_features': features,
-                            'score_factors': score_factors,
-                        }
+                        with budget.stage('classification'):
+                            prediction = heuristic_scorer.score(input_text)
+                        prediction['extracted_features'] = features
+                        prediction['token_scores'] = token_scores
+                
+                prediction['latency'] = budget.report()
                 
                 # 儲存結果
                 st.session_state.prediction_result = prediction
@@ -495,6 +451,10 @@ with tab1:
             </div>
             """, unsafe_allow_html=True)
         
+        if prediction.get('degraded'):
+            degradations = prediction.get('latency', {}).get('degradations', [])
+            st.warning(f"⚠️ Reduced-accuracy result (latency budget): {'; '.join(degradations)}")
+        
         # 詳細指標
         st.markdown(f"### {lang_str['results_title']}")
         
@@ -580,6 +540,48 @@ with tab2:
                 ])
                 st.dataframe(score_df, use_container_width=True, hide_index=True)
         
+        # 延遲分解
+        if 'latency' in prediction:
+            latency = prediction['latency']
+            st.markdown("---")
+            st.subheader("⏱️ Latency Breakdown")
+            
+            latency_df = pd.DataFrame([
+                {'Stage': name.replace('_', ' ').title(), 'Time (ms)': f"{ms:.1f}"}
+                for name, ms in latency['stages_ms'].items()
+            ])
+            st.dataframe(latency_df, use_container_width=True, hide_index=True)
+            
+            budget_text = f" / budget {latency['budget_ms']:.0f} ms" if latency['budget_ms'] else ""
+            if latency['within_budget']:
+                st.success(f"Total {latency['total_ms']:.1f} ms{budget_text}")
+            else:
+                st.warning(f"Total {latency['total_ms']:.1f} ms{budget_text} (over budget)")
+            for degradation in latency['degradations']:
+                st.info(f"Degraded: {degradation}")
+            
+            if 'cascade' in prediction:
+                fast_probability = prediction['cascade']['fast_probability']
+                if prediction['cascade']['stage'] == 'fast':
+                    st.info(f"Early exit: fast classifier AI probability {fast_probability:.2%} "
+                            f"is outside the uncertainty band, language model skipped")
+                else:
+                    st.info(f"Fast classifier AI probability {fast_probability:.2%} was uncertain, "
+                            f"language model perplexity computed")
+        
+        # 逐 token 熱力圖 (使用預測時保存的分數，不需再做一次前向傳播)
+        token_scores = prediction.get('token_scores')
+        if token_scores is not None and len(token_scores['tokens']) > 0:
+            st.markdown("---")
+            st.subheader("🔥 Token Log-Probability")
+            st.caption("Higher (greener) = more predictable to the language model")
+            fig = XAIVisualizer.plot_text_token_heatmap(
+                token_scores['tokens'].tolist(),
+                token_scores['log_probs'].tolist(),
+                title="Token Log-Probability",
+            )
+            st.plotly_chart(fig, use_container_width=True)
+        
         # 詳細特徵表
         st.markdown("---")
         st.subheader(lang_str['features_title'])
@@ -638,7 +640,13 @@ with tab3:
     with col2:
         st.subheader(lang_str['train_title'])
         
-        if st.button(lang_str['train_model_btn'], use_container_width=True, key="train_model"):
+        # 使用模型包時分類器只從包內載入，訓練結果不會被使用
+        if BUNDLE_DIR:
+            st.warning(f"Training is disabled: the classifier is loaded from the model bundle ({BUNDLE_DIR}). "
+                       f"Unset AI_DETECTOR_BUNDLE to train and use a local model.")
+        
+        if st.button(lang_str['train_model_btn'], use_container_width=True, key="train_model",
+                     disabled=bool(BUNDLE_DIR)):
             with st.spinner(lang_str['training_message']):
                 try:
                     # 確保數據集存在
@@ -647,15 +655,18 @@ with tab3:
                         create_dataset(dataset_path, language='english')
                     
                     # 訓練模型
-                    detector = AIDetector()
-                    results = detector.train(dataset_path, test_size=0.2)
+                    detector = AIDetector(feature_extractor=load_feature_extractor())
+                    # 特徵庫已存在時只需重新擬合分類器，不必重跑特徵提取
+                    results = detector.train(dataset_path, test_size=0.2, feature_store='data/features_en')
                     
-                    # 保存模型
+                    # 保存模型；檔案修改時間改變後，所有 session 都會改用新模型
                     Path('models').mkdir(exist_ok=True)
-                    detector.save_model('models/ai_detector_model.pkl')
+                    detector.save_model(MODEL_PATH)
                     
-                    # 更新 session state
-                    st.session_state.detector = detector
+                    # 串接偵測的快速模型：沿用同一個特徵庫中不需語言模型的欄位
+                    cascade = CascadeDetector(detector)
+                    cascade.train_fast(dataset_path, test_size=0.2, feature_store='data/features_en')
+                    cascade.save_fast_model(FAST_MODEL_PATH)
                     
                     st.success(lang_str['training_complete'])
                     
@@ -675,12 +686,32 @@ with tab3:
     st.markdown("---")
     st.subheader("ℹ️ Model Information")
     
-    if st.session_state.detector and st.session_state.detector.classifier:
+    detector = get_detector()
+    if detector.classifier is not None:
         st.success("✅ Model loaded and ready")
-        st.info(f"Features: {len(st.session_state.detector.feature_names) if hasattr(st.session_state.detector, 'feature_names') else 'N/A'}")
+        st.info(f"Features: {len(detector.feature_names) if hasattr(detector, 'feature_names') else 'N/A'}")
+        cascade = get_cascade(uncertainty_band)
+        if cascade is not None:
+            cascade_stats = cascade.stats()
+            st.info(f"Cascade fast model loaded: {cascade_stats['early_exits']} / {cascade_stats['total']} "
+                    f"predictions exited early ({cascade_stats['early_exit_rate']:.1%})")
     else:
         st.warning("⚠️ No trained model loaded. AI detection will use heuristic analysis.")
     
+    for model_key, usage in memory_report().items():
+        st.info(f"Language model {model_key}: {usage['megabytes']:.1f} MB ({usage['parameters']:,} parameters)")
+    
+    feature_cache = detector.feature_extractor.cache
+    if feature_cache is not None:
+        cache_stats = feature_cache.stats()
+        cols = st.columns(3)
+        with cols[0]:
+            st.metric("Cache Hits", cache_stats['hits'])
+        with cols[1]:
+            st.metric("Cache Misses", cache_stats['misses'])
+        with cols[2]:
+            st.metric("Hit Rate", f"{cache_stats['hit_rate']:.1%}")
+    
     # 使用說明
     st.markdown("---")
     st.subheader("📖 How to Use")
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+串接偵測器基準測試 - 掃描不確定區間，量測提前結束比例、準確率代價與加速倍數
+
+兩段模型的機率各計算一次後以 CascadeDetector.band_report 套用每個區間；
+速度則以完整偵測器與各區間的串接偵測器逐篇預測同一批文本實際量測
+(特徵提取器不設快取)。
+
+用法:
+    python benchmarks/cascade.py --classifier models/ai_detector_model.pkl --fast-model models/cascade_fast_model.pkl
+    python benchmarks/cascade.py --dataset data/test_en.csv --bands 0.3:0.7 0.15:0.85 0.05:0.95
+    python benchmarks/cascade.py --train-dataset data/training_data_en.csv    # 快速模型不存在時先訓練
+"""
+
+import argparse
+import contextlib
+import json
+import sys
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from utils.data_manager import load_dataset, HUMAN_SAMPLES, AI_SAMPLES
+from utils.feature_extractor import FeatureExtractor
+from models.ai_detector import AIDetector
+from models.cascade_detector import CascadeDetector, FAST_MODEL_PATH
+
+
+def load_labelled_corpus(dataset_path: str = None, limit: int = None) -> Tuple[List[str], List[int]]:
+    """載入有標籤的測試語料 (未指定數據集時使用內建範例)"""
+    if dataset_path:
+        data = load_dataset(dataset_path)
+        texts, labels = [d['text'] for d in data], [int(d['label']) for d in data]
+    else:
+        texts = list(HUMAN_SAMPLES) + list(AI_SAMPLES)
+        labels = [0] * len(HUMAN_SAMPLES) + [1] * len(AI_SAMPLES)
+    return (texts[:limit], labels[:limit]) if limit else (texts, labels)
+
+
+def parse_band(value: str) -> Tuple[float, float]:
+    """'low:high' → (low, high)"""
+    low, _, high = value.partition(':')
+    return float(low), float(high)
+
+
+def time_predictions(predict, texts: List[str]) -> float:
+    """逐篇預測的平均毫秒數"""
+    predict(texts[0])  # 暖機
+    start = time.perf_counter()
+    for text in texts:
+        predict(text)
+    return (time.perf_counter() - start) * 1000 / len(texts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep cascade uncertainty bands: early-exit rate, accuracy cost, speedup")
+    parser.add_argument('--model', default='distilgpt2')
+    parser.add_argument('--classifier', default='models/ai_detector_model.pkl')
+    parser.add_argument('--fast-model', default=FAST_MODEL_PATH)
+    parser.add_argument('--train-dataset', default=None, help="train the fast model on this dataset if it is missing")
+    parser.add_argument('--dataset', default=None, help="labelled evaluation corpus (default: built-in samples)")
+    parser.add_argument('--limit', type=int, default=None)
+    parser.add_argument('--bands', type=parse_band, nargs='+',
+                        default=[(0.5, 0.5), (0.4, 0.6), (0.3, 0.7), (0.15, 0.85), (0.05, 0.95)],
+                        help="uncertainty bands as low:high")
+    parser.add_argument('--no-timing', action='store_true', help="skip the latency measurement")
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    args = parser.parse_args()
+    
+    # --json 時把進度訊息 (含模型載入、特徵提取的輸出) 導向 stderr，stdout 只有 JSON
+    with contextlib.redirect_stdout(sys.stderr if args.json else sys.stdout):
+        detector = AIDetector(model_path=args.classifier, feature_extractor=FeatureExtractor(model_name=args.model))
+        if detector.classifier is None:
+            parser.error(f"classifier not found: {args.classifier}")
+        
+        cascade = CascadeDetector(detector, model_path=args.fast_model)
+        if cascade.fast_classifier is None:
+            if not args.train_dataset:
+                parser.error(f"fast model not found: {args.fast_model} (pass --train-dataset to train it)")
+            cascade.train_fast(args.train_dataset)
+            cascade.save_fast_model(args.fast_model)
+        
+        texts, labels = load_labelled_corpus(args.dataset, args.limit)
+        print(f"Corpus: {len(texts)} texts", file=sys.stderr)
+        
+        report = cascade.evaluate(texts, labels, bands=args.bands)
+        
+        if not args.no_timing:
+            full_ms = time_predictions(detector.predict, texts)
+            for row in report:
+                cascade.set_uncertainty_band(row['low'], row['high'])
+                row['latency_ms'] = time_predictions(cascade.predict, texts)
+                row['speedup'] = full_ms / row['latency_ms']
+                row['full_latency_ms'] = full_ms
+    
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    
+    print("=" * 84)
+    print(f"{'Band':<14}{'Early exit':>11}{'Cascade acc':>13}{'Full acc':>10}{'Acc cost':>10}"
+          f"{'Exit acc':>10}{'ms/text':>9}{'Speedup':>9}")
+    print("-" * 84)
+    for row in report:
+        band = f"{row['low']:.2f}-{row['high']:.2f}"
+        exit_acc = f"{row['early_exit_accuracy']:.3f}" if row['early_exit_accuracy'] is not None else '-'
+        latency = f"{row['latency_ms']:.1f}" if 'latency_ms' in row else '-'
+        speedup = f"{row['speedup']:.2f}x" if 'speedup' in row else '-'
+        print(f"{band:<14}{row['early_exit_rate']:>10.1%}{row['cascade_accuracy']:>13.3f}{row['full_accuracy']:>10.3f}"
+              f"{row['accuracy_cost']:>+10.3f}{exit_acc:>10}{latency:>9}{speedup:>9}")
+    print("=" * 84)
+    if 'full_latency_ms' in report[0]:
+        print(f"Full detector: {report[0]['full_latency_ms']:.1f} ms/text. "
+              f"Acc cost = full accuracy - cascade accuracy (positive means the cascade is worse).")
+
+
+if __name__ == "__main__":
+    main()
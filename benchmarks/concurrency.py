@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+並行基準測試 - 掃描 torch intra-op 執行緒數 × 推論執行緒數，量測特徵提取的總吞吐量
+
+每個組合在獨立的 spawn 子行程中執行 (torch 的 inter-op 執行緒數只能設定一次)：
+子行程以 configure_torch_threads 設定 intra-op 執行緒數，再由 workers 個執行緒
+共用同一個 FeatureExtractor 同時呼叫 extract_all_features。
+(intra-op × workers) 超過 CPU 核心數時即為超額訂閱，通常吞吐量會下降。
+
+用法:
+    python benchmarks/concurrency.py
+    python benchmarks/concurrency.py --threads 1 2 4 --workers 1 2 4 8 --micro-batch-ms 5
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from utils.data_manager import load_dataset, HUMAN_SAMPLES, AI_SAMPLES
+
+
+def load_corpus(dataset_path: str = None, limit: int = None) -> List[str]:
+    """載入測試語料 (未指定數據集時使用內建範例)"""
+    if dataset_path:
+        texts = [item['text'] for item in load_dataset(dataset_path)]
+    else:
+        texts = list(HUMAN_SAMPLES) + list(AI_SAMPLES)
+    return texts[:limit] if limit else texts
+
+
+def _stdout_to_stderr():
+    """子行程初始化：--json 時子行程的輸出 (模型載入訊息等) 也導向 stderr"""
+    sys.stdout = sys.stderr
+
+
+def run_configuration(model: str, texts: List[str], threads: int, workers: int, rounds: int,
+                      micro_batch_ms: float = None) -> Dict:
+    """
+    在子行程中量測一個 (intra-op 執行緒數, 推論執行緒數) 組合 (由 ProcessPoolExecutor 呼叫)
+    
+    Returns:
+        吞吐量、單篇延遲分位數與錯誤數
+    """
+    from utils.feature_extractor import FeatureExtractor
+    from utils.model_registry import configure_torch_threads
+    
+    configured = configure_torch_threads(intra_op=threads, inter_op=1)
+    extractor = FeatureExtractor(model_name=model)
+    if micro_batch_ms:
+        extractor.enable_micro_batching(max_wait_ms=micro_batch_ms)
+    
+    # 暖機
+    extractor.extract_all_features(texts[0])
+    
+    latencies = []
+    errors = 0
+    
+    def extract(text):
+        nonlocal errors
+        start = time.perf_counter()
+        features = extractor.extract_all_features(text)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if not any(name.startswith('pp_') for name in features):
+            errors += 1
+    
+    workload = texts * rounds
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(extract, workload))
+    seconds = time.perf_counter() - start
+    
+    return {
+        'threads': configured['intra_op'],
+        'workers': workers,
+        'texts_per_second': len(workload) / seconds,
+        'latency_p50_ms': float(np.percentile(latencies, 50)),
+        'latency_p95_ms': float(np.percentile(latencies, 95)),
+        'errors': errors,
+    }
+
+
+def build_report(args) -> List[Dict]:
+    """每個組合在獨立的 spawn 子行程中量測"""
+    cores = os.cpu_count() or 1
+    thread_counts = args.threads or sorted({1, 2, max(1, cores // 2), cores})
+    texts = load_corpus(args.dataset, args.limit)
+    print(f"Corpus: {len(texts)} texts x {args.rounds} rounds, {cores} CPU cores", file=sys.stderr)
+    
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for threads in thread_counts:
+        for workers in args.workers:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context,
+                                     initializer=_stdout_to_stderr if args.json else None) as pool:
+                try:
+                    results.append(pool.submit(
+                        run_configuration, args.model, texts, threads, workers, args.rounds, args.micro_batch_ms
+                    ).result())
+                except Exception as e:
+                    results.append({'threads': threads, 'workers': workers, 'error': str(e)})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep torch threads x inference workers and report throughput")
+    parser.add_argument('--model', default='distilgpt2')
+    parser.add_argument('--dataset', default=None, help="corpus (default: built-in samples)")
+    parser.add_argument('--limit', type=int, default=None)
+    parser.add_argument('--rounds', type=int, default=2, help="passes over the corpus per configuration")
+    parser.add_argument('--threads', type=int, nargs='+', default=None, help="torch intra-op threads to try")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8], help="inference threads to try")
+    parser.add_argument('--micro-batch-ms', type=float, default=None, help="enable micro-batching with this wait")
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    args = parser.parse_args()
+    
+    # --json 時把進度訊息導向 stderr，stdout 只有 JSON
+    with contextlib.redirect_stdout(sys.stderr if args.json else sys.stdout):
+        results = build_report(args)
+    
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    
+    cores = os.cpu_count() or 1
+    best = max((r for r in results if 'error' not in r), key=lambda r: r['texts_per_second'], default=None)
+    print("=" * 72)
+    print(f"{'Threads':>8}{'Workers':>9}{'Total':>7}{'Texts/s':>11}{'p50 ms':>10}{'p95 ms':>10}{'Errors':>8}")
+    print("-" * 72)
+    for result in results:
+        if 'error' in result:
+            print(f"{result['threads']:>8}{result['workers']:>9}  failed: {result['error']}")
+            continue
+        total = result['threads'] * result['workers']
+        marker = ' *' if result is best else ('  (oversubscribed)' if total > cores else '')
+        print(f"{result['threads']:>8}{result['workers']:>9}{total:>7}{result['texts_per_second']:>11.1f}"
+              f"{result['latency_p50_ms']:>10.1f}{result['latency_p95_ms']:>10.1f}{result['errors']:>8}{marker}")
+    print("=" * 72)
+    if best is not None:
+        print(f"Best: {best['threads']} torch threads x {best['workers']} workers "
+              f"(AI_DETECTOR_TORCH_THREADS={best['threads']} AI_DETECTOR_WORKERS={best['workers']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+評分後端基準測試 - 比較各困惑度後端的延遲、記憶體與偵測 AUC
+
+每個後端在獨立的 spawn 子行程中載入，記憶體數字互不干擾。
+AUC 有兩種：pp_log_prob_mean 單一特徵的 AUC (AI 文本通常較容易預測)，
+以及只用 pp_* 特徵的邏輯迴歸交叉驗證 AUC。
+
+用法:
+    python benchmarks/lm_backends.py --dataset data/training_data_en.csv \
+        transformers:distilgpt2 onnx:models/lm_onnx ngram:models/lm.arpa
+
+n-gram 模型若由同一份數據集訓練，AUC 會偏高；請用另外的語料訓練。
+"""
+
+import argparse
+import contextlib
+import json
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from utils.data_manager import load_dataset, HUMAN_SAMPLES, AI_SAMPLES
+
+
+def load_labelled_corpus(dataset_path: str = None, limit: int = None) -> List[Dict]:
+    """載入有標籤的語料 (未指定數據集時使用內建範例；0 = Human, 1 = AI)"""
+    if dataset_path:
+        data = load_dataset(dataset_path)
+    else:
+        data = [{'text': t, 'label': 0} for t in HUMAN_SAMPLES] + [{'text': t, 'label': 1} for t in AI_SAMPLES]
+    return data[:limit] if limit else data
+
+
+def _rss_mb() -> float:
+    """目前行程的最大常駐記憶體 (MB，Linux 的 ru_maxrss 單位為 KB)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _detection_auc(features: List[Dict], labels: np.ndarray) -> Dict:
+    """由 pp_* 特徵計算偵測 AUC"""
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.metrics import roc_auc_score
+    from sklearn.model_selection import StratifiedKFold, cross_val_predict
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+    
+    names = sorted({k for f in features for k in f if k.startswith('pp_') and k != 'pp_num_tokens'})
+    X = np.array([[f.get(name, 0.0) for name in names] for f in features], dtype=np.float64)
+    X = np.nan_to_num(X, nan=0.0, posinf=0.0, neginf=0.0)
+    
+    result = {'log_prob_mean_auc': float(roc_auc_score(labels, X[:, names.index('pp_log_prob_mean')]))}
+    
+    folds = min(5, int(np.bincount(labels).min()))
+    if folds >= 2:
+        model = make_pipeline(StandardScaler(), LogisticRegression(max_iter=1000))
+        cv = StratifiedKFold(n_splits=folds, shuffle=True, random_state=42)
+        scores = cross_val_predict(model, X, labels, cv=cv, method='predict_proba')[:, 1]
+        result['cv_logistic_auc'] = float(roc_auc_score(labels, scores))
+    return result
+
+
+def _stdout_to_stderr():
+    """子行程初始化：--json 時子行程的輸出 (模型載入訊息等) 也導向 stderr"""
+    sys.stdout = sys.stderr
+
+
+def benchmark_backend(spec: str, texts: List[str], labels: List[int], batch_size: int) -> Dict:
+    """
+    在子行程中載入後端並量測 (由 ProcessPoolExecutor 呼叫)
+    
+    Returns:
+        載入時間、記憶體增量、單篇延遲分位數、批次吞吐量與 AUC
+    """
+    from utils.feature_extractor import FeatureExtractor
+    from utils.lm_backends import backend_from_spec
+    
+    rss_before = _rss_mb()
+    start = time.perf_counter()
+    extractor = FeatureExtractor(backend=backend_from_spec(spec))
+    load_seconds = time.perf_counter() - start
+    rss_after = _rss_mb()
+    
+    # 暖機
+    extractor.compute_perplexity(texts[0])
+    
+    latencies = []
+    for text in texts:
+        start = time.perf_counter()
+        extractor.compute_perplexity(text)
+        latencies.append((time.perf_counter() - start) * 1000)
+    
+    start = time.perf_counter()
+    pp_results = extractor.compute_perplexity_batch(texts, batch_size=batch_size)
+    batch_seconds = time.perf_counter() - start
+    
+    features = [{f'pp_{k}': v for k, v in (result or {}).items()} for result in pp_results]
+    valid = [i for i, f in enumerate(features) if f]
+    
+    return {
+        'backend': spec,
+        'model_id': extractor.model_id,
+        'load_seconds': load_seconds,
+        'rss_increase_mb': rss_after - rss_before,
+        'peak_rss_mb': _rss_mb(),
+        'latency_p50_ms': float(np.percentile(latencies, 50)),
+        'latency_p95_ms': float(np.percentile(latencies, 95)),
+        'batch_texts_per_second': len(texts) / batch_seconds if batch_seconds > 0 else float('inf'),
+        **_detection_auc([features[i] for i in valid], np.array([labels[i] for i in valid])),
+    }
+
+
+def build_report(args) -> List[Dict]:
+    """每個後端在獨立的 spawn 子行程中量測"""
+    corpus = load_labelled_corpus(args.dataset, args.limit)
+    texts = [item['text'] for item in corpus]
+    labels = [int(item['label']) for item in corpus]
+    print(f"Corpus: {len(texts)} texts ({sum(labels)} AI)", file=sys.stderr)
+    
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for spec in args.backends:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context,
+                                 initializer=_stdout_to_stderr if args.json else None) as pool:
+            try:
+                results.append(pool.submit(benchmark_backend, spec, texts, labels, args.batch_size).result())
+            except Exception as e:
+                results.append({'backend': spec, 'error': str(e)})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare latency, memory and AUC of perplexity backends")
+    parser.add_argument('backends', nargs='*', default=['transformers:distilgpt2'],
+                        help="backend specs, e.g. transformers:distilgpt2 onnx:DIR ngram:FILE.arpa")
+    parser.add_argument('--dataset', default=None, help="labelled dataset (default: built-in samples)")
+    parser.add_argument('--limit', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    args = parser.parse_args()
+    
+    # --json 時把進度訊息導向 stderr，stdout 只有 JSON
+    with contextlib.redirect_stdout(sys.stderr if args.json else sys.stdout):
+        results = build_report(args)
+    
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    
+    print("=" * 104)
+    print(f"{'Backend':<34}{'Load (s)':>9}{'RSS +MB':>9}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'Batch/s':>10}{'AUC lp':>9}{'AUC cv':>9}")
+    print("-" * 104)
+    for result in results:
+        if 'error' in result:
+            print(f"{result['backend']:<34}failed: {result['error']}")
+            continue
+        cv_auc = f"{result['cv_logistic_auc']:.3f}" if 'cv_logistic_auc' in result else '-'
+        print(f"{result['backend']:<34}{result['load_seconds']:>9.2f}{result['rss_increase_mb']:>9.1f}"
+              f"{result['latency_p50_ms']:>9.2f}{result['latency_p95_ms']:>9.2f}"
+              f"{result['batch_texts_per_second']:>10.1f}{result['log_prob_mean_auc']:>9.3f}{cv_auc:>9}")
+    print("=" * 104)
+
+
+if __name__ == "__main__":
+    main()
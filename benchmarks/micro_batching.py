@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+微批次基準測試 - 多個執行緒同時呼叫 compute_perplexity 時，比較逐篇與微批次的吞吐量
+
+同一個行程內先以逐篇前向傳播量測，再以 MicroBatcher 包住同一個後端量測，
+並檢查兩者的困惑度特徵是否一致。
+
+用法:
+    python benchmarks/micro_batching.py
+    python benchmarks/micro_batching.py --clients 16 --max-wait-ms 2 5 10 --max-batch-tokens 4096
+"""
+
+import argparse
+import contextlib
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from utils.data_manager import load_dataset, HUMAN_SAMPLES, AI_SAMPLES
+from utils.feature_extractor import FeatureExtractor
+from utils.micro_batcher import MicroBatcher
+
+
+def load_corpus(dataset_path: str = None, limit: int = None) -> List[str]:
+    """載入測試語料 (未指定數據集時使用內建範例)"""
+    if dataset_path:
+        texts = [item['text'] for item in load_dataset(dataset_path)]
+    else:
+        texts = list(HUMAN_SAMPLES) + list(AI_SAMPLES)
+    return texts[:limit] if limit else texts
+
+
+def run_clients(extractor: FeatureExtractor, texts: List[str], clients: int, rounds: int) -> Dict:
+    """
+    以 clients 個執行緒同時送出單篇請求
+    
+    Returns:
+        {'texts_per_second', 'latency_p50_ms', 'latency_p95_ms', 'results'}
+    """
+    workload = texts * rounds
+    latencies = []
+    
+    def score(text):
+        start = time.perf_counter()
+        result = extractor.compute_perplexity(text)
+        latencies.append((time.perf_counter() - start) * 1000)
+        return result
+    
+    # 暖機
+    extractor.compute_perplexity(texts[0])
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(score, workload))
+    seconds = time.perf_counter() - start
+    
+    return {
+        'texts_per_second': len(workload) / seconds,
+        'latency_p50_ms': float(np.percentile(latencies, 50)),
+        'latency_p95_ms': float(np.percentile(latencies, 95)),
+        'results': results[:len(texts)],
+    }
+
+
+def max_feature_diff(baseline: List[Dict], candidate: List[Dict]) -> float:
+    """兩組困惑度結果的最大相對差"""
+    worst = 0.0
+    for base, cand in zip(baseline, candidate):
+        for name, value in base.items():
+            worst = max(worst, abs(cand[name] - value) / max(abs(value), 1e-12))
+    return worst
+
+
+def build_report(args) -> List[Dict]:
+    """依序量測逐篇與各 max_wait_ms 的微批次吞吐量"""
+    texts = load_corpus(args.dataset, args.limit)
+    print(f"Corpus: {len(texts)} texts, {args.clients} clients, {args.rounds} rounds", file=sys.stderr)
+    
+    extractor = FeatureExtractor(model_name=args.model)
+    backend = extractor.backend
+    
+    baseline = run_clients(extractor, texts, args.clients, args.rounds)
+    report = [{
+        'mode': 'per-request',
+        'texts_per_second': baseline['texts_per_second'],
+        'latency_p50_ms': baseline['latency_p50_ms'],
+        'latency_p95_ms': baseline['latency_p95_ms'],
+    }]
+    
+    for max_wait_ms in args.max_wait_ms:
+        batcher = MicroBatcher(backend, max_wait_ms=max_wait_ms, max_batch_tokens=args.max_batch_tokens)
+        extractor.backend = batcher
+        result = run_clients(extractor, texts, args.clients, args.rounds)
+        batcher.close()
+        report.append({
+            'mode': f"micro-batch {max_wait_ms:g} ms",
+            'texts_per_second': result['texts_per_second'],
+            'latency_p50_ms': result['latency_p50_ms'],
+            'latency_p95_ms': result['latency_p95_ms'],
+            'mean_batch_size': batcher.stats()['mean_batch_size'],
+            'max_rel_diff': max_feature_diff(baseline['results'], result['results']),
+        })
+    extractor.backend = backend
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-request and micro-batched perplexity under concurrency")
+    parser.add_argument('--model', default='distilgpt2')
+    parser.add_argument('--dataset', default=None, help="corpus (default: built-in samples)")
+    parser.add_argument('--limit', type=int, default=None)
+    parser.add_argument('--clients', type=int, default=8, help="concurrent client threads")
+    parser.add_argument('--rounds', type=int, default=3, help="passes over the corpus")
+    parser.add_argument('--max-wait-ms', type=float, nargs='+', default=[2.0, 5.0, 10.0])
+    parser.add_argument('--max-batch-tokens', type=int, default=4096)
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    args = parser.parse_args()
+    
+    # --json 時把進度訊息 (含模型載入的輸出) 導向 stderr，stdout 只有 JSON
+    with contextlib.redirect_stdout(sys.stderr if args.json else sys.stdout):
+        report = build_report(args)
+    
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    
+    print("=" * 86)
+    print(f"{'Mode':<22}{'Texts/s':>10}{'Speedup':>9}{'p50 ms':>9}{'p95 ms':>9}{'Batch':>8}{'Max rel Δ':>12}")
+    print("-" * 86)
+    for row in report:
+        speedup = row['texts_per_second'] / report[0]['texts_per_second']
+        batch = f"{row['mean_batch_size']:.1f}" if 'mean_batch_size' in row else '1'
+        diff = f"{row['max_rel_diff']:.2e}" if 'max_rel_diff' in row else '-'
+        print(f"{row['mode']:<22}{row['texts_per_second']:>10.1f}{speedup:>8.2f}x"
+              f"{row['latency_p50_ms']:>9.1f}{row['latency_p95_ms']:>9.1f}{batch:>8}{diff:>12}")
+    print("=" * 86)
+
+
+if __name__ == "__main__":
+    main()
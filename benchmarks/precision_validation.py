@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+推論精度驗證 - 比較 bf16 / int8 模式與 fp32 基準的困惑度特徵、分類機率與速度
+
+用法:
+    python benchmarks/precision_validation.py
+    python benchmarks/precision_validation.py --dataset data/training_data_en.csv --limit 200
+    python benchmarks/precision_validation.py --precision int8 --json
+"""
+
+import argparse
+import contextlib
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from utils.data_manager import load_dataset, HUMAN_SAMPLES, AI_SAMPLES
+from utils.feature_extractor import FeatureExtractor
+from models.ai_detector import AIDetector
+
+
+def load_corpus(dataset_path: str = None, limit: int = None) -> List[str]:
+    """
+    載入參考語料 (未指定數據集時使用內建的人類 / AI 範例)
+    
+    Args:
+        dataset_path: 數據集路徑
+        limit: 最多使用的文本數
+    
+    Returns:
+        文本列表
+    """
+    if dataset_path:
+        texts = [item['text'] for item in load_dataset(dataset_path)]
+    else:
+        texts = list(HUMAN_SAMPLES) + list(AI_SAMPLES)
+    return texts[:limit] if limit else texts
+
+
+def run_extractor(extractor: FeatureExtractor, texts: List[str], batch_size: int) -> Dict:
+    """
+    計算全部特徵，並單獨量測困惑度模型的耗時
+    
+    Returns:
+        {'features': 特徵字典列表, 'perplexity_seconds': 秒, 'tokens_per_second': 吞吐量}
+    """
+    # 先跑一次暖機，排除第一次前向傳播的配置成本
+    extractor.compute_perplexity_batch(texts[:batch_size], batch_size=batch_size)
+    
+    start = time.perf_counter()
+    pp_results = extractor.compute_perplexity_batch(texts, batch_size=batch_size)
+    perplexity_seconds = time.perf_counter() - start
+    
+    num_tokens = sum(result['num_tokens'] for result in pp_results if result)
+    features = extractor.extract_all_features_batch(texts, batch_size=batch_size)
+    return {
+        'features': features,
+        'perplexity_seconds': perplexity_seconds,
+        'tokens_per_second': num_tokens / perplexity_seconds if perplexity_seconds > 0 else float('inf'),
+    }
+
+
+def feature_drift(baseline: List[Dict], candidate: List[Dict]) -> Dict[str, Dict]:
+    """
+    各 pp_ 特徵相對 fp32 的偏差
+    
+    Returns:
+        {特徵名: {'mean_abs': 平均絕對差, 'max_abs': 最大絕對差, 'max_rel': 最大相對差}}
+    """
+    names = sorted({name for features in baseline for name in features if name.startswith('pp_')})
+    drift = {}
+    for name in names:
+        pairs = [
+            (base[name], cand[name]) for base, cand in zip(baseline, candidate)
+            if name in base and name in cand
+        ]
+        if not pairs:
+            continue
+        base_values = np.array([b for b, _ in pairs], dtype=np.float64)
+        cand_values = np.array([c for _, c in pairs], dtype=np.float64)
+        abs_diff = np.abs(cand_values - base_values)
+        rel_diff = abs_diff / np.maximum(np.abs(base_values), 1e-12)
+        drift[name] = {
+            'mean_abs': float(abs_diff.mean()),
+            'max_abs': float(abs_diff.max()),
+            'max_rel': float(rel_diff.max()),
+        }
+    return drift
+
+
+def probability_drift(detector: AIDetector, baseline: List[Dict], candidate: List[Dict]) -> Dict:
+    """
+    以同一個已訓練分類器比較兩組特徵的預測
+    
+    Returns:
+        {'mean_abs': 平均機率差, 'max_abs': 最大機率差, 'label_agreement': 標籤一致率}
+    """
+    base_results = detector._classify(baseline)
+    cand_results = detector._classify(candidate)
+    base_probs = np.array([r['ai_probability'] for r in base_results])
+    cand_probs = np.array([r['ai_probability'] for r in cand_results])
+    agreement = np.mean([b['prediction'] == c['prediction'] for b, c in zip(base_results, cand_results)])
+    return {
+        'mean_abs': float(np.abs(cand_probs - base_probs).mean()),
+        'max_abs': float(np.abs(cand_probs - base_probs).max()),
+        'label_agreement': float(agreement),
+    }
+
+
+def build_report(args) -> Dict:
+    """
+    量測 fp32 基準與各低精度模式
+    
+    Returns:
+        {'fp32': {...}, '<precision>': {'tokens_per_second', 'speedup', 'feature_drift', 'probability_drift'}}
+    """
+    texts = load_corpus(args.dataset, args.limit)
+    print(f"Reference corpus: {len(texts)} texts", file=sys.stderr)
+    
+    baseline_extractor = FeatureExtractor(model_name=args.model, precision='fp32')
+    baseline = run_extractor(baseline_extractor, texts, args.batch_size)
+    
+    detector = None
+    if Path(args.classifier).exists():
+        detector = AIDetector(model_path=args.classifier, feature_extractor=baseline_extractor)
+    else:
+        print(f"Classifier {args.classifier} not found, skipping probability comparison", file=sys.stderr)
+    
+    report = {'fp32': {'tokens_per_second': baseline['tokens_per_second']}}
+    for precision in args.precision:
+        try:
+            extractor = FeatureExtractor(model_name=args.model, precision=precision)
+        except (ValueError, RuntimeError) as e:
+            print(f"Skipping {precision}: {e}", file=sys.stderr)
+            continue
+        candidate = run_extractor(extractor, texts, args.batch_size)
+        report[precision] = {
+            'tokens_per_second': candidate['tokens_per_second'],
+            'speedup': baseline['perplexity_seconds'] / candidate['perplexity_seconds'],
+            'feature_drift': feature_drift(baseline['features'], candidate['features']),
+        }
+        if detector is not None:
+            report[precision]['probability_drift'] = probability_drift(
+                detector, baseline['features'], candidate['features']
+            )
+    
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare reduced-precision inference against fp32")
+    parser.add_argument('--precision', nargs='+', default=['bf16', 'int8'], choices=['bf16', 'int8'])
+    parser.add_argument('--model', default='distilgpt2')
+    parser.add_argument('--dataset', default=None, help="reference corpus (default: built-in samples)")
+    parser.add_argument('--limit', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--classifier', default='models/ai_detector_model.pkl')
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    args = parser.parse_args()
+    
+    # --json 時把進度訊息 (含模型載入、特徵提取的輸出) 導向 stderr，stdout 只有 JSON
+    with contextlib.redirect_stdout(sys.stderr if args.json else sys.stdout):
+        report = build_report(args)
+    
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    
+    print("=" * 72)
+    print(f"fp32 baseline: {report['fp32']['tokens_per_second']:.0f} tokens/s")
+    for precision, result in report.items():
+        if precision == 'fp32':
+            continue
+        print("-" * 72)
+        print(f"{precision}: {result['tokens_per_second']:.0f} tokens/s ({result['speedup']:.2f}x)")
+        print(f"  {'Feature':<26}{'Mean |Δ|':>12}{'Max |Δ|':>12}{'Max rel':>12}")
+        for name, drift in result['feature_drift'].items():
+            print(f"  {name:<26}{drift['mean_abs']:>12.4g}{drift['max_abs']:>12.4g}{drift['max_rel']:>12.2%}")
+        if 'probability_drift' in result:
+            prob = result['probability_drift']
+            print(f"  AI probability: mean |Δ| {prob['mean_abs']:.4f}, max |Δ| {prob['max_abs']:.4f}, "
+                  f"label agreement {prob['label_agreement']:.1%}")
+    print("=" * 72)
+
+
+if __name__ == "__main__":
+    main()
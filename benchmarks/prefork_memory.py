@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+pre-fork 記憶體基準測試 - 量測共用權重的工作行程池每個工作行程的記憶體成本
+
+父行程載入語言模型與分類器後 fork 出 N 個工作行程，跑完一輪推論後回報
+各行程的 RSS、PSS 與 private 記憶體，並與「每個行程各自載入一份模型」的估計值比較。
+
+用法:
+    python benchmarks/prefork_memory.py --workers 8
+    python benchmarks/prefork_memory.py --workers 4 8 16 --classifier models/ai_detector_model.pkl
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from utils.data_manager import HUMAN_SAMPLES, AI_SAMPLES
+from utils.prefork import PreforkWorkerPool, process_memory
+
+
+def _stdout_to_stderr():
+    """子行程初始化：--json 時子行程 (及其 fork 出的工作行程) 的輸出也導向 stderr"""
+    sys.stdout = sys.stderr
+
+
+def measure(model: str, classifier: str, n_workers: int, texts: List[str]) -> Dict:
+    """
+    在子行程中建立工作行程池並量測 (每個工作行程數都從乾淨的父行程開始)
+    
+    Returns:
+        父行程與各工作行程的記憶體、吞吐量
+    """
+    from utils.feature_extractor import FeatureExtractor
+    from models.ai_detector import AIDetector
+    
+    baseline = process_memory()
+    detector = AIDetector(model_path=classifier, feature_extractor=FeatureExtractor(model_name=model))
+    loaded = process_memory()
+    
+    with PreforkWorkerPool(detector, n_workers=n_workers) as pool:
+        start = time.perf_counter()
+        pool.predict(texts)
+        seconds = time.perf_counter() - start
+        report = pool.memory_report()
+    
+    workers = report['workers']
+    model_mb = loaded['rss_mb'] - baseline['rss_mb']
+    return {
+        'workers': n_workers,
+        'texts_per_second': len(texts) / seconds,
+        'parent_rss_mb': loaded['rss_mb'],
+        'model_mb': model_mb,
+        'worker_rss_mb': [w['rss_mb'] for w in workers],
+        'worker_private_mb': [w['private_mb'] for w in workers],
+        'total_pss_mb': report.get('total_pss_mb'),
+        # 沒有共用時：每個工作行程都要有父行程那麼大
+        'independent_estimate_mb': loaded['rss_mb'] * (n_workers + 1),
+    }
+
+
+def build_report(args) -> List[Dict]:
+    """每個工作行程數在獨立的 spawn 子行程中量測"""
+    texts = (list(HUMAN_SAMPLES) + list(AI_SAMPLES)) * args.rounds
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for n_workers in args.workers:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context,
+                                 initializer=_stdout_to_stderr if args.json else None) as pool:
+            results.append(pool.submit(measure, args.model, args.classifier, n_workers, texts).result())
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure per-worker memory of the pre-fork worker pool")
+    parser.add_argument('--model', default='distilgpt2')
+    parser.add_argument('--classifier', default='models/ai_detector_model.pkl')
+    parser.add_argument('--workers', type=int, nargs='+', default=[4, 8])
+    parser.add_argument('--rounds', type=int, default=2, help="passes over the built-in samples")
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    args = parser.parse_args()
+    
+    # --json 時把進度訊息 (含模型載入的輸出) 導向 stderr，stdout 只有 JSON
+    with contextlib.redirect_stdout(sys.stderr if args.json else sys.stdout):
+        results = build_report(args)
+    
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    
+    print("=" * 86)
+    print(f"{'Workers':>8}{'Texts/s':>10}{'Parent MB':>11}{'Worker RSS':>12}{'Worker priv':>13}"
+          f"{'Total PSS':>11}{'No sharing':>12}")
+    print("-" * 86)
+    for r in results:
+        mean_rss = sum(r['worker_rss_mb']) / len(r['worker_rss_mb'])
+        mean_private = sum(r['worker_private_mb']) / len(r['worker_private_mb'])
+        total_pss = f"{r['total_pss_mb']:.0f}" if r['total_pss_mb'] is not None else '-'
+        print(f"{r['workers']:>8}{r['texts_per_second']:>10.1f}{r['parent_rss_mb']:>11.0f}{mean_rss:>12.0f}"
+              f"{mean_private:>13.1f}{total_pss:>11}{r['independent_estimate_mb']:>12.0f}")
+    print("=" * 86)
+    print("Worker RSS counts shared pages; Worker priv is the real per-worker cost.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+啟動時間基準測試 - 量測各模組在全新直譯器中的匯入耗時
+
+每個模組都在獨立的子行程中匯入，避免彼此共用已載入的套件；
+同時列出匯入後被帶進來的重量級套件 (torch、transformers、nltk 等)，
+用來確認延遲匯入沒有被其他模組提前觸發。
+
+用法:
+    python benchmarks/startup_imports.py
+    python benchmarks/startup_imports.py --repeat 5 utils.feature_extractor
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# 預設量測的專案模組
+DEFAULT_MODULES = [
+    'utils.latency',
+    'utils.feature_cache',
+    'utils.feature_schema',
+    'utils.feature_store',
+    'utils.data_manager',
+    'utils.text_analysis',
+    'utils.heuristic_scorer',
+    'utils.model_registry',
+    'utils.feature_extractor',
+    'utils.xai_visualizer',
+    'models.ai_detector',
+]
+
+# 需要追蹤是否被匯入的重量級套件
+HEAVY_PACKAGES = ['torch', 'transformers', 'nltk', 'sklearn', 'matplotlib', 'seaborn', 'plotly']
+
+# 在子行程中執行：匯入模組並回報耗時與已載入的重量級套件
+_PROBE = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{'seconds': elapsed, 'heavy': heavy}}))
+"""
+
+
+def measure_import(module: str, repeat: int = 3) -> dict:
+    """
+    在全新的直譯器中匯入模組並量測耗時
+    
+    Args:
+        module: 模組名稱
+        repeat: 重複次數 (取中位數)
+    
+    Returns:
+        {'module', 'median_ms', 'min_ms', 'heavy'}；匯入失敗時含 'error'
+    """
+    code = _PROBE.format(root=str(PROJECT_ROOT), module=module, heavy=HEAVY_PACKAGES)
+    timings = []
+    heavy = []
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, '-c', code],
+            capture_output=True, text=True, cwd=PROJECT_ROOT,
+        )
+        if proc.returncode != 0:
+            error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'unknown error'
+            return {'module': module, 'error': error}
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        timings.append(result['seconds'] * 1000)
+        heavy = result['heavy']
+    
+    return {
+        'module': module,
+        'median_ms': statistics.median(timings),
+        'min_ms': min(timings),
+        'heavy': heavy,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold import time of project modules")
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES, help="modules to import")
+    parser.add_argument('--repeat', type=int, default=3, help="fresh interpreters per module")
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    args = parser.parse_args()
+    
+    results = [measure_import(module, args.repeat) for module in args.modules]
+    
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    
+    print("=" * 78)
+    print(f"{'Module':<28}{'Median (ms)':>12}{'Min (ms)':>10}  Heavy packages loaded")
+    print("-" * 78)
+    for result in results:
+        if 'error' in result:
+            print(f"{result['module']:<28}{'failed':>12}{'':>10}  {result['error']}")
+        else:
+            heavy = ', '.join(result['heavy']) or '-'
+            print(f"{result['module']:<28}{result['median_ms']:>12.1f}{result['min_ms']:>10.1f}  {heavy}")
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
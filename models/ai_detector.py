@@ -5,75 +5,113 @@ AI 偵測分類器模型
 import numpy as np
 import pickle
 import joblib
-from typing import Dict, Tuple
+from typing import Dict, List, Tuple
 from pathlib import Path
 
-from sklearn.linear_model import LogisticRegression
+from sklearn.linear_model import LogisticRegression, SGDClassifier
 from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, confusion_matrix, roc_auc_score
 
-from utils.feature_extractor import FeatureExtractor
-from utils.data_manager import load_dataset
+from utils.feature_extractor import FeatureExtractor, FEATURE_VERSION
+from utils.feature_schema import FeatureSchema
+from utils.feature_store import FeatureStore, text_hash, holdout_mask
+from utils.latency import LatencyBudget, stage
+from utils.data_manager import load_dataset, iter_dataset
 
 
 class AIDetector:
     """AI 文本偵測器"""
     
-    def __init__(self, model_path: str = None):
+    def __init__(self, model_path: str = None, feature_extractor: FeatureExtractor = None):
         """
         初始化偵測器
         
         Args:
             model_path: 預訓練模型路徑
+            feature_extractor: 共用的特徵提取器 (省略時新建，語言模型仍由登錄表共用)
         """
-        self.feature_extractor = FeatureExtractor()
+        self.feature_extractor = feature_extractor or FeatureExtractor()
         self.classifier = None
         self.scaler = StandardScaler()
+        self.schema = FeatureSchema()
         self.feature_names = None
+        self.top_features = []
         self.model_path = model_path
         
         if model_path and Path(model_path).exists():
             self.load_model(model_path)
     
-    def extract_features_batch(self, texts: list) -> np.ndarray:
+    def extract_features_batch(self, texts: list, batch_size: int = 8, n_workers: int = None) -> np.ndarray:
         """
         批量提取特徵
         
         Args:
             texts: 文本列表
-            
+            batch_size: 困惑度模型每批的文本數
+            n_workers: NLTK 特徵族的平行工作行程數 (None 表示循序)
+        
         Returns:
             特徵矩陣 (n_samples, n_features)
         """
-        feature_list = []
-        
-        for i, text in enumerate(texts):
-            print(f"Processing text {i+1}/{len(texts)}...")
-            features = self.feature_extractor.extract_all_features(text)
-            feature_list.append(features)
+        print(f"Processing {len(texts)} texts (batch size {batch_size})...")
+        feature_list = self.feature_extractor.extract_all_features_batch(
+            texts, batch_size=batch_size, n_workers=n_workers
+        )
         
-        # 轉換為 numpy 矩陣
+        # 依固定的特徵結構寫入預先配置的矩陣
         if not feature_list:
             return np.array([])
         
-        # 確保所有特徵鍵都存在
-        all_keys = set()
-        for feat_dict in feature_list:
-            all_keys.update(feat_dict.keys())
+        return self.schema.transform(feature_list)
+    
+    def build_feature_store(self, dataset_path: str, store_path: str, chunk_size: int = 1000,
+                            batch_size: int = 8, n_workers: int = None, rebuild: bool = False) -> FeatureStore:
+        """
+        取得數據集的特徵庫，必要時提取特徵並寫入
         
-        all_keys = sorted(list(all_keys))
-        self.feature_names = all_keys
+        若 store_path 已有由相同提取器、特徵版本與未變更的數據集產生的
+        特徵庫，直接以記憶體映射開啟；否則串流提取特徵並重新建立。
         
-        # 構建矩陣
-        X = np.zeros((len(feature_list), len(all_keys)))
-        for i, feat_dict in enumerate(feature_list):
-            for j, key in enumerate(all_keys):
-                X[i, j] = feat_dict.get(key, 0.0)
+        Args:
+            dataset_path: 數據集路徑
+            store_path: 特徵庫目錄
+            chunk_size: 每次提取的文本數
+            batch_size: 困惑度模型每批的文本數
+            n_workers: 特徵提取的平行工作行程數 (None 表示循序)
+            rebuild: 是否強制重新提取
         
-        return X
+        Returns:
+            FeatureStore
+        """
+        schema = FeatureSchema()
+        model_id = self.feature_extractor.model_id
+        
+        if not rebuild and FeatureStore.exists(store_path):
+            store = FeatureStore(store_path)
+            if store.is_compatible(schema.feature_names, model_id, FEATURE_VERSION, source=dataset_path):
+                print(f"Using feature store {store_path} ({len(store)} rows)")
+                return store
+            print(f"Feature store {store_path} is stale, rebuilding...")
+        
+        if dataset_path.endswith('.json'):
+            chunks = [[(d['text'], int(d['label'])) for d in load_dataset(dataset_path)]]
+        else:
+            chunks = iter_dataset(dataset_path, chunk_size=chunk_size)
+        
+        writer = FeatureStore.create(store_path, schema.feature_names, model_id, FEATURE_VERSION, source=dataset_path)
+        self.schema = schema
+        for chunk in chunks:
+            texts = [text for text, label in chunk]
+            X = self.extract_features_batch(texts, batch_size=batch_size, n_workers=n_workers)
+            writer.append(X, [label for text, label in chunk], [text_hash(text) for text in texts])
+        
+        store = writer.close()
+        print(f"Feature store written to {store_path} ({len(store)} rows)")
+        return store
     
-    def train(self, dataset_path: str, test_size: float = 0.2, random_state: int = 42):
+    def train(self, dataset_path: str, test_size: float = 0.2, random_state: int = 42, n_workers: int = None,
+              feature_store: str = None):
         """
         訓練偵測器
         
@@ -81,18 +119,29 @@ class AIDetector:
             dataset_path: 訓練數據集路徑 (CSV 或 JSON)
             test_size: 測試集比例
             random_state: 隨機種子
-            
+            n_workers: 特徵提取的平行工作行程數 (None 表示循序)
+            feature_store: 特徵庫目錄；提供時重用已提取的特徵，
+                只需重新擬合分類器
+        
         Returns:
             訓練結果字典
         """
-        print("Loading dataset...")
-        data = load_dataset(dataset_path)
-        
-        texts = [d['text'] for d in data]
-        labels = np.array([d['label'] for d in data])
-        
-        print(f"Extracting features from {len(texts)} texts...")
-        X = self.extract_features_batch(texts)
+        # 訓練時凍結特徵結構，預測時沿用相同的欄位順序
+        self.schema = FeatureSchema()
+        self.feature_names = self.schema.feature_names
+        
+        if feature_store:
+            store = self.build_feature_store(dataset_path, feature_store, n_workers=n_workers)
+            X, labels = store.X, np.asarray(store.y, dtype=int)
+        else:
+            print("Loading dataset...")
+            data = load_dataset(dataset_path)
+            
+            texts = [d['text'] for d in data]
+            labels = np.array([d['label'] for d in data])
+            
+            print(f"Extracting features from {len(texts)} texts...")
+            X = self.extract_features_batch(texts, n_workers=n_workers)
         
         # 分割訓練集和測試集
         X_train, X_test, y_train, y_test = train_test_split(
@@ -108,12 +157,23 @@ class AIDetector:
         print("Training classifier...")
         self.classifier = LogisticRegression(max_iter=1000, random_state=random_state)
         self.classifier.fit(X_train_scaled, y_train)
+        self._update_feature_importance()
         
         # 評估
         y_pred_train = self.classifier.predict(X_train_scaled)
         y_pred_test = self.classifier.predict(X_test_scaled)
         y_prob_test = self.classifier.predict_proba(X_test_scaled)[:, 1]
         
+        return self._report_results(y_train, y_pred_train, y_test, y_pred_test, y_prob_test)
+    
+    @staticmethod
+    def _report_results(y_train, y_pred_train, y_test, y_pred_test, y_prob_test) -> Dict:
+        """
+        計算並印出訓練結果
+        
+        Returns:
+            訓練結果字典
+        """
         results = {
             'train_accuracy': accuracy_score(y_train, y_pred_train),
             'test_accuracy': accuracy_score(y_test, y_pred_test),
@@ -133,53 +193,197 @@ class AIDetector:
         
         return results
     
-    def predict(self, text: str) -> Dict:
+    def train_incremental(self, dataset_path: str, feature_store: str, chunk_size: int = 1000,
+                          holdout_fraction: float = 0.2, epochs: int = 3, random_state: int = 42,
+                          batch_size: int = 8, n_workers: int = None):
+        """
+        Out-of-core 訓練偵測器
+        
+        數據集以區塊串流提取特徵並寫入特徵庫 (已存在且有效時直接重用)，
+        之後所有步驟都以記憶體映射的區塊進行，記憶體中最多只保留一個區塊。
+        標準化器以 partial_fit 累積統計量，分類器改用以 mini-batch SGD 訓練的
+        logistic regression，最後以保留的測試串流評估。訓練 / 測試的歸屬由
+        文本雜湊決定，重新執行時分割結果不變。
+        
+        Args:
+            dataset_path: 數據集路徑 (串流格式，見 iter_dataset)
+            feature_store: 特徵庫目錄
+            chunk_size: 每個區塊的文本數
+            holdout_fraction: 保留為測試集的比例
+            epochs: SGD 走訪訓練區塊的次數
+            random_state: 隨機種子
+            batch_size: 困惑度模型每批的文本數
+            n_workers: 特徵提取的平行工作行程數 (None 表示循序)
+        
+        Returns:
+            訓練結果字典
+        """
+        store = self.build_feature_store(
+            dataset_path, feature_store, chunk_size=chunk_size, batch_size=batch_size, n_workers=n_workers
+        )
+        
+        self.schema = FeatureSchema(store.feature_names)
+        self.feature_names = self.schema.feature_names
+        
+        def train_rows(hashes):
+            return np.flatnonzero(~holdout_mask(hashes, holdout_fraction))
+        
+        # 以 partial_fit 累積標準化統計量
+        self.scaler = StandardScaler()
+        for X, y, hashes in store.iter_chunks(chunk_size):
+            rows = train_rows(hashes)
+            if len(rows):
+                self.scaler.partial_fit(X[rows])
+        
+        if not hasattr(self.scaler, 'mean_'):
+            raise ValueError("Dataset too small to split into training and held-out streams")
+        
+        # 以 mini-batch SGD 走訪特徵庫中的訓練區塊
+        print("Training classifier...")
+        rng = np.random.RandomState(random_state)
+        chunk_starts = np.arange(0, len(store), chunk_size)
+        self.classifier = SGDClassifier(loss='log_loss', random_state=random_state)
+        for epoch in range(epochs):
+            for start in rng.permutation(chunk_starts):
+                end = start + chunk_size
+                rows = train_rows(store.hashes[start:end])
+                if not len(rows):
+                    continue
+                rng.shuffle(rows)
+                X = self.scaler.transform(store.X[start:end][rows])
+                self.classifier.partial_fit(X, store.y[start:end][rows], classes=[0, 1])
+            print(f"Epoch {epoch + 1}/{epochs} done")
+        self._update_feature_importance()
+        
+        # 評估：逐區塊預測訓練串流與保留的測試串流
+        streams = {False: ([], [], []), True: ([], [], [])}
+        for X, y, hashes in store.iter_chunks(chunk_size):
+            probabilities = self.classifier.predict_proba(self.scaler.transform(X))
+            predictions = self.classifier.classes_[np.argmax(probabilities, axis=1)]
+            is_holdout = holdout_mask(hashes, holdout_fraction)
+            for flag in (False, True):
+                rows = is_holdout == flag
+                y_true, y_pred, y_prob = streams[flag]
+                y_true.append(np.asarray(y[rows], dtype=int))
+                y_pred.append(predictions[rows])
+                y_prob.append(probabilities[rows, 1])
+        
+        y_train, y_pred_train, _ = (np.concatenate(part) for part in streams[False])
+        y_test, y_pred_test, y_prob_test = (np.concatenate(part) for part in streams[True])
+        if not len(y_test):
+            raise ValueError("Dataset too small to split into training and held-out streams")
+        
+        return self._report_results(y_train, y_pred_train, y_test, y_pred_test, y_prob_test)
+    
+    def _update_feature_importance(self, top_k: int = 10):
+        """
+        依模型係數排序特徵重要性
+        
+        係數在訓練後即固定，因此只在訓練或載入時計算一次，
+        所有預測結果共用同一份列表。
+        
+        Args:
+            top_k: 保留的特徵數
+        """
+        coefficients = self.classifier.coef_[0]
+        feature_importance = zip(self.feature_names, (float(c) for c in coefficients))
+        
+        # 排序：最重要的特徵優先
+        self.top_features = sorted(
+            feature_importance,
+            key=lambda x: abs(x[1]),
+            reverse=True
+        )[:top_k]
+    
+    def _classify(self, feature_list: List[Dict], skipped_features: List[str] = ()) -> List[Dict]:
+        """
+        對整個特徵矩陣一次完成標準化與分類
+        
+        Args:
+            feature_list: 特徵字典列表
+            skipped_features: 因延遲預算而沒有計算的特徵；以訓練集的平均值填補，
+                標準化後為 0，而不是 0 值標準化後很大的負 z 分數
+        
+        Returns:
+            預測結果字典列表
+        """
+        X = self.schema.transform(feature_list)
+        columns = [self.schema.index[name] for name in skipped_features if name in self.schema.index]
+        if columns:
+            X[:, columns] = self.scaler.mean_[columns]
+        X_scaled = self.scaler.transform(X)
+        
+        probabilities = self.classifier.predict_proba(X_scaled)
+        predictions = self.classifier.classes_[np.argmax(probabilities, axis=1)]
+        
+        return [
+            {
+                'prediction': int(prediction),
+                'ai_probability': float(probability[1]),
+                'human_probability': float(probability[0]),
+                'confidence': float(max(probability)),
+                'extracted_features': features_dict,
+                'top_features': self.top_features,  # (特徵名, 係數)，所有結果共用
+                'degraded': False,
+            }
+            for prediction, probability, features_dict in zip(predictions, probabilities, feature_list)
+        ]
+    
+    def predict(self, text: str, budget: LatencyBudget = None, return_token_scores: bool = False) -> Dict:
         """
         預測單個文本
         
         Args:
             text: 輸入文本
-            
+            budget: 延遲預算 (記錄各階段耗時，必要時降級特徵提取)
+            return_token_scores: 是否在結果中附上逐 token 分數 ('token_scores')，
+                與特徵來自同一次前向傳播
+        
         Returns:
-            預測結果字典，包含概率和特徵
+            預測結果字典，包含概率和特徵；特徵因延遲預算而降級時 'degraded' 為 True
         """
         if self.classifier is None:
             raise ValueError("Model not trained. Please train the model first.")
         
         # 提取特徵
-        features_dict = self.feature_extractor.extract_all_features(text)
+        if return_token_scores:
+            features_dict, token_scores = self.feature_extractor.extract_all_features(
+                text, budget=budget, return_token_scores=True
+            )
+        else:
+            features_dict = self.feature_extractor.extract_all_features(text, budget=budget)
+        
+        degraded = budget is not None and bool(budget.degradations)
+        with stage(budget, 'classification'):
+            result = self._classify([features_dict], budget.skipped_features if degraded else ())[0]
+        result['degraded'] = degraded
+        
+        if return_token_scores:
+            result['token_scores'] = token_scores
+        return result
+    
+    def predict_batch(self, texts: List[str], batch_size: int = 8) -> List[Dict]:
+        """
+        批量預測文本
+        
+        以批次前向傳播提取特徵，再對整個矩陣一次完成標準化與分類。
         
-        # 轉換為矩陣
-        feature_vector = np.zeros(len(self.feature_names))
-        for i, name in enumerate(self.feature_names):
-            feature_vector[i] = features_dict.get(name, 0.0)
+        Args:
+            texts: 文本列表
+            batch_size: 困惑度模型每批的文本數
         
-        # 標準化
-        feature_vector_scaled = self.scaler.transform([feature_vector])
+        Returns:
+            與 texts 順序對應的預測結果字典列表
+        """
+        if self.classifier is None:
+            raise ValueError("Model not trained. Please train the model first.")
         
-        # 預測
-        prediction = self.classifier.predict(feature_vector_scaled)[0]
-        probability = self.classifier.predict_proba(feature_vector_scaled)[0]
+        if not texts:
+            return []
         
-        # 獲取特徵重要性（基於模型係數）
-        coefficients = self.classifier.coef_[0]
-        feature_importance = dict(zip(self.feature_names, coefficients))
+        feature_list = self.feature_extractor.extract_all_features_batch(texts, batch_size=batch_size)
         
-        # 排序：最重要的特徵優先
-        top_features = sorted(
-            feature_importance.items(),
-            key=lambda x: abs(x[1]),
-            reverse=True
-        )[:10]
-        
-        return {
-            'prediction': int(prediction),
-            'ai_probability': float(probability[1]),
-            'human_probability': float(probability[0]),
-            'confidence': float(max(probability)),
-            'extracted_features': features_dict,
-            'top_features': top_features,  # (特徵名, 係數)
-        }
+        return self._classify(feature_list)
     
     def save_model(self, model_path: str):
         """
@@ -211,6 +415,8 @@ class AIDetector:
         self.classifier = model_data['classifier']
         self.scaler = model_data['scaler']
         self.feature_names = model_data['feature_names']
+        self.schema = FeatureSchema(self.feature_names)
+        self._update_feature_importance()
         
         print(f"Model loaded from {model_path}")
 
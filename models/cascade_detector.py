@@ -0,0 +1,414 @@
+"""
+提前結束的串接偵測器 - 先以不需語言模型的特徵快速分類，只有不確定時才計算困惑度
+
+第一段只計算 Burstiness、Stylometry、Zipf 特徵並以校準過的 logistic regression
+分類；快速模型的 AI 機率落在不確定區間 [low, high] 之外時直接回傳，
+否則沿用第一段的特徵，只補算困惑度，交給完整的 AIDetector 分類。
+"""
+
+import threading
+import numpy as np
+import joblib
+from typing import Dict, List, Sequence, Tuple
+from pathlib import Path
+
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import StandardScaler
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import accuracy_score, roc_auc_score, brier_score_loss
+
+from utils.feature_extractor import FeatureExtractor
+from utils.feature_schema import FeatureSchema, DEFAULT_FEATURE_NAMES
+from utils.latency import LatencyBudget, stage
+from utils.data_manager import load_dataset
+from models.ai_detector import AIDetector
+
+
+# 快速模型使用的特徵：全部不需語言模型的特徵族
+CHEAP_FEATURE_NAMES = [name for name in DEFAULT_FEATURE_NAMES if not name.startswith('pp_')]
+
+# 預設的不確定區間：快速模型的 AI 機率落在此區間內才呼叫語言模型
+DEFAULT_UNCERTAINTY_BAND = (0.15, 0.85)
+
+FAST_MODEL_PATH = "models/cascade_fast_model.pkl"
+
+
+class CascadeDetector:
+    """
+    兩段式 AI 文本偵測器
+    
+    與 AIDetector 提供相同的 predict / predict_batch 介面與結果格式，
+    結果另附 'cascade': {'stage': 'fast' 或 'full', 'fast_probability': ...}。
+    
+    用法:
+        cascade = CascadeDetector(AIDetector(model_path=...), model_path=FAST_MODEL_PATH)
+        result = cascade.predict(text)
+        print(cascade.stats())
+    """
+    
+    def __init__(self, detector: AIDetector, model_path: str = None,
+                 uncertainty_band: Tuple[float, float] = None):
+        """
+        Args:
+            detector: 完整的偵測器 (第二段；困惑度特徵由其特徵提取器計算)
+            model_path: 快速模型路徑
+            uncertainty_band: (low, high)；省略時使用快速模型保存的區間或預設值
+        """
+        self.detector = detector
+        self.fast_classifier = None
+        self.fast_scaler = StandardScaler()
+        self.fast_schema = FeatureSchema(CHEAP_FEATURE_NAMES)
+        self.fast_feature_names = None
+        self.fast_top_features = []
+        self.uncertainty_band = tuple(DEFAULT_UNCERTAINTY_BAND)
+        
+        if model_path and Path(model_path).exists():
+            self.load_fast_model(model_path)
+        if uncertainty_band is not None:
+            self.set_uncertainty_band(*uncertainty_band)
+        
+        self._stats_lock = threading.Lock()
+        self._total = 0
+        self._early_exits = 0
+    
+    # ===== 與 AIDetector 相容的屬性 (server.py / prefork.py 直接使用) =====
+    
+    @property
+    def feature_extractor(self) -> FeatureExtractor:
+        return self.detector.feature_extractor
+    
+    @property
+    def classifier(self):
+        return self.detector.classifier
+    
+    def set_uncertainty_band(self, low: float, high: float):
+        """設定不確定區間 (0 <= low <= high <= 1；low == high 時一律提前結束)"""
+        if not 0.0 <= low <= high <= 1.0:
+            raise ValueError(f"Invalid uncertainty band ({low}, {high}): need 0 <= low <= high <= 1")
+        self.uncertainty_band = (float(low), float(high))
+    
+    def is_uncertain(self, fast_probability: float) -> bool:
+        """快速模型的 AI 機率是否落在不確定區間內 (需要語言模型)"""
+        low, high = self.uncertainty_band
+        return low <= fast_probability <= high
+    
+    # ===== 快速模型訓練 =====
+    
+    def train_fast(self, dataset_path: str, test_size: float = 0.2, random_state: int = 42,
+                   feature_store: str = None) -> Dict:
+        """
+        訓練快速模型
+        
+        Args:
+            dataset_path: 訓練數據集路徑 (CSV 或 JSON)
+            test_size: 測試集比例
+            random_state: 隨機種子
+            feature_store: 特徵庫目錄；提供時直接取用其中的非困惑度欄位，
+                否則只計算不需語言模型的特徵 (不載入語言模型)
+        
+        Returns:
+            訓練結果字典
+        """
+        self.fast_feature_names = list(CHEAP_FEATURE_NAMES)
+        self.fast_schema = FeatureSchema(self.fast_feature_names)
+        
+        if feature_store:
+            store = self.detector.build_feature_store(dataset_path, feature_store)
+            columns = [store.feature_names.index(name) for name in self.fast_feature_names]
+            X, labels = np.asarray(store.X[:, columns]), np.asarray(store.y, dtype=int)
+        else:
+            print("Loading dataset...")
+            data = load_dataset(dataset_path)
+            labels = np.array([d['label'] for d in data], dtype=int)
+            
+            print(f"Extracting text features from {len(data)} texts...")
+            X = self.fast_schema.transform([FeatureExtractor.extract_text_features(d['text']) for d in data])
+        
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, labels, test_size=test_size, random_state=random_state, stratify=labels
+        )
+        
+        print("Scaling features...")
+        self.fast_scaler = StandardScaler()
+        X_train_scaled = self.fast_scaler.fit_transform(X_train)
+        X_test_scaled = self.fast_scaler.transform(X_test)
+        
+        # 以 sigmoid (Platt) 校準，讓機率可以直接與不確定區間比較
+        print("Training calibrated fast classifier...")
+        folds = int(min(5, np.bincount(y_train).min()))
+        if folds < 2:
+            raise ValueError("Need at least two training samples per class to calibrate the fast classifier")
+        self.fast_classifier = CalibratedClassifierCV(
+            LogisticRegression(max_iter=1000, random_state=random_state), method='sigmoid', cv=folds
+        )
+        self.fast_classifier.fit(X_train_scaled, y_train)
+        self._update_fast_feature_importance()
+        
+        y_prob_test = self.fast_classifier.predict_proba(X_test_scaled)[:, 1]
+        y_pred_test = self.fast_classifier.predict(X_test_scaled)
+        results = {
+            'train_accuracy': accuracy_score(y_train, self.fast_classifier.predict(X_train_scaled)),
+            'test_accuracy': accuracy_score(y_test, y_pred_test),
+            'test_roc_auc': roc_auc_score(y_test, y_prob_test),
+            'test_brier': brier_score_loss(y_test, y_prob_test),
+        }
+        
+        print("\n=== Fast Classifier Results ===")
+        for key, value in results.items():
+            print(f"{key}: {value:.4f}")
+        
+        return results
+    
+    def _update_fast_feature_importance(self, top_k: int = 10):
+        """以各校準折的 logistic regression 係數平均排序特徵重要性"""
+        coefficients = np.mean(
+            [calibrated.estimator.coef_[0] for calibrated in self.fast_classifier.calibrated_classifiers_],
+            axis=0,
+        )
+        self.fast_top_features = sorted(
+            zip(self.fast_feature_names, (float(c) for c in coefficients)),
+            key=lambda x: abs(x[1]),
+            reverse=True
+        )[:top_k]
+    
+    # ===== 預測 =====
+    
+    def _fast_probabilities(self, text_feature_list: List[Dict], skipped_features: List[str] = ()) -> np.ndarray:
+        """快速模型的 [human, AI] 機率矩陣 (skipped_features 以訓練集平均值填補，見 AIDetector._classify)"""
+        X = self.fast_schema.transform(text_feature_list)
+        columns = [self.fast_schema.index[name] for name in skipped_features if name in self.fast_schema.index]
+        if columns:
+            X[:, columns] = self.fast_scaler.mean_[columns]
+        X_scaled = self.fast_scaler.transform(X)
+        return self.fast_classifier.predict_proba(X_scaled)
+    
+    def _fast_result(self, probability: np.ndarray, text_features: Dict) -> Dict:
+        """以快速模型的機率組成與 AIDetector 相同格式的結果"""
+        return {
+            'prediction': int(self.fast_classifier.classes_[np.argmax(probability)]),
+            'ai_probability': float(probability[1]),
+            'human_probability': float(probability[0]),
+            'confidence': float(max(probability)),
+            'extracted_features': text_features,
+            'top_features': self.fast_top_features,
+            'degraded': False,
+            'cascade': {'stage': 'fast', 'fast_probability': float(probability[1])},
+        }
+    
+    def _record(self, total: int, early_exits: int):
+        with self._stats_lock:
+            self._total += total
+            self._early_exits += early_exits
+    
+    def predict(self, text: str, budget: LatencyBudget = None, return_token_scores: bool = False) -> Dict:
+        """
+        預測單個文本 (參數與回傳格式同 AIDetector.predict)
+        
+        提前結束時不會計算困惑度，return_token_scores 的 'token_scores' 為 None。
+        """
+        if self.fast_classifier is None:
+            raise ValueError("Fast model not trained. Please train the fast model first.")
+        if self.detector.classifier is None:
+            raise ValueError("Model not trained. Please train the model first.")
+        
+        extractor = self.detector.feature_extractor
+        text_features = extractor.extract_text_features(text, budget)
+        skipped_features = budget.skipped_features if budget is not None else ()
+        with stage(budget, 'fast_classification'):
+            probability = self._fast_probabilities([text_features], skipped_features)[0]
+        fast_probability = float(probability[1])
+        
+        if not self.is_uncertain(fast_probability):
+            self._record(1, 1)
+            result = self._fast_result(probability, text_features)
+            result['degraded'] = budget is not None and bool(budget.degradations)
+            if return_token_scores:
+                result['token_scores'] = None
+            return result
+        
+        self._record(1, 0)
+        if return_token_scores:
+            features_dict, token_scores = extractor.extract_all_features(
+                text, budget=budget, return_token_scores=True, text_features=text_features
+            )
+        else:
+            features_dict = extractor.extract_all_features(text, budget=budget, text_features=text_features)
+        
+        with stage(budget, 'classification'):
+            result = self.detector._classify([features_dict], budget.skipped_features if budget is not None else ())[0]
+        result['degraded'] = budget is not None and bool(budget.degradations)
+        result['cascade'] = {'stage': 'full', 'fast_probability': fast_probability}
+        
+        if return_token_scores:
+            result['token_scores'] = token_scores
+        return result
+    
+    def predict_batch(self, texts: List[str], batch_size: int = 8) -> List[Dict]:
+        """
+        批量預測文本
+        
+        先以快速模型分類全部文本，只有不確定的文本進入批次前向傳播。
+        
+        Args:
+            texts: 文本列表
+            batch_size: 困惑度模型每批的文本數
+        
+        Returns:
+            與 texts 順序對應的預測結果字典列表
+        """
+        if self.fast_classifier is None:
+            raise ValueError("Fast model not trained. Please train the fast model first.")
+        if self.detector.classifier is None:
+            raise ValueError("Model not trained. Please train the model first.")
+        
+        if not texts:
+            return []
+        
+        extractor = self.detector.feature_extractor
+        text_feature_list = [extractor.extract_text_features(text) for text in texts]
+        probabilities = self._fast_probabilities(text_feature_list)
+        
+        results = [None] * len(texts)
+        uncertain = []
+        for i, (probability, text_features) in enumerate(zip(probabilities, text_feature_list)):
+            if self.is_uncertain(float(probability[1])):
+                uncertain.append(i)
+            else:
+                results[i] = self._fast_result(probability, text_features)
+        self._record(len(texts), len(texts) - len(uncertain))
+        
+        if uncertain:
+            pp_results = extractor.compute_perplexity_batch([texts[i] for i in uncertain], batch_size=batch_size)
+            feature_list = [
+                extractor.extract_all_features(
+                    texts[i], perplexity_features=pp_features or {}, text_features=text_feature_list[i]
+                )
+                for i, pp_features in zip(uncertain, pp_results)
+            ]
+            for i, result in zip(uncertain, self.detector._classify(feature_list)):
+                result['cascade'] = {'stage': 'full', 'fast_probability': float(probabilities[i, 1])}
+                results[i] = result
+        
+        return results
+    
+    def stats(self) -> Dict:
+        """提前結束的比例統計"""
+        with self._stats_lock:
+            total, early_exits = self._total, self._early_exits
+        return {
+            'uncertainty_band': list(self.uncertainty_band),
+            'total': total,
+            'early_exits': early_exits,
+            'early_exit_rate': early_exits / total if total else 0.0,
+        }
+    
+    # ===== 評估 =====
+    
+    @staticmethod
+    def band_report(fast_probabilities: Sequence[float], full_probabilities: Sequence[float],
+                    labels: Sequence[int], low: float, high: float) -> Dict:
+        """
+        以已算好的兩段機率，估算某個不確定區間的提前結束比例與準確率代價
+        
+        Args:
+            fast_probabilities: 快速模型的 AI 機率
+            full_probabilities: 完整偵測器的 AI 機率
+            labels: 真實標籤 (1 = AI)
+            low / high: 不確定區間
+        
+        Returns:
+            {'low', 'high', 'early_exit_rate', 'cascade_accuracy', 'full_accuracy',
+             'fast_accuracy', 'accuracy_cost' (完整 - 串接), 'early_exit_accuracy'}
+        """
+        fast = np.asarray(fast_probabilities, dtype=float)
+        full = np.asarray(full_probabilities, dtype=float)
+        labels = np.asarray(labels, dtype=int)
+        
+        early_exit = (fast < low) | (fast > high)
+        # 與 argmax 相同：平手時判為人類
+        cascade_pred = np.where(early_exit, fast > 0.5, full > 0.5).astype(int)
+        full_accuracy = float(np.mean((full > 0.5) == labels))
+        cascade_accuracy = float(np.mean(cascade_pred == labels))
+        early_exit_accuracy = None
+        if early_exit.any():
+            early_exit_accuracy = float(np.mean(cascade_pred[early_exit] == labels[early_exit]))
+        
+        return {
+            'low': low,
+            'high': high,
+            'early_exit_rate': float(early_exit.mean()),
+            'cascade_accuracy': cascade_accuracy,
+            'full_accuracy': full_accuracy,
+            'fast_accuracy': float(np.mean((fast > 0.5) == labels)),
+            'accuracy_cost': full_accuracy - cascade_accuracy,
+            'early_exit_accuracy': early_exit_accuracy,
+        }
+    
+    def evaluate(self, texts: List[str], labels: Sequence[int],
+                 bands: List[Tuple[float, float]] = None, batch_size: int = 8) -> List[Dict]:
+        """
+        在有標籤的文本上量測各個不確定區間的提前結束比例與準確率代價
+        
+        兩段模型都只對每篇文本計算一次，再以 band_report 套用各個區間。
+        
+        Args:
+            texts: 文本列表
+            labels: 真實標籤
+            bands: 要比較的 (low, high) 列表 (預設為目前的區間)
+            batch_size: 困惑度模型每批的文本數
+        
+        Returns:
+            各區間的 band_report 結果
+        """
+        extractor = self.detector.feature_extractor
+        text_feature_list = [extractor.extract_text_features(text) for text in texts]
+        fast = self._fast_probabilities(text_feature_list)[:, 1]
+        
+        pp_results = extractor.compute_perplexity_batch(texts, batch_size=batch_size)
+        feature_list = [
+            extractor.extract_all_features(text, perplexity_features=pp_features or {}, text_features=text_features)
+            for text, pp_features, text_features in zip(texts, pp_results, text_feature_list)
+        ]
+        full = [result['ai_probability'] for result in self.detector._classify(feature_list)]
+        
+        return [self.band_report(fast, full, labels, low, high) for low, high in (bands or [self.uncertainty_band])]
+    
+    # ===== 保存 / 載入 =====
+    
+    def save_fast_model(self, model_path: str = FAST_MODEL_PATH):
+        """
+        保存快速模型 (含不確定區間)
+        
+        Args:
+            model_path: 模型保存路徑
+        """
+        Path(model_path).parent.mkdir(parents=True, exist_ok=True)
+        
+        model_data = {
+            'classifier': self.fast_classifier,
+            'scaler': self.fast_scaler,
+            'feature_names': self.fast_feature_names,
+            'uncertainty_band': self.uncertainty_band,
+        }
+        
+        joblib.dump(model_data, model_path)
+        print(f"Fast model saved to {model_path}")
+    
+    def load_fast_model(self, model_path: str = FAST_MODEL_PATH):
+        """
+        載入快速模型
+        
+        Args:
+            model_path: 模型路徑
+        """
+        model_data = joblib.load(model_path)
+        
+        self.fast_classifier = model_data['classifier']
+        self.fast_scaler = model_data['scaler']
+        self.fast_feature_names = model_data['feature_names']
+        self.fast_schema = FeatureSchema(self.fast_feature_names)
+        self.set_uncertainty_band(*model_data.get('uncertainty_band', DEFAULT_UNCERTAINTY_BAND))
+        self._update_fast_feature_importance()
+        
+        print(f"Fast model loaded from {model_path}")
@@ -4,6 +4,7 @@ Flask API 版本 - 提供 REST API 端點
 """
 
 from flask import Flask, request, jsonify, render_template_string
+import os
 import sys
 from pathlib import Path
 import json
@@ -13,6 +14,7 @@ sys.path.insert(0, str(Path(__file__).parent))
 
 from utils.feature_extractor import FeatureExtractor
 from models.ai_detector import AIDetector
+from utils.model_bundle import ModelBundle
 
 app = Flask(__name__)
 
@@ -25,12 +27,24 @@ def initialize():
     """初始化模型"""
     global detector, feature_extractor
     
-    try:
-        detector = AIDetector(model_path='models/ai_detector_model.pkl')
-    except:
-        detector = AIDetector()
+    # 設定 AI_DETECTOR_BUNDLE 時只從離線模型包載入，不連網
+    bundle_dir = os.environ.get('AI_DETECTOR_BUNDLE')
+    if bundle_dir:
+        bundle = ModelBundle(bundle_dir)
+        feature_extractor = bundle.create_feature_extractor()
+        if bundle.classifier_path is not None:
+            detector = bundle.create_detector(feature_extractor)
+        else:
+            detector = AIDetector(feature_extractor=feature_extractor)
+        return
     
+    # 偵測器與 API 共用同一個特徵提取器，語言模型只載入一次
     feature_extractor = FeatureExtractor()
+    
+    try:
+        detector = AIDetector(model_path='models/ai_detector_model.pkl', feature_extractor=feature_extractor)
+    except:
+        detector = AIDetector(feature_extractor=feature_extractor)
 
 
 # HTML 模板
@@ -320,18 +334,17 @@ def batch_predict():
         if not texts or not isinstance(texts, list):
             return jsonify({'error': 'texts must be a non-empty list'}), 400
         
-        results = []
-        for text in texts:
-            if detector and detector.classifier:
-                result = detector.predict(text)
-            else:
-                features = feature_extractor.extract_all_features(text)
-                result = {
+        if detector and detector.classifier:
+            results = detector.predict_batch(texts)
+        else:
+            results = [
+                {
                     'prediction': None,
                     'ai_probability': None,
                     'extracted_features': features,
                 }
-            results.append(result)
+                for features in feature_extractor.extract_all_features_batch(texts)
+            ]
         
         return jsonify({
             'total': len(results),
@@ -0,0 +1,580 @@
+#!/usr/bin/env python3
+"""
+非同步推論服務 - 取代 oldversion/flask_api.py 的 ASGI REST API
+
+模型推論在有上限的執行緒池中執行，事件迴圈只負責收發請求，
+因此慢的請求不會卡住健康檢查或其他連線。同時進行 (執行中 + 排隊) 的請求
+超過上限時立即回應 429，而不是無限制地堆積；收到關閉訊號後停止接受新請求，
+等待進行中的推論完成再結束。
+
+端點:
+    GET  /health     服務狀態、佇列長度與統計
+    POST /predict    {"text": "...", "budget_ms": 500}  → 預測結果
+    POST /features   {"text": "..."}                    → 特徵
+    POST /batch      {"texts": ["...", "..."]}           → 批量預測
+    (舊版 Flask API 的 /api/... 路徑同樣可用)
+
+用法:
+    uvicorn server:app --host 0.0.0.0 --port 8000
+    python server.py --port 8000 --workers 2 --max-queue 32
+    python server.py --port 8000 --processes 8 --workers 1    # pre-fork：8 個行程共用一份模型權重
+
+環境變數:
+    AI_DETECTOR_BUNDLE / AI_DETECTOR_PRECISION / AI_DETECTOR_LM_BACKEND   同 app.py
+    AI_DETECTOR_WORKERS       推論執行緒數 (預設 2)
+    AI_DETECTOR_TORCH_THREADS 每個推論執行緒分到的 torch intra-op 執行緒數 (預設 CPU 核心數 / 推論執行緒數)
+    AI_DETECTOR_MAX_QUEUE     執行緒都忙碌時最多排隊的請求數 (預設 16)
+    AI_DETECTOR_TIMEOUT       單一請求的等待上限秒數 (預設 30)
+    AI_DETECTOR_BUDGET_MS     未指定 budget_ms 時的預設延遲預算 (預設不限)
+    AI_DETECTOR_MICRO_BATCH_MS    設定時合併各執行緒的困惑度前向傳播，值為最長等待毫秒數
+    AI_DETECTOR_MICRO_BATCH_TOKENS    微批次補齊後的 token 數上限 (預設 4096)
+    AI_DETECTOR_CASCADE_MODEL 設定時啟用串接偵測：快速模型 (models/cascade_detector.py) 有把握時不呼叫語言模型
+    AI_DETECTOR_CASCADE_BAND  呼叫語言模型的不確定區間 low:high (預設為快速模型保存的區間)
+
+pre-fork 模式 (--processes N) 由父行程載入模型與分類器後 fork 出 N 個服務行程，
+共用同一個監聽 socket；權重分頁以 copy-on-write 共用 (見 utils/prefork.py)，
+各行程的 /health 回報自己的 RSS / PSS / private 記憶體。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+# 添加專案路徑
+sys.path.insert(0, str(Path(__file__).parent))
+
+from utils.latency import LatencyBudget
+from utils.prefork import prepare_for_fork, process_memory, reinitialize_after_fork
+
+MODEL_PATH = "models/ai_detector_model.pkl"
+
+# 請求內容上限，避免單一請求占用過多記憶體或推論時間
+MAX_BODY_BYTES = 2 * 1024 * 1024
+MAX_TEXT_CHARS = 100_000
+MAX_BATCH_SIZE = 64
+
+
+class HTTPError(Exception):
+    """以指定的 HTTP 狀態碼回應的錯誤"""
+    
+    def __init__(self, status: int, message: str, headers: List[Tuple[bytes, bytes]] = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or []
+
+
+def load_detector():
+    """
+    依環境變數載入偵測器 (與 app.py 相同的設定)
+    
+    Returns:
+        AIDetector；沒有已訓練的分類器時為未訓練的 AIDetector (只提供特徵)，
+        設定 AI_DETECTOR_CASCADE_MODEL 時為包住它的 CascadeDetector
+    """
+    from utils.feature_cache import FeatureCache
+    from utils.feature_extractor import FeatureExtractor
+    from utils.lm_backends import backend_from_spec
+    from utils.model_bundle import ModelBundle
+    from utils.text_analysis import get_pos_tagger
+    from models.ai_detector import AIDetector
+    
+    precision = os.environ.get('AI_DETECTOR_PRECISION', 'fp32')
+    lm_backend = os.environ.get('AI_DETECTOR_LM_BACKEND')
+    bundle_dir = os.environ.get('AI_DETECTOR_BUNDLE')
+    cache = FeatureCache(max_entries=512, db_path='data/feature_cache.sqlite')
+    
+    # 設定 AI_DETECTOR_BUNDLE 時只從離線模型包載入，不連網
+    bundle = ModelBundle(bundle_dir) if bundle_dir else None
+    if bundle is not None:
+        extractor = bundle.create_feature_extractor(cache=cache, precision=precision)
+    elif lm_backend:
+        extractor = FeatureExtractor(cache=cache, backend=backend_from_spec(lm_backend, precision=precision))
+    else:
+        extractor = FeatureExtractor(cache=cache, precision=precision)
+    get_pos_tagger()
+    
+    micro_batch_ms = os.environ.get('AI_DETECTOR_MICRO_BATCH_MS')
+    if micro_batch_ms:
+        extractor.enable_micro_batching(
+            max_wait_ms=float(micro_batch_ms),
+            max_batch_tokens=int(os.environ.get('AI_DETECTOR_MICRO_BATCH_TOKENS', 4096)),
+        )
+    
+    detector = None
+    if bundle is not None:
+        if bundle.classifier_path is not None:
+            detector = bundle.create_detector(extractor)
+    elif Path(MODEL_PATH).exists():
+        try:
+            detector = AIDetector(model_path=MODEL_PATH, feature_extractor=extractor)
+        except Exception as e:
+            print(f"Warning: failed to load model from {MODEL_PATH}: {e}")
+    if detector is None:
+        return AIDetector(feature_extractor=extractor)
+    
+    # 設定 AI_DETECTOR_CASCADE_MODEL 時先以不需語言模型的快速模型分類
+    cascade_model = os.environ.get('AI_DETECTOR_CASCADE_MODEL')
+    if cascade_model:
+        from models.cascade_detector import CascadeDetector
+        
+        band = os.environ.get('AI_DETECTOR_CASCADE_BAND')
+        cascade = CascadeDetector(
+            detector, model_path=cascade_model,
+            uncertainty_band=tuple(float(v) for v in band.split(':')) if band else None,
+        )
+        if cascade.fast_classifier is not None:
+            return cascade
+        print(f"Warning: cascade fast model not found at {cascade_model}, using the full detector")
+    return detector
+
+
+class InferenceService:
+    """
+    推論服務：持有偵測器與有上限的執行緒池，並負責准入控制
+    
+    同時進行的請求數 (執行中 + 排隊) 上限為 workers + max_queue，超過時拒絕 (429)。
+    逾時的請求仍會占用名額直到背景推論真正結束，避免逾時後的工作繼續堆積。
+    """
+    
+    def __init__(self, workers: int = 2, max_queue: int = 16, request_timeout: float = 30.0,
+                 default_budget_ms: float = None, drain_timeout: float = 30.0,
+                 loader: Callable = load_detector, torch_threads: int = None):
+        """
+        初始化服務 (不載入模型；模型在 start() 中載入)
+        
+        Args:
+            workers: 推論執行緒數
+            max_queue: 執行緒都忙碌時最多排隊的請求數
+            request_timeout: 單一請求的等待上限 (秒)，逾時回應 504
+            default_budget_ms: 請求未指定 budget_ms 時使用的延遲預算
+            drain_timeout: 關閉時等待進行中推論的上限 (秒)
+            loader: 載入偵測器的函式
+            torch_threads: 每個推論執行緒分到的 torch intra-op 執行緒數；
+                None 表示 CPU 核心數 / workers，0 表示不調整 (使用 torch 預設)
+        """
+        self.workers = workers
+        self.max_queue = max_queue
+        self.request_timeout = request_timeout
+        self.default_budget_ms = default_budget_ms
+        self.drain_timeout = drain_timeout
+        self.loader = loader
+        self.torch_threads = torch_threads
+        
+        self.detector = None
+        self.state = 'stopped'
+        self._executor = None
+        self._pending = 0
+        self._idle = None
+        self.stats = {'completed': 0, 'rejected': 0, 'timeouts': 0, 'errors': 0}
+    
+    @classmethod
+    def from_env(cls) -> 'InferenceService':
+        """以 AI_DETECTOR_* 環境變數建立服務"""
+        budget_ms = os.environ.get('AI_DETECTOR_BUDGET_MS')
+        torch_threads = os.environ.get('AI_DETECTOR_TORCH_THREADS')
+        return cls(
+            workers=int(os.environ.get('AI_DETECTOR_WORKERS', 2)),
+            max_queue=int(os.environ.get('AI_DETECTOR_MAX_QUEUE', 16)),
+            request_timeout=float(os.environ.get('AI_DETECTOR_TIMEOUT', 30)),
+            default_budget_ms=float(budget_ms) if budget_ms else None,
+            torch_threads=int(torch_threads) if torch_threads else None,
+        )
+    
+    @property
+    def capacity(self) -> int:
+        """同時進行的請求上限"""
+        return self.workers + self.max_queue
+    
+    async def start(self):
+        """建立執行緒池並在池中載入模型 (由 lifespan 啟動階段等待，載入完成前伺服器不接受連線)"""
+        self.state = 'loading'
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='inference')
+        loop = asyncio.get_running_loop()
+        self.detector = await loop.run_in_executor(self._executor, self.loader)
+        
+        # 推論執行緒各自呼叫 torch，讓 (執行緒數 × intra-op 執行緒數) 不超過核心數
+        threads = self.torch_threads
+        if threads is None:
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+        if threads and 'torch' in sys.modules:
+            from utils.model_registry import configure_torch_threads
+            configure_torch_threads(intra_op=threads)
+        
+        self.state = 'ready'
+        print(f"Inference service ready ({self.workers} workers, queue {self.max_queue})")
+    
+    async def shutdown(self):
+        """停止接受新請求，等待進行中的推論完成後關閉執行緒池"""
+        if self._executor is None:
+            return
+        self.state = 'draining'
+        if self._pending:
+            print(f"Draining {self._pending} in-flight requests...")
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout=self.drain_timeout)
+            except asyncio.TimeoutError:
+                print(f"Warning: {self._pending} requests still running after {self.drain_timeout}s")
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        self.state = 'stopped'
+    
+    def _release(self, _future):
+        """背景推論結束時釋放名額"""
+        self._pending -= 1
+        if self._pending == 0:
+            self._idle.set()
+    
+    async def run(self, fn: Callable, *args):
+        """
+        在執行緒池中執行推論
+        
+        Raises:
+            HTTPError: 服務未就緒 (503)、已滿載 (429) 或逾時 (504)
+        """
+        if self.state != 'ready':
+            raise HTTPError(503, f"Service is {self.state}")
+        if self._pending >= self.capacity:
+            self.stats['rejected'] += 1
+            raise HTTPError(429, "Server is busy, retry later", [(b'retry-after', b'1')])
+        
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, fn, *args)
+        self._pending += 1
+        self._idle.clear()
+        future.add_done_callback(self._release)
+        
+        try:
+            # shield: 客戶端斷線或逾時不會讓名額提前釋放
+            result = await asyncio.wait_for(asyncio.shield(future), timeout=self.request_timeout)
+        except asyncio.TimeoutError:
+            self.stats['timeouts'] += 1
+            raise HTTPError(504, f"Inference did not finish within {self.request_timeout}s")
+        except Exception as e:
+            self.stats['errors'] += 1
+            raise HTTPError(500, str(e))
+        
+        self.stats['completed'] += 1
+        return result
+    
+    def health(self) -> Dict:
+        """服務狀態"""
+        detector = self.detector
+        health = {
+            'status': self.state,
+            'model_loaded': detector is not None and detector.classifier is not None,
+            'workers': self.workers,
+            'in_flight': self._pending,
+            'capacity': self.capacity,
+            **self.stats,
+        }
+        backend = detector.feature_extractor.backend if detector is not None else None
+        if hasattr(backend, 'stats'):
+            health['micro_batching'] = backend.stats()
+        if hasattr(detector, 'uncertainty_band'):
+            health['cascade'] = detector.stats()
+        health['memory'] = process_memory()
+        return health
+    
+    # ===== 在執行緒池中執行的推論函式 =====
+    
+    def predict(self, text: str, budget_ms: float = None) -> Dict:
+        """預測單個文本；沒有已訓練的分類器時只回傳特徵"""
+        budget = LatencyBudget(budget_ms=budget_ms)
+        if self.detector.classifier is not None:
+            result = self.detector.predict(text, budget=budget)
+        else:
+            result = {
+                'prediction': None,
+                'ai_probability': None,
+                'human_probability': None,
+                'confidence': None,
+                'extracted_features': self.detector.feature_extractor.extract_all_features(text, budget=budget),
+            }
+        result['latency'] = budget.report()
+        return result
+    
+    def features(self, text: str, budget_ms: float = None) -> Dict:
+        """只提取特徵"""
+        budget = LatencyBudget(budget_ms=budget_ms)
+        features = self.detector.feature_extractor.extract_all_features(text, budget=budget)
+        return {'features': features, 'num_features': len(features), 'latency': budget.report()}
+    
+    def batch(self, texts: List[str]) -> Dict:
+        """批量預測"""
+        if self.detector.classifier is not None:
+            results = self.detector.predict_batch(texts)
+        else:
+            results = [
+                {'prediction': None, 'ai_probability': None, 'extracted_features': features}
+                for features in self.detector.feature_extractor.extract_all_features_batch(texts)
+            ]
+        return {'total': len(results), 'results': results}
+
+
+def _json_default(value):
+    """將 numpy 型別轉成 JSON 可序列化的值"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _validate_text(text) -> str:
+    """檢查單篇文本"""
+    if not isinstance(text, str) or not text.strip():
+        raise HTTPError(400, "Text cannot be empty")
+    if len(text) > MAX_TEXT_CHARS:
+        raise HTTPError(413, f"Text exceeds {MAX_TEXT_CHARS} characters")
+    return text
+
+
+class InferenceApp:
+    """ASGI 應用：路由、請求解析與 lifespan (啟動時載入模型、關閉時排空請求)"""
+    
+    def __init__(self, service: InferenceService):
+        self.service = service
+        self.routes = {
+            ('GET', '/health'): self.handle_health,
+            ('POST', '/predict'): self.handle_predict,
+            ('POST', '/features'): self.handle_features,
+            ('POST', '/batch'): self.handle_batch,
+        }
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+    
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.service.start()
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.service.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    
+    async def _http(self, scope, receive, send):
+        start = time.perf_counter()
+        path = scope['path']
+        # 相容舊版 Flask API 的 /api/... 路徑
+        if path.startswith('/api/'):
+            path = path[len('/api'):]
+        
+        try:
+            handler = self.routes.get((scope['method'], path.rstrip('/') or '/'))
+            if handler is None:
+                raise HTTPError(404, "Endpoint not found")
+            status, payload = await handler(await self._read_body(receive))
+            headers = []
+        except HTTPError as e:
+            status, payload, headers = e.status, {'error': e.message}, e.headers
+        
+        body = json.dumps(payload, default=_json_default, ensure_ascii=False).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', b'application/json; charset=utf-8'),
+                (b'content-length', str(len(body)).encode()),
+                (b'x-process-time-ms', f"{(time.perf_counter() - start) * 1000:.1f}".encode()),
+                *headers,
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+    
+    @staticmethod
+    async def _read_body(receive) -> bytes:
+        """讀取請求內容 (超過 MAX_BODY_BYTES 時回應 413)"""
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                raise HTTPError(499, "Client disconnected")
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > MAX_BODY_BYTES:
+                raise HTTPError(413, f"Request body exceeds {MAX_BODY_BYTES} bytes")
+            chunks.append(chunk)
+            if not message.get('more_body', False):
+                return b''.join(chunks)
+    
+    @staticmethod
+    def _parse_json(body: bytes) -> Dict:
+        try:
+            data = json.loads(body or b'{}')
+        except ValueError:
+            raise HTTPError(400, "Request body must be valid JSON")
+        if not isinstance(data, dict):
+            raise HTTPError(400, "Request body must be a JSON object")
+        return data
+    
+    def _budget_ms(self, data: Dict) -> float:
+        budget_ms = data.get('budget_ms', self.service.default_budget_ms)
+        if budget_ms is not None and (not isinstance(budget_ms, (int, float)) or budget_ms <= 0):
+            raise HTTPError(400, "budget_ms must be a positive number")
+        return budget_ms
+    
+    async def handle_health(self, body: bytes):
+        health = self.service.health()
+        return (200 if health['status'] == 'ready' else 503), health
+    
+    async def handle_predict(self, body: bytes):
+        data = self._parse_json(body)
+        text = _validate_text(data.get('text'))
+        return 200, await self.service.run(self.service.predict, text, self._budget_ms(data))
+    
+    async def handle_features(self, body: bytes):
+        data = self._parse_json(body)
+        text = _validate_text(data.get('text'))
+        return 200, await self.service.run(self.service.features, text, self._budget_ms(data))
+    
+    async def handle_batch(self, body: bytes):
+        data = self._parse_json(body)
+        texts = data.get('texts')
+        if not texts or not isinstance(texts, list):
+            raise HTTPError(400, "texts must be a non-empty list")
+        if len(texts) > MAX_BATCH_SIZE:
+            raise HTTPError(413, f"At most {MAX_BATCH_SIZE} texts per batch")
+        texts = [_validate_text(text) for text in texts]
+        return 200, await self.service.run(self.service.batch, texts)
+
+
+app = InferenceApp(InferenceService.from_env())
+
+
+def serve_prefork(service: InferenceService, host: str, port: int, processes: int, drain_timeout: float):
+    """
+    pre-fork 模式：父行程載入模型後 fork 出 processes 個服務行程，共用監聽 socket
+    
+    父行程只負責監看：服務行程意外結束時重新 fork 一個；收到 SIGTERM / SIGINT 時
+    轉送給所有服務行程，由各自的 uvicorn 排空請求後結束。
+    
+    Args:
+        service: 服務設定的範本 (每個服務行程各自建立一個同設定的 InferenceService)
+        host / port: 監聽位址
+        processes: 服務行程數
+        drain_timeout: 關閉時等待進行中請求的秒數
+    """
+    import uvicorn
+    
+    detector = load_detector()
+    prepare_for_fork(detector)
+    print(f"Parent {os.getpid()} loaded models: {process_memory()['rss_mb']} MB RSS")
+    
+    # 讓 (行程數 × 推論執行緒數 × intra-op 執行緒數) 不超過核心數
+    torch_threads = service.torch_threads
+    if torch_threads is None:
+        torch_threads = max(1, (os.cpu_count() or 1) // (processes * service.workers))
+    
+    sock = socket.create_server((host, port), backlog=2048)
+    sock.set_inheritable(True)
+    children = {}
+    stopping = False
+    
+    def start_child(index: int):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            reinitialize_after_fork(detector)
+            child_service = InferenceService(
+                workers=service.workers, max_queue=service.max_queue,
+                request_timeout=service.request_timeout, default_budget_ms=service.default_budget_ms,
+                drain_timeout=drain_timeout, loader=lambda: detector, torch_threads=torch_threads,
+            )
+            config = uvicorn.Config(InferenceApp(child_service), timeout_graceful_shutdown=int(drain_timeout))
+            uvicorn.Server(config).run(sockets=[sock])
+            os._exit(0)
+        children[pid] = index
+    
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+    
+    for index in range(processes):
+        start_child(index)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print(f"Serving on http://{host}:{port} with {processes} pre-forked processes: {sorted(children)}")
+    
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = children.pop(pid, None)
+        if index is not None and not stopping:
+            print(f"Warning: worker {pid} exited with status {status}, restarting")
+            # 避免啟動即失敗的服務行程被無限快速重啟
+            time.sleep(1)
+            start_child(index)
+    sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Asynchronous AI detection inference server")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=None, help="inference threads (AI_DETECTOR_WORKERS)")
+    parser.add_argument('--max-queue', type=int, default=None, help="queued requests before 429 (AI_DETECTOR_MAX_QUEUE)")
+    parser.add_argument('--timeout', type=float, default=None, help="per-request timeout in seconds")
+    parser.add_argument('--torch-threads', type=int, default=None, help="torch intra-op threads per inference thread")
+    parser.add_argument('--drain-timeout', type=float, default=30.0, help="seconds to wait for in-flight requests on shutdown")
+    parser.add_argument('--processes', type=int, default=1,
+                        help="pre-forked server processes sharing one copy of the model weights")
+    args = parser.parse_args()
+    
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit("server.py requires uvicorn (pip install uvicorn)")
+    
+    service = app.service
+    if args.workers is not None:
+        service.workers = args.workers
+    if args.max_queue is not None:
+        service.max_queue = args.max_queue
+    if args.timeout is not None:
+        service.request_timeout = args.timeout
+    if args.torch_threads is not None:
+        service.torch_threads = args.torch_threads
+    service.drain_timeout = args.drain_timeout
+    
+    if args.processes > 1:
+        serve_prefork(service, args.host, args.port, args.processes, args.drain_timeout)
+        return
+    
+    # uvicorn 收到 SIGTERM / SIGINT 後先停止接受連線、等待進行中的請求，再觸發 lifespan shutdown
+    uvicorn.run(app, host=args.host, port=args.port, timeout_graceful_shutdown=int(args.drain_timeout))
+
+
+if __name__ == "__main__":
+    main()
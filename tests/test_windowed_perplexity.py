@@ -0,0 +1,66 @@
+"""
+滑動視窗困惑度的回歸測試 - 以不需下載模型的假後端比對視窗化與整段計分的結果
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.feature_extractor import FeatureExtractor
+from utils.lm_backends import LanguageModelBackend
+
+
+class StubBackend(LanguageModelBackend):
+    """每個 token 的分數只取決於它與前一個 token，與視窗起點無關"""
+    
+    max_positions = 1024
+    
+    def encode(self, text):
+        return [ord(c) for c in text]
+    
+    def decode_tokens(self, ids):
+        return [chr(i) for i in ids]
+    
+    def token_log_probs(self, input_ids, attention_mask=None):
+        ids = np.asarray(input_ids, dtype=np.float32)
+        return -(ids[:, 1:] / 100 + ids[:, :-1] / 10000)
+    
+    @property
+    def model_id(self):
+        return 'stub'
+    
+    def config(self):
+        return {}
+
+
+TEXT = "The quick brown fox jumps over the lazy dog. " * 4
+
+
+@pytest.mark.parametrize('window_overlap', [0, 1, None])
+def test_windowed_log_probs_match_unwindowed(window_overlap):
+    extractor = FeatureExtractor(backend=StubBackend(), window_size=16, window_overlap=window_overlap)
+    input_ids = np.asarray([extractor.backend.encode(TEXT)], dtype=np.int64)
+    
+    expected = extractor.backend.token_log_probs(input_ids)[0]
+    windowed = extractor._windowed_token_log_probs(input_ids, extractor.window_size, extractor.window_overlap)
+    
+    np.testing.assert_allclose(windowed, expected, rtol=1e-6)
+
+
+def test_windowed_perplexity_features_match_unwindowed():
+    extractor = FeatureExtractor(backend=StubBackend(), window_size=16, window_overlap=0)
+    
+    windowed = extractor.compute_perplexity(TEXT)
+    unwindowed = extractor.compute_perplexity(TEXT, window_size=len(TEXT))
+    
+    for name, value in unwindowed.items():
+        assert windowed[name] == pytest.approx(value, rel=1e-6)
+
+
+def test_window_size_must_leave_room_for_context():
+    with pytest.raises(ValueError):
+        FeatureExtractor(backend=StubBackend(), window_size=1, window_overlap=0)
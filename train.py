@@ -11,6 +11,7 @@ sys.path.insert(0, str(Path(__file__).parent))
 
 from utils.data_manager import create_dataset, create_json_dataset
 from models.ai_detector import AIDetector
+from models.cascade_detector import CascadeDetector, FAST_MODEL_PATH
 
 
 def main():
@@ -21,10 +22,14 @@ def main():
     # Step 1: 建立訓練數據集
     print("\n[Step 1] Creating training datasets...")
     
+    # 已存在的數據集不重新產生，特徵庫得以沿用而不必重跑語言模型
     try:
-        create_dataset('data/training_data_en.csv', language='english')
-        create_json_dataset('data/training_data_en.json', language='english')
-        print("✓ English dataset created successfully")
+        if Path('data/training_data_en.csv').exists():
+            print("✓ English dataset already exists, reusing it")
+        else:
+            create_dataset('data/training_data_en.csv', language='english')
+            create_json_dataset('data/training_data_en.json', language='english')
+            print("✓ English dataset created successfully")
     except Exception as e:
         print(f"✗ Error creating English dataset: {e}")
         return
@@ -45,7 +50,8 @@ def main():
         results = detector.train(
             dataset_path='data/training_data_en.csv',
             test_size=0.2,
-            random_state=42
+            random_state=42,
+            feature_store='data/features_en',
         )
         
         print("\n" + "=" * 60)
@@ -78,8 +84,25 @@ def main():
         print(f"✗ Error saving model: {e}")
         return
     
-    # Step 4: 測試模型
-    print("\n[Step 4] Testing model on sample texts...")
+    # Step 4: 訓練串接偵測的快速模型 (沿用同一個特徵庫，不需重新提取特徵)
+    print("\n[Step 4] Training early-exit cascade fast model...")
+    
+    cascade = CascadeDetector(detector)
+    try:
+        fast_results = cascade.train_fast(
+            dataset_path='data/training_data_en.csv',
+            test_size=0.2,
+            random_state=42,
+            feature_store='data/features_en',
+        )
+        cascade.save_fast_model(FAST_MODEL_PATH)
+        print(f"✓ Fast model saved to {FAST_MODEL_PATH} "
+              f"(test accuracy {fast_results['test_accuracy']:.4f}, Brier {fast_results['test_brier']:.4f})")
+    except Exception as e:
+        print(f"✗ Error training fast model: {e}")
+    
+    # Step 5: 測試模型
+    print("\n[Step 5] Testing model on sample texts...")
     
     test_samples = [
         ("This is a paragraph about artificial intelligence. "
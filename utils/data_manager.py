@@ -4,8 +4,10 @@
 
 import json
 import csv
+import gzip
+import io
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Iterator, Tuple, TextIO
 
 # 真實 Human 文本樣本
 HUMAN_SAMPLES = [
@@ -128,6 +130,113 @@ def create_json_dataset(output_path: str = 'data/training_data.json', language:
     print(f"JSON dataset created: {output_path}")
 
 
+def _open_text(dataset_path: str) -> TextIO:
+    """
+    以文字模式開啟 (可能經過壓縮的) 數據集檔案
+    
+    Args:
+        dataset_path: 檔案路徑，支援 .gz 與 .zst 壓縮
+        
+    Returns:
+        UTF-8 文字串流
+    """
+    if dataset_path.endswith('.gz'):
+        return gzip.open(dataset_path, 'rt', encoding='utf-8', newline='')
+    
+    if dataset_path.endswith('.zst'):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("Reading .zst datasets requires the 'zstandard' package (pip install zstandard)")
+        raw = open(dataset_path, 'rb')
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        return io.TextIOWrapper(reader, encoding='utf-8', newline='')
+    
+    return open(dataset_path, 'r', encoding='utf-8', newline='')
+
+
+def _iter_records(dataset_path: str) -> Iterator[Tuple[int, Dict]]:
+    """
+    逐筆讀取原始紀錄
+    
+    Args:
+        dataset_path: 數據集路徑 (.csv / .jsonl / .ndjson，可加 .gz 或 .zst)
+        
+    Yields:
+        (行號, 紀錄)；JSON Lines 無法解析的行其紀錄為 None
+    """
+    base_path = dataset_path
+    for suffix in ('.gz', '.zst'):
+        if base_path.endswith(suffix):
+            base_path = base_path[:-len(suffix)]
+    
+    with _open_text(dataset_path) as f:
+        if base_path.endswith('.csv'):
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+        elif base_path.endswith(('.jsonl', '.ndjson')):
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except json.JSONDecodeError:
+                    yield line_number, None
+        else:
+            raise ValueError(f"Unsupported dataset format for streaming: {dataset_path}")
+
+
+def iter_dataset(dataset_path: str, chunk_size: int = 1000, skip_malformed: bool = True,
+                 errors: List = None) -> Iterator[List[Tuple[str, int]]]:
+    """
+    以固定大小的區塊串流讀取數據集
+    
+    不會把整個檔案載入記憶體，適合數 GB 的語料。
+    
+    Args:
+        dataset_path: 數據集路徑 (.csv / .jsonl / .ndjson，可加 .gz 或 .zst)
+        chunk_size: 每個區塊的紀錄數
+        skip_malformed: 是否略過格式錯誤的紀錄 (False 時直接拋出 ValueError)
+        errors: 若提供，略過的紀錄以 (行號, 原因) 附加到此列表
+        
+    Yields:
+        [(text, label), ...] 區塊，最後一個區塊可能不足 chunk_size
+    """
+    chunk = []
+    skipped = 0
+    
+    for line_number, record in _iter_records(dataset_path):
+        try:
+            if not isinstance(record, dict):
+                raise ValueError("not a valid record")
+            text = record.get('text')
+            if not isinstance(text, str) or not text.strip():
+                raise ValueError("missing text")
+            label = int(record['label'])
+            if label not in (0, 1):
+                raise ValueError(f"label must be 0 or 1, got {label}")
+        except (KeyError, TypeError, ValueError) as e:
+            reason = f"missing field {e}" if isinstance(e, KeyError) else str(e)
+            if not skip_malformed:
+                raise ValueError(f"{dataset_path}:{line_number}: {reason}")
+            skipped += 1
+            if errors is not None:
+                errors.append((line_number, reason))
+            continue
+        
+        chunk.append((text, label))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    
+    if chunk:
+        yield chunk
+    
+    if skipped:
+        print(f"Warning: Skipped {skipped} malformed rows in {dataset_path}")
+
+
 def load_dataset(dataset_path: str) -> List[Dict]:
     """
     載入數據集
@@ -141,6 +250,7 @@ def load_dataset(dataset_path: str) -> List[Dict]:
     data = []
     
     if dataset_path.endswith('.csv'):
+        # 未壓縮的 CSV 維持原本的行為：不檢查文本與標籤內容
         with open(dataset_path, 'r', encoding='utf-8') as f:
             reader = csv.DictReader(f)
             for row in reader:
@@ -155,6 +265,10 @@ def load_dataset(dataset_path: str) -> List[Dict]:
                 data = raw_data.get('human', []) + raw_data.get('ai', [])
             else:
                 data = raw_data
+    elif dataset_path.endswith(('.jsonl', '.ndjson', '.gz', '.zst')):
+        # 串流格式以 iter_dataset 嚴格讀取，格式錯誤的紀錄直接拋出 ValueError
+        for chunk in iter_dataset(dataset_path, skip_malformed=False):
+            data.extend({'text': text, 'label': label} for text, label in chunk)
     
     return data
 
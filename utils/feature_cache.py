@@ -0,0 +1,152 @@
+"""
+特徵快取模組 - 以內容雜湊為鍵的 LRU 記憶體快取，可選 SQLite 磁碟持久化
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+
+class FeatureCache:
+    """
+    特徵快取
+    
+    鍵為「正規化文本 + 模型名稱 + 特徵版本」的 SHA-256，因此同一段文本
+    不論經由哪個入口重複送入，都只需計算一次。記憶體層為有上限的 LRU；
+    若指定 db_path，另有 SQLite 磁碟層讓快取在重啟後仍然有效。
+    所有操作皆以鎖保護，可由多個執行緒共用。
+    """
+    
+    def __init__(self, max_entries: int = 1024, db_path: str = None):
+        """
+        初始化快取
+        
+        Args:
+            max_entries: 記憶體層最多保留的筆數
+            db_path: SQLite 檔案路徑 (None 表示只用記憶體)
+        """
+        self.max_entries = max_entries
+        self.db_path = db_path
+        
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        
+        if db_path:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS features ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.commit()
+    
+    @staticmethod
+    def make_key(text: str, model_name: str, version: str) -> str:
+        """
+        計算快取鍵
+        
+        Args:
+            text: 輸入文本 (以 Unicode NFC 正規化後雜湊)
+            model_name: 特徵提取器的模型識別 (含影響結果的設定)
+            version: 特徵版本，特徵定義改變時遞增即可使舊快取失效
+            
+        Returns:
+            十六進位的 SHA-256 字串
+        """
+        normalized = unicodedata.normalize('NFC', text)
+        payload = '\0'.join([version, model_name, normalized])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def get(self, key: str, count: bool = True) -> Optional[Dict]:
+        """
+        查詢快取
+        
+        Args:
+            key: 快取鍵
+            count: 是否計入命中統計 (附屬資料的查詢傳 False，避免重複計算同一篇文本)
+            
+        Returns:
+            特徵字典的副本；未命中時為 None
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += count
+                return dict(self._memory[key])
+            
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value FROM features WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    features = json.loads(row[0])
+                    self._remember(key, features)
+                    self.hits += count
+                    self.disk_hits += count
+                    return dict(features)
+            
+            self.misses += count
+            return None
+    
+    def put(self, key: str, features: Dict):
+        """
+        寫入快取
+        
+        Args:
+            key: 快取鍵
+            features: 特徵字典
+        """
+        with self._lock:
+            self._remember(key, dict(features))
+            
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO features (key, value, created) VALUES (?, ?, ?)",
+                    (key, json.dumps(features), time.time()),
+                )
+                self._db.commit()
+    
+    def _remember(self, key: str, features: Dict):
+        """寫入記憶體層並淘汰最久未使用的項目 (呼叫者需持有鎖)"""
+        self._memory[key] = features
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+    
+    def clear(self):
+        """清空記憶體層與磁碟層"""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM features")
+                self._db.commit()
+    
+    def stats(self) -> Dict:
+        """
+        取得快取統計
+        
+        Returns:
+            包含命中、未命中次數與命中率的字典
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups > 0 else 0.0,
+                'memory_entries': len(self._memory),
+                'max_entries': self.max_entries,
+                'persistent': self._db is not None,
+            }
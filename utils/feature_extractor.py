@@ -3,110 +3,281 @@
 """
 
 import numpy as np
+import base64
 import re
 from typing import Dict, List, Tuple
-from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import sys
+import threading
+import time
 import warnings
 warnings.filterwarnings('ignore')
 
-import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
-import nltk
-from nltk import sent_tokenize, word_tokenize, pos_tag
-from nltk.corpus import stopwords
+from utils.text_analysis import AnalyzedDocument, ensure_nltk_resources
+from utils.feature_cache import FeatureCache
+from utils.lm_backends import LanguageModelBackend, TransformersBackend
+from utils.feature_schema import FEATURE_FAMILIES
+from utils.latency import LatencyBudget, stage
 
-# 下載必要的 NLTK 資源
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    nltk.download('punkt')
-try:
-    nltk.data.find('taggers/averaged_perceptron_tagger')
-except LookupError:
-    nltk.download('averaged_perceptron_tagger')
-try:
-    nltk.data.find('corpora/stopwords')
-except LookupError:
-    nltk.download('stopwords')
+# torch 與 nltk 的匯入 (以及 NLTK 資源檢查) 延後到第一次建立 FeatureExtractor 時，
+# 只匯入本模組 (例如讀取 FEATURE_VERSION) 不會載入深度學習框架
+
+# 特徵定義 (名稱或計算方式) 改變時需遞增，使舊的快取項目失效
+FEATURE_VERSION = "1.1"
+
+# 各特徵族的名稱前綴
+FEATURE_PREFIXES = tuple(FEATURE_FAMILIES)
+
+# 需要詞性標註的特徵 (延遲預算不足時略過)
+POS_FEATURE_NAMES = ('style_pronoun_ratio', 'style_noun_ratio', 'style_num_pos_tags')
+
+
+def pack_token_scores(token_scores: Dict) -> Dict:
+    """將逐 token 分數轉成可寫入特徵快取的 JSON 格式 (log prob 以 float32 位元組 base64 編碼)"""
+    return {
+        'tokens': [str(token) for token in token_scores['tokens']],
+        'log_probs': base64.b64encode(np.ascontiguousarray(token_scores['log_probs'], dtype=np.float32)).decode('ascii'),
+    }
+
+
+def unpack_token_scores(packed: Dict) -> Dict:
+    """pack_token_scores 的反向轉換"""
+    return {
+        'tokens': np.array(packed['tokens'], dtype=str),
+        'log_probs': np.frombuffer(base64.b64decode(packed['log_probs']), dtype=np.float32).copy(),
+    }
 
 
 class FeatureExtractor:
-    """提取 AI 偵測所需的各項特徵"""
+    """
+    提取 AI 偵測所需的各項特徵
     
-    def __init__(self, model_name: str = "distilgpt2"):
+    執行緒安全：同一個實例的 extract_all_features / compute_perplexity 可由多個
+    執行緒同時呼叫 (例如推論服務的執行緒池)。實例建立後只有以下可變狀態：
+    tokenizer (評分後端以鎖保護)、特徵快取 (自帶鎖) 與每 token 耗時估計
+    (以 _rate_lock 保護)；語言模型以 no_grad 推論、NLTK 標註器唯讀，皆可並行。
+    多執行緒時應以 utils.model_registry.configure_torch_threads 限制 torch 的
+    intra-op 執行緒數，並可用 enable_micro_batching() 合併同時送出的前向傳播；
+    效果見 benchmarks/concurrency.py。
+    """
+    
+    def __init__(self, model_name: str = "distilgpt2", window_size: int = None, window_overlap: int = None,
+                 cache: FeatureCache = None, local_files_only: bool = False, precision: str = 'fp32',
+                 backend: LanguageModelBackend = None):
         """
         初始化特徵提取器
         
         Args:
             model_name: 使用的語言模型名稱 (預設 distilgpt2 以減少計算量)
+            window_size: 滑動視窗的 token 數 (預設為模型的上下文長度)
+            window_overlap: 相鄰視窗重疊的 token 數 (預設為視窗的 1/4)
+            cache: 特徵快取 (None 表示不快取)
+            local_files_only: 只從本地檔案載入模型 (離線模型包使用)
+            precision: 語言模型推論精度；'bf16' 或 'int8' (僅 CPU) 以少量特徵偏差換取速度，
+                可用 benchmarks/precision_validation.py 量測偏差
+            backend: 困惑度評分後端 (見 utils/lm_backends.py)；指定時忽略 model_name、
+                local_files_only 與 precision
         """
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        self.model_name = model_name
+        from nltk.corpus import stopwords
+        ensure_nltk_resources()
+        
+        # 模型由行程內的登錄表共用，多個提取器不會重複載入權重
+        self.backend = backend or TransformersBackend(
+            model_name, local_files_only=local_files_only, precision=precision
+        )
+        self.model_name = model_name if backend is None else self.backend.model_id
         
-        print(f"Loading model {model_name}...")
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.model = AutoModelForCausalLM.from_pretrained(model_name)
-        self.model.to(self.device)
-        self.model.eval()
+        max_positions = self.backend.max_positions
+        self.window_size = min(window_size or max_positions, max_positions)
+        self.window_overlap = self.window_size // 4 if window_overlap is None else window_overlap
+        if self.window_size < 2 or not 0 <= self.window_overlap < self.window_size:
+            raise ValueError("window_size must be >= 2 and window_overlap in [0, window_size)")
         
         self.english_stopwords = set(stopwords.words('english'))
+        self.cache = cache
         
-    def compute_perplexity(self, text: str) -> Dict:
+        # 困惑度每個 token 的平均耗時 (秒)，用於估算延遲預算內能計算的 token 數
+        self._perplexity_seconds_per_token = None
+        self._rate_lock = threading.Lock()
+    
+    @staticmethod
+    def _summarize_log_probs(log_probs: np.ndarray, num_tokens: int) -> Dict:
         """
-        計算困惑度 (Perplexity) 及相關指標
+        由 token log probability 序列彙總困惑度指標
         
         Args:
-            text: 輸入文本
-            
+            log_probs: 每個 token 的 log probability
+            num_tokens: 輸入的 token 總數
+        
         Returns:
-            包含 PP、log probability variance 等指標的字典
+            包含 PP、log probability 統計量的字典
         """
-        inputs = self.tokenizer.encode(text, return_tensors='pt').to(self.device)
+        log_probs = np.asarray(log_probs, dtype=np.float64)
         
-        with torch.no_grad():
-            outputs = self.model(inputs, labels=inputs)
-            loss = outputs.loss
-            
-        # 計算平均 PP
-        perplexity = torch.exp(loss).item()
+        # 平均 PP = exp(平均負對數似然)，與模型的 cross-entropy loss 一致
+        perplexity = np.exp(-np.mean(log_probs))
         
-        # 獲取每個 token 的 log probability
-        with torch.no_grad():
-            logits = self.model(inputs).logits
-            
-        # 計算 log probs 序列
-        log_probs = []
-        for i in range(len(inputs[0]) - 1):
-            logits_i = logits[0, i, :]
-            log_prob_i = torch.log_softmax(logits_i, dim=-1)
-            token_id = inputs[0, i + 1]
-            log_prob = log_prob_i[token_id].item()
-            log_probs.append(log_prob)
-        
-        log_probs = np.array(log_probs)
-        
-        features = {
+        return {
             'avg_perplexity': float(perplexity),
             'log_prob_mean': float(np.mean(log_probs)),
             'log_prob_std': float(np.std(log_probs)),
             'log_prob_max': float(np.max(log_probs)),
             'log_prob_min': float(np.min(log_probs)),
-            'num_tokens': len(inputs[0]),
+            'num_tokens': num_tokens,
         }
+    
+    def _windowed_token_log_probs(self, input_ids: np.ndarray, window_size: int, window_overlap: int) -> np.ndarray:
+        """
+        以跨步滑動視窗計算長文本的 token log probability
         
-        return features
+        每個視窗最多 window_size 個 token，相鄰視窗重疊 window_overlap 個
+        token 作為前文 (至少 1 個，否則視窗的第一個 token 沒有前文可計分)；
+        每個 token 只在第一個涵蓋它的視窗中計分，
+        因此合併後不會重複計算，記憶體用量只取決於視窗大小。
+        
+        Args:
+            input_ids: (1, seq_len) 的 token id 陣列
+            window_size: 視窗的 token 數
+            window_overlap: 相鄰視窗重疊的 token 數
+        
+        Returns:
+            長度 seq_len - 1 的 log probability 陣列
+        """
+        num_tokens = input_ids.shape[1]
+        context = max(window_overlap, 1)
+        log_probs = np.empty(max(num_tokens - 1, 0), dtype=np.float32)
+        
+        # next_target: 下一個尚未計分的 token 位置 (第 0 個 token 沒有前文)
+        next_target = 1
+        begin = 0
+        while next_target < num_tokens:
+            end = min(begin + window_size, num_tokens)
+            window_log_probs = self.backend.token_log_probs(input_ids[:, begin:end])[0]
+            
+            # 視窗內第 j 個輸出對應位置 begin + j + 1 的 token
+            offset = next_target - (begin + 1)
+            log_probs[next_target - 1:end - 1] = window_log_probs[offset:]
+            
+            next_target = end
+            begin = next_target - context
+        
+        return log_probs
     
-    def compute_burstiness(self, text: str) -> Dict:
+    def compute_perplexity(self, text: str, window_size: int = None, window_overlap: int = None,
+                           max_tokens: int = None, return_token_scores: bool = False) -> Dict:
         """
-        計算句子節奏指標 (Burstiness)
+        計算困惑度 (Perplexity) 及相關指標
+        
+        只進行一次前向傳播，loss 與所有 log_prob_* 統計量皆由同一個
+        log probability 陣列計算。
+        超過視窗長度的文本改用滑動視窗逐段計分。
         
         Args:
             text: 輸入文本
+            window_size: 覆寫預設的視窗 token 數
+            window_overlap: 覆寫預設的視窗重疊 token 數
+            max_tokens: 只計算前 max_tokens 個 token (num_tokens 仍為全文長度)
+            return_token_scores: 是否另外回傳逐 token 分數 (結果中的 'token_scores')
+        
+        Returns:
+            包含 PP、log probability variance 等指標的字典；return_token_scores 時另含
+            'token_scores': {'tokens': 被計分的 token 字串陣列, 'log_probs': float32 陣列}，
+            兩者等長 (第一個 token 沒有前文，不計分)
+        """
+        window_size = window_size or self.window_size
+        window_overlap = self.window_overlap if window_overlap is None else window_overlap
+        if window_size < 2 or not 0 <= window_overlap < window_size:
+            raise ValueError("window_size must be >= 2 and window_overlap in [0, window_size)")
+        
+        inputs = np.asarray([self.backend.encode(text)], dtype=np.int64)
+        num_tokens = inputs.shape[1]
+        if max_tokens is not None:
+            inputs = inputs[:, :max_tokens]
+        
+        if inputs.shape[1] > window_size:
+            log_probs = self._windowed_token_log_probs(inputs, window_size, window_overlap)
+        else:
+            log_probs = self.backend.token_log_probs(inputs)[0]
+        
+        result = self._summarize_log_probs(log_probs, num_tokens=num_tokens)
+        if return_token_scores:
+            result['token_scores'] = {
+                'tokens': np.array(self.backend.decode_tokens(inputs[0, 1:].tolist()), dtype=str),
+                'log_probs': np.asarray(log_probs, dtype=np.float32),
+            }
+        return result
+    
+    def compute_perplexity_batch(self, texts: List[str], batch_size: int = 8) -> List[Dict]:
+        """
+        批量計算多篇文本的困惑度指標
+        
+        依 token 長度排序以減少補齊量，每批右側補齊並加上 attention mask
+        後只做一次前向傳播。因果注意力下右側補齊不影響真實 token 的
+        logits，故每篇結果與 compute_perplexity 相同。
+        
+        Args:
+            texts: 文本列表
+            batch_size: 每次前向傳播的文本數
+        
+        Returns:
+            與 texts 順序對應的特徵字典列表；無法計算的文本為 None
+        """
+        encoded = [self.backend.encode(text) for text in texts]
+        results = [None] * len(texts)
+        
+        pad_id = self.backend.pad_id
+        
+        batchable = []
+        for i, ids in enumerate(encoded):
+            if len(ids) < 2:
+                print(f"Warning: Could not compute perplexity for text {i}: need at least 2 tokens")
+            elif len(ids) > self.window_size:
+                # 超過視窗長度的長文本改走滑動視窗，避免整批補齊到長文本的長度
+                try:
+                    results[i] = self.compute_perplexity(texts[i])
+                except Exception as e:
+                    print(f"Warning: Could not compute perplexity for text {i}: {e}")
+            else:
+                batchable.append(i)
+        
+        # 依長度排序，讓同一批的文本長度相近
+        batchable.sort(key=lambda i: len(encoded[i]))
+        
+        for start in range(0, len(batchable), batch_size):
+            indices = batchable[start:start + batch_size]
+            max_len = len(encoded[indices[-1]])
+            
+            input_ids = np.full((len(indices), max_len), pad_id, dtype=np.int64)
+            attention_mask = np.zeros((len(indices), max_len), dtype=np.int64)
+            for row, i in enumerate(indices):
+                ids = encoded[i]
+                input_ids[row, :len(ids)] = ids
+                attention_mask[row, :len(ids)] = 1
             
+            log_probs = self.backend.token_log_probs(input_ids, attention_mask)
+            
+            for row, i in enumerate(indices):
+                num_tokens = len(encoded[i])
+                results[i] = self._summarize_log_probs(log_probs[row, :num_tokens - 1], num_tokens)
+        
+        return results
+    
+    @staticmethod
+    def compute_burstiness(text: str, doc: AnalyzedDocument = None) -> Dict:
+        """
+        計算句子節奏指標 (Burstiness)
+        
+        Args:
+            text: 輸入文本
+            doc: 已解析的文本 (省略時由 text 解析)
+        
         Returns:
             包含 Burstiness、句長統計等指標的字典
         """
-        sentences = sent_tokenize(text)
+        doc = doc or AnalyzedDocument(text)
+        sentences = doc.sentences
         
         if len(sentences) < 2:
             return {
@@ -117,7 +288,7 @@ class FeatureExtractor:
             }
         
         # 計算每個句子的單詞數
-        sentence_lengths = [len(word_tokenize(s)) for s in sentences]
+        sentence_lengths = doc.sentence_lengths
         
         # Burstiness = std / mean
         mean_len = np.mean(sentence_lengths)
@@ -136,50 +307,61 @@ class FeatureExtractor:
         
         return features
     
-    def compute_stylometry(self, text: str) -> Dict:
+    @staticmethod
+    def compute_stylometry(text: str, doc: AnalyzedDocument = None, include_pos: bool = True) -> Dict:
         """
         計算寫作風格指標 (Stylometry)
         
         Args:
             text: 輸入文本
-            
+            doc: 已解析的文本 (省略時由 text 解析)
+            include_pos: 是否計算需要詞性標註的句法特徵 (延遲預算不足時略過)
+        
         Returns:
             包含用字、句法、情緒等風格特徵的字典
         """
-        words = word_tokenize(text)
-        sentences = sent_tokenize(text)
+        doc = doc or AnalyzedDocument(text)
+        words = doc.tokens
+        sentences = doc.sentences
         
         # === Lexical Features ===
         # 詞彙多樣性 (Type-Token Ratio)
-        unique_words = len(set(w.lower() for w in words if w.isalpha()))
-        total_words = len([w for w in words if w.isalpha()])
+        word_freq = doc.word_counts
+        unique_words = len(word_freq)
+        total_words = len(doc.alpha_tokens)
         ttr = unique_words / total_words if total_words > 0 else 0.0
         
         # 功能詞比例
-        function_words = ['the', 'a', 'an', 'is', 'are', 'was', 'were', 
-                         'be', 'been', 'being', 'and', 'or', 'but', 'if',
-                         'because', 'therefore', 'however', 'thus', 'also']
+        function_words = {'the', 'a', 'an', 'is', 'are', 'was', 'were', 
+                          'be', 'been', 'being', 'and', 'or', 'but', 'if',
+                          'because', 'therefore', 'however', 'thus', 'also'}
         func_word_count = sum(1 for w in words if w.lower() in function_words)
         func_word_ratio = func_word_count / len(words) if len(words) > 0 else 0.0
         
         # 稀有詞 (出現 1 次的詞)
-        word_freq = Counter(w.lower() for w in words if w.isalpha())
         rare_words = sum(1 for count in word_freq.values() if count == 1)
         rare_word_ratio = rare_words / len(word_freq) if len(word_freq) > 0 else 0.0
         
         # === Syntactic Features ===
-        # POS tag 分布
-        pos_tags = pos_tag(words)
-        pos_counts = Counter(tag for word, tag in pos_tags)
-        
-        # 代詞 (Pronoun) 比例
-        pronouns = [tag for tag, count in pos_counts.items() if tag in ['PRP', 'PRP$', 'WP', 'WP$']]
-        pronoun_count = sum(pos_counts.get(p, 0) for p in pronouns)
-        pronoun_ratio = pronoun_count / len(words) if len(words) > 0 else 0.0
-        
-        # 名詞 (Noun) 比例
-        noun_count = sum(pos_counts.get(tag, 0) for tag in ['NN', 'NNS', 'NNP', 'NNPS'])
-        noun_ratio = noun_count / len(words) if len(words) > 0 else 0.0
+        syntactic = {}
+        if include_pos:
+            # POS tag 分布
+            pos_counts = doc.pos_counts
+            
+            # 代詞 (Pronoun) 比例
+            pronouns = [tag for tag, count in pos_counts.items() if tag in ['PRP', 'PRP$', 'WP', 'WP$']]
+            pronoun_count = sum(pos_counts.get(p, 0) for p in pronouns)
+            pronoun_ratio = pronoun_count / len(words) if len(words) > 0 else 0.0
+            
+            # 名詞 (Noun) 比例
+            noun_count = sum(pos_counts.get(tag, 0) for tag in ['NN', 'NNS', 'NNP', 'NNPS'])
+            noun_ratio = noun_count / len(words) if len(words) > 0 else 0.0
+            
+            syntactic = {
+                'pronoun_ratio': float(pronoun_ratio),
+                'noun_ratio': float(noun_ratio),
+                'num_pos_tags': len(pos_counts),
+            }
         
         # === Emotion & Noise Features ===
         # 感嘆號比例
@@ -199,12 +381,10 @@ class FeatureExtractor:
             'ttr': float(ttr),
             'func_word_ratio': float(func_word_ratio),
             'rare_word_ratio': float(rare_word_ratio),
-            'avg_word_length': float(np.mean([len(w) for w in words if w.isalpha()]) if total_words > 0 else 0),
+            'avg_word_length': float(np.mean([len(w) for w in doc.alpha_tokens]) if total_words > 0 else 0),
             
             # Syntactic
-            'pronoun_ratio': float(pronoun_ratio),
-            'noun_ratio': float(noun_ratio),
-            'num_pos_tags': len(pos_counts),
+            **syntactic,
             
             # Emotion & Noise
             'exclamation_ratio': float(exclamation_ratio),
@@ -214,18 +394,20 @@ class FeatureExtractor:
         
         return features
     
-    def compute_zipf_features(self, text: str) -> Dict:
+    @staticmethod
+    def compute_zipf_features(text: str, doc: AnalyzedDocument = None) -> Dict:
         """
         計算 Zipf 長尾分布特徵
         
         Args:
             text: 輸入文本
-            
+            doc: 已解析的文本 (省略時由 text 解析)
+        
         Returns:
             包含 Zipf 尾部比例等特徵的字典
         """
-        words = word_tokenize(text.lower())
-        words = [w for w in words if w.isalpha()]
+        doc = doc or AnalyzedDocument(text)
+        words = doc.alpha_tokens_lower
         
         if len(words) < 10:
             return {
@@ -233,7 +415,7 @@ class FeatureExtractor:
                 'vocab_size': len(set(words))
             }
         
-        word_freq = Counter(words)
+        word_freq = doc.word_counts
         total_unique = len(word_freq)
         
         # 計算前 80% 的詞彙涵蓋的字數比例
@@ -257,49 +439,315 @@ class FeatureExtractor:
         
         return features
     
-    def extract_all_features(self, text: str) -> Dict:
+    @property
+    def model_id(self) -> str:
+        """影響特徵數值的模型設定；評分後端與視窗設定都會影響困惑度，因此一併納入"""
+        return f"{self.backend.model_id}|window={self.window_size}|overlap={self.window_overlap}"
+    
+    def enable_micro_batching(self, max_wait_ms: float = 5.0, max_batch_tokens: int = 4096):
+        """
+        讓多個執行緒同時呼叫的單篇困惑度計算合併成批次前向傳播 (見 utils/micro_batcher.py)
+        
+        Args:
+            max_wait_ms: 收集同一批請求最多等待的毫秒數
+            max_batch_tokens: 每批補齊後的 token 數上限
+        
+        Returns:
+            包住原評分後端的 MicroBatcher (可由 stats() 查看合併效果)
+        """
+        from utils.micro_batcher import MicroBatcher
+        
+        if not isinstance(self.backend, MicroBatcher):
+            self.backend = MicroBatcher(self.backend, max_wait_ms=max_wait_ms, max_batch_tokens=max_batch_tokens)
+        return self.backend
+    
+    def _cache_key(self, text: str) -> str:
+        """計算文本的快取鍵"""
+        return FeatureCache.make_key(text, self.model_id, FEATURE_VERSION)
+    
+    @staticmethod
+    def _is_complete(features: Dict) -> bool:
+        """是否每個特徵族都計算成功 (只快取完整的結果)"""
+        return all(any(k.startswith(prefix) for k in features) for prefix in FEATURE_PREFIXES)
+    
+    def extract_all_features(self, text: str, perplexity_features: Dict = None,
+                             budget: LatencyBudget = None, return_token_scores: bool = False,
+                             text_features: Dict = None):
         """
         提取所有特徵
         
+        設有快取時先以文本內容查詢，命中則直接回傳。
+        
         Args:
             text: 輸入文本
-            
+            perplexity_features: 已算好的困惑度指標 (例如來自批量計算)；
+                為 None 時在此計算，空字典表示略過
+            budget: 延遲預算；記錄各階段耗時，預算不足時截短困惑度
+                視窗或略過詞性標註 (降級的結果不會寫入快取)
+            return_token_scores: 是否一併回傳困惑度模型的逐 token 分數，
+                供熱力圖直接使用而不必再做一次前向傳播 (同樣會被快取)
+            text_features: 已算好的 extract_text_features 結果 (例如 cascade 的第一段)，
+                提供時不再重新計算
+        
         Returns:
-            包含所有特徵的字典
+            包含所有特徵的字典；return_token_scores 時為 (特徵字典, 逐 token 分數)，
+            逐 token 分數的格式見 compute_perplexity，無法取得時為 None
+        """
+        if self.cache is None:
+            return self._extract_features(text, perplexity_features, budget, return_token_scores, text_features)
+        
+        token_scores = None
+        with stage(budget, 'cache_lookup'):
+            key = self._cache_key(text)
+            features = self.cache.get(key)
+            if return_token_scores and features is not None:
+                # 逐 token 分數附屬於同一篇文本的特徵，不另計入命中率
+                packed = self.cache.get(self._token_scores_key(text), count=False)
+                if packed is None:
+                    # 特徵命中但沒有逐 token 分數時重新計算兩者
+                    features = None
+                else:
+                    token_scores = unpack_token_scores(packed)
+        
+        if features is None:
+            result = self._extract_features(text, perplexity_features, budget, return_token_scores, text_features)
+            features, token_scores = result if return_token_scores else (result, None)
+            degraded = budget is not None and budget.degradations
+            if self._is_complete(features) and not degraded:
+                self.cache.put(key, features)
+                if token_scores is not None:
+                    self.cache.put(self._token_scores_key(text), pack_token_scores(token_scores))
+        
+        return (features, token_scores) if return_token_scores else features
+    
+    def _token_scores_key(self, text: str) -> str:
+        """逐 token 分數的快取鍵 (與特徵共用同一個快取)"""
+        return FeatureCache.make_key(text, f"{self.model_id}|token_scores", FEATURE_VERSION)
+    
+    def _perplexity_token_limit(self, budget: LatencyBudget) -> int:
+        """依剩餘預算與過去的每 token 耗時，估算困惑度最多能計算的 token 數"""
+        if budget is None or budget.budget_ms is None or self._perplexity_seconds_per_token is None:
+            return None
+        affordable = int(budget.remaining_ms() / 1000 / self._perplexity_seconds_per_token)
+        return max(affordable, budget.min_perplexity_tokens)
+    
+    def _extract_features(self, text: str, perplexity_features: Dict = None,
+                          budget: LatencyBudget = None, return_token_scores: bool = False,
+                          text_features: Dict = None):
+        """
+        實際計算所有特徵 (不經過快取)
+        
+        Args:
+            text: 輸入文本
+            perplexity_features: 見 extract_all_features
+            budget: 見 extract_all_features
+            return_token_scores: 見 extract_all_features
+            text_features: 見 extract_all_features
+        
+        Returns:
+            包含所有特徵的字典；return_token_scores 時為 (特徵字典, 逐 token 分數)
         """
         print("Extracting features...")
         
         features = {}
+        token_scores = None
         
         # Perplexity
+        if perplexity_features is None:
+            max_tokens = self._perplexity_token_limit(budget)
+            try:
+                with stage(budget, 'perplexity'):
+                    start = time.perf_counter()
+                    perplexity_features = self.compute_perplexity(
+                        text, max_tokens=max_tokens, return_token_scores=return_token_scores
+                    )
+                    elapsed = time.perf_counter() - start
+                token_scores = perplexity_features.pop('token_scores', None)
+                
+                scored_tokens = perplexity_features['num_tokens']
+                if max_tokens is not None and scored_tokens > max_tokens:
+                    scored_tokens = max_tokens
+                    budget.degrade(f"perplexity truncated to {max_tokens} tokens")
+                
+                # 以指數移動平均更新每 token 耗時
+                rate = elapsed / max(scored_tokens, 1)
+                with self._rate_lock:
+                    previous = self._perplexity_seconds_per_token
+                    self._perplexity_seconds_per_token = rate if previous is None else 0.8 * previous + 0.2 * rate
+            except Exception as e:
+                print(f"Warning: Could not compute perplexity: {e}")
+                perplexity_features = {}
+        features.update({f'pp_{k}': v for k, v in perplexity_features.items()})
+        
+        if text_features is None:
+            text_features = self.extract_text_features(text, budget)
+        features.update(text_features)
+        
+        return (features, token_scores) if return_token_scores else features
+    
+    @staticmethod
+    def extract_text_features(text: str, budget: LatencyBudget = None) -> Dict:
+        """
+        計算不需語言模型的特徵族 (Burstiness、Stylometry、Zipf)
+        
+        不使用任何實例狀態，可直接在工作行程中執行。
+        
+        Args:
+            text: 輸入文本
+            budget: 延遲預算；已超出時略過詞性標註
+        
+        Returns:
+            帶有 burst_、style_、zipf_ 前綴的特徵字典
+        """
+        features = {}
+        
+        # 斷句、斷詞只做一次，供以下各特徵族共用
         try:
-            pp_features = self.compute_perplexity(text)
-            features.update({f'pp_{k}': v for k, v in pp_features.items()})
+            with stage(budget, 'tokenisation'):
+                doc = AnalyzedDocument(text)
         except Exception as e:
-            print(f"Warning: Could not compute perplexity: {e}")
-            
+            print(f"Warning: Could not analyze text: {e}")
+            doc = None
+        
         # Burstiness
         try:
-            burst_features = self.compute_burstiness(text)
+            with stage(budget, 'burstiness'):
+                burst_features = FeatureExtractor.compute_burstiness(text, doc)
             features.update({f'burst_{k}': v for k, v in burst_features.items()})
         except Exception as e:
             print(f"Warning: Could not compute burstiness: {e}")
-            
+        
         # Stylometry
+        include_pos = budget is None or not budget.exceeded()
+        if not include_pos:
+            budget.degrade("POS tagging skipped", skipped_features=POS_FEATURE_NAMES)
         try:
-            style_features = self.compute_stylometry(text)
+            with stage(budget, 'stylometry'):
+                style_features = FeatureExtractor.compute_stylometry(text, doc, include_pos=include_pos)
             features.update({f'style_{k}': v for k, v in style_features.items()})
         except Exception as e:
             print(f"Warning: Could not compute stylometry: {e}")
-            
+        
         # Zipf
         try:
-            zipf_features = self.compute_zipf_features(text)
+            with stage(budget, 'zipf'):
+                zipf_features = FeatureExtractor.compute_zipf_features(text, doc)
             features.update({f'zipf_{k}': v for k, v in zipf_features.items()})
         except Exception as e:
             print(f"Warning: Could not compute zipf features: {e}")
         
         return features
+    
+    def extract_all_features_batch(self, texts: List[str], batch_size: int = 8, n_workers: int = None,
+                                   perplexity_in_workers: bool = False) -> List[Dict]:
+        """
+        批量提取所有特徵，困惑度以補齊後的批次前向傳播計算
+        
+        設有快取時，只有未命中的文本會進入模型。指定 n_workers > 1 時，
+        NLTK 特徵族 (純 Python、受 GIL 限制) 分散到工作行程池平行計算，
+        同時主行程以批次方式計算困惑度；perplexity_in_workers=True 則
+        改為每個工作行程各自載入一份模型並計算全部特徵。
+        結果依輸入順序回傳，且與循序計算相同。
+        
+        Args:
+            texts: 文本列表
+            batch_size: 困惑度模型每批的文本數
+            n_workers: 工作行程數 (None 或 1 表示循序計算)
+            perplexity_in_workers: 是否在每個工作行程中計算困惑度
+        
+        Returns:
+            與 texts 順序對應的特徵字典列表
+        """
+        results = [None] * len(texts)
+        keys = [None] * len(texts)
+        
+        if self.cache is not None:
+            for i, text in enumerate(texts):
+                keys[i] = self._cache_key(text)
+                results[i] = self.cache.get(keys[i])
+        
+        pending = [i for i, features in enumerate(results) if features is None]
+        pending_texts = [texts[i] for i in pending]
+        
+        if pending_texts and n_workers and n_workers > 1:
+            computed = self._extract_parallel(pending_texts, batch_size, n_workers, perplexity_in_workers)
+        else:
+            pp_results = self.compute_perplexity_batch(pending_texts, batch_size=batch_size)
+            computed = [
+                self._extract_features(text, perplexity_features=pp_features or {})
+                for text, pp_features in zip(pending_texts, pp_results)
+            ]
+        
+        for i, features in zip(pending, computed):
+            if keys[i] is not None and self._is_complete(features):
+                self.cache.put(keys[i], features)
+            results[i] = features
+        
+        return results
+    
+    def _extract_parallel(self, texts: List[str], batch_size: int, n_workers: int,
+                          perplexity_in_workers: bool) -> List[Dict]:
+        """
+        以工作行程池計算特徵 (見 extract_all_features_batch)
+        
+        使用 spawn 啟動工作行程，避免 fork 已初始化 torch 執行緒池的行程。
+        在工作行程中計算困惑度時，每個行程的 torch 執行緒數限制為
+        CPU 核心數 / n_workers，避免多份模型互相搶占核心。
+        
+        Args:
+            texts: 文本列表
+            batch_size: 困惑度模型每批的文本數
+            n_workers: 工作行程數
+            perplexity_in_workers: 是否在每個工作行程中計算困惑度
+        
+        Returns:
+            與 texts 順序對應的特徵字典列表
+        """
+        context = multiprocessing.get_context('spawn')
+        chunksize = max(1, len(texts) // (n_workers * 4))
+        
+        if perplexity_in_workers:
+            with ProcessPoolExecutor(
+                max_workers=n_workers,
+                mp_context=context,
+                initializer=_init_worker_extractor,
+                initargs=(type(self.backend), self.backend.config(), self.window_size, self.window_overlap,
+                          max(1, (os.cpu_count() or 1) // n_workers)),
+            ) as pool:
+                return list(pool.map(_worker_extract_all_features, texts, chunksize=chunksize))
+        
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=context) as pool:
+            # 先送出 NLTK 特徵族，主行程同時計算困惑度
+            text_results = pool.map(FeatureExtractor.extract_text_features, texts, chunksize=chunksize)
+            pp_results = self.compute_perplexity_batch(texts, batch_size=batch_size)
+            
+            results = []
+            for pp_features, text_features in zip(pp_results, text_results):
+                features = {f'pp_{k}': v for k, v in (pp_features or {}).items()}
+                features.update(text_features)
+                results.append(features)
+            return results
+
+
+# 每個工作行程各自持有的特徵提取器 (perplexity_in_workers 模式)
+_worker_extractor = None
+
+
+def _init_worker_extractor(backend_class: type, backend_config: Dict, window_size: int, window_overlap: int,
+                           torch_threads: int = None):
+    """工作行程初始化：以相同設定重建評分後端與該行程專用的特徵提取器"""
+    global _worker_extractor
+    _worker_extractor = FeatureExtractor(backend=backend_class(**backend_config),
+                                         window_size=window_size, window_overlap=window_overlap)
+    # 只有使用 torch 的後端需要限制執行緒數 (n-gram 後端不必因此匯入 torch)
+    if torch_threads is not None and 'torch' in sys.modules:
+        from utils.model_registry import configure_torch_threads
+        configure_torch_threads(intra_op=torch_threads, inter_op=1)
+
+
+def _worker_extract_all_features(text: str) -> Dict:
+    """工作行程任務：計算單篇文本的全部特徵"""
+    return _worker_extractor._extract_features(text)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,77 @@
+"""
+特徵結構模組 - 固定的特徵名稱 → 欄位索引，訓練時凍結並隨模型保存
+"""
+
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+
+# 各特徵族 (前綴) 可能產生的全部特徵名稱
+FEATURE_FAMILIES = {
+    'pp_': ['avg_perplexity', 'log_prob_mean', 'log_prob_std', 'log_prob_max',
+            'log_prob_min', 'num_tokens'],
+    'burst_': ['burstiness', 'avg_sentence_length', 'sentence_length_std',
+               'sentence_length_min', 'sentence_length_max', 'num_sentences'],
+    'style_': ['ttr', 'func_word_ratio', 'rare_word_ratio', 'avg_word_length',
+               'pronoun_ratio', 'noun_ratio', 'num_pos_tags',
+               'exclamation_ratio', 'ellipsis_ratio', 'uppercase_ratio'],
+    'zipf_': ['zipf_tail_ratio', 'vocab_size', 'vocabulary_richness'],
+}
+
+# 依名稱排序，與引入 schema 之前以 sorted(all_keys) 訓練的模型欄位順序相容
+DEFAULT_FEATURE_NAMES = sorted(
+    prefix + name for prefix, names in FEATURE_FAMILIES.items() for name in names
+)
+
+
+class FeatureSchema:
+    """
+    特徵矩陣的欄位定義
+    
+    欄位順序在建立時即固定，不會因某些文本缺少特徵族 (例如困惑度
+    計算失敗) 而改變；缺少的特徵在矩陣中為 0。
+    """
+    
+    def __init__(self, feature_names: Sequence[str] = None):
+        """
+        建立特徵結構
+        
+        Args:
+            feature_names: 依欄位順序排列的特徵名稱 (預設為全部特徵)
+        """
+        self.feature_names: List[str] = list(feature_names or DEFAULT_FEATURE_NAMES)
+        self.index: Dict[str, int] = {name: i for i, name in enumerate(self.feature_names)}
+    
+    def __len__(self) -> int:
+        return len(self.feature_names)
+    
+    def transform(self, feature_dicts: List[Dict], out: np.ndarray = None) -> np.ndarray:
+        """
+        將特徵字典寫入預先配置的矩陣
+        
+        每個字典只走訪一次，依索引直接寫入對應欄位；不在結構中的
+        特徵會被忽略。
+        
+        Args:
+            feature_dicts: 特徵字典列表
+            out: 預先配置的 (n_samples, n_features) 矩陣 (省略時新建全 0 矩陣)
+            
+        Returns:
+            特徵矩陣 (n_samples, n_features)
+        """
+        if out is None:
+            out = np.zeros((len(feature_dicts), len(self.feature_names)), dtype=np.float64)
+        
+        index = self.index
+        for row, features in enumerate(feature_dicts):
+            columns = []
+            values = []
+            for name, value in features.items():
+                column = index.get(name)
+                if column is not None:
+                    columns.append(column)
+                    values.append(value)
+            out[row, columns] = values
+        
+        return out
@@ -0,0 +1,207 @@
+"""
+特徵庫模組 - 將提取好的特徵矩陣以欄式、記憶體映射的格式存到磁碟，重新訓練時免再提取
+"""
+
+import hashlib
+import json
+import shutil
+import time
+import zlib
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+import numpy as np
+
+
+META_FILE = 'meta.json'
+FEATURES_FILE = 'features.f64'
+LABELS_FILE = 'labels.i8'
+HASHES_FILE = 'hashes.u32'
+
+
+def text_hash(text: str) -> int:
+    """文本的 CRC32，寫入特徵庫供穩定切分使用"""
+    return zlib.crc32(text.encode('utf-8'))
+
+
+def holdout_mask(hashes: np.ndarray, holdout_fraction: float) -> np.ndarray:
+    """
+    依文本雜湊決定的測試集遮罩 (與資料順序、區塊大小無關，重新執行時不變)
+    
+    Args:
+        hashes: 文本 CRC32 陣列
+        holdout_fraction: 測試集比例
+    """
+    return (np.asarray(hashes) % 10000) < holdout_fraction * 10000
+
+
+class FeatureStore:
+    """
+    已特徵化的語料庫 (唯讀)
+    
+    目錄內容：
+        features.f64  row-major float64 特徵矩陣 (n_rows × n_features)
+        labels.i8     int8 標籤
+        hashes.u32    每篇文本的 CRC32，用於穩定地切分訓練 / 測試集
+        meta.json     欄位名稱、提取器模型、特徵版本與列數
+    
+    meta.json 最後寫入，因此中斷的寫入不會被當成可用的特徵庫。
+    矩陣以 np.memmap 開啟，載入不需複製資料。
+    """
+    
+    def __init__(self, path: str):
+        """
+        開啟既有的特徵庫
+        
+        Args:
+            path: 特徵庫目錄
+        """
+        self.path = Path(path)
+        with open(self.path / META_FILE, 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        
+        self.feature_names: List[str] = self.meta['feature_names']
+        n_rows = self.meta['n_rows']
+        n_features = len(self.feature_names)
+        
+        if n_rows == 0:
+            self.X = np.empty((0, n_features), dtype=np.float64)
+            self.y = np.empty(0, dtype=np.int8)
+            self.hashes = np.empty(0, dtype=np.uint32)
+        else:
+            self.X = np.memmap(self.path / FEATURES_FILE, dtype=np.float64, mode='r', shape=(n_rows, n_features))
+            self.y = np.memmap(self.path / LABELS_FILE, dtype=np.int8, mode='r', shape=(n_rows,))
+            self.hashes = np.memmap(self.path / HASHES_FILE, dtype=np.uint32, mode='r', shape=(n_rows,))
+    
+    def __len__(self) -> int:
+        return self.meta['n_rows']
+    
+    @staticmethod
+    def exists(path: str) -> bool:
+        """目錄中是否有完整寫入的特徵庫"""
+        return (Path(path) / META_FILE).exists()
+    
+    @staticmethod
+    def source_signature(dataset_path: str) -> str:
+        """
+        來源數據集內容的 SHA-256，用於偵測數據集是否已變更
+        
+        以內容而非修改時間判斷：重新寫出相同內容的數據集 (例如 train.py
+        每次重建 CSV) 不會使特徵庫失效。以 1 MB 區塊串流計算，不會整個載入記憶體。
+        """
+        digest = hashlib.sha256()
+        with open(dataset_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return f"sha256:{digest.hexdigest()}"
+    
+    @staticmethod
+    def create(path: str, feature_names: List[str], model_id: str, feature_version: str,
+               source: str = None) -> 'FeatureStoreWriter':
+        """
+        建立新的特徵庫 (會覆蓋同一目錄中的舊特徵庫)
+        
+        Args:
+            path: 特徵庫目錄
+            feature_names: 依欄位順序排列的特徵名稱
+            model_id: 特徵提取器的模型識別
+            feature_version: 特徵版本
+            source: 來源數據集路徑
+            
+        Returns:
+            寫入器
+        """
+        return FeatureStoreWriter(path, feature_names, model_id, feature_version, source)
+    
+    def is_compatible(self, feature_names: List[str], model_id: str, feature_version: str,
+                      source: str = None) -> bool:
+        """
+        特徵庫是否由相同的提取器、特徵定義與數據集產生
+        
+        Args:
+            feature_names: 預期的欄位名稱
+            model_id: 預期的提取器模型識別
+            feature_version: 預期的特徵版本
+            source: 若提供，另檢查來源數據集是否與建立時相同且未變更
+        """
+        if source is not None:
+            if self.meta.get('source') != str(source) or not Path(source).exists():
+                return False
+            if self.meta.get('source_signature') != self.source_signature(source):
+                return False
+        
+        return (
+            self.feature_names == list(feature_names)
+            and self.meta.get('model_id') == model_id
+            and self.meta.get('feature_version') == feature_version
+        )
+    
+    def iter_chunks(self, chunk_size: int = 10000) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        依序走訪資料區塊 (皆為記憶體映射的切片，不複製)
+        
+        Args:
+            chunk_size: 每個區塊的列數
+            
+        Yields:
+            (X, y, hashes)
+        """
+        for start in range(0, len(self), chunk_size):
+            end = start + chunk_size
+            yield self.X[start:end], self.y[start:end], self.hashes[start:end]
+
+
+class FeatureStoreWriter:
+    """特徵庫寫入器，以區塊為單位附加資料"""
+    
+    def __init__(self, path: str, feature_names: List[str], model_id: str, feature_version: str,
+                 source: str = None):
+        self.path = Path(path)
+        if self.path.exists():
+            shutil.rmtree(self.path)
+        self.path.mkdir(parents=True)
+        
+        self.meta = {
+            'feature_names': list(feature_names),
+            'model_id': model_id,
+            'feature_version': feature_version,
+            'source': str(source) if source else None,
+            'source_signature': FeatureStore.source_signature(source) if source else None,
+            'n_rows': 0,
+        }
+        self._features = open(self.path / FEATURES_FILE, 'wb')
+        self._labels = open(self.path / LABELS_FILE, 'wb')
+        self._hashes = open(self.path / HASHES_FILE, 'wb')
+    
+    def append(self, X: np.ndarray, y: np.ndarray, hashes: np.ndarray):
+        """
+        附加一個資料區塊
+        
+        Args:
+            X: (n, n_features) 特徵矩陣
+            y: (n,) 標籤
+            hashes: (n,) 文本 CRC32
+        """
+        if X.shape[1] != len(self.meta['feature_names']):
+            raise ValueError(f"Expected {len(self.meta['feature_names'])} features, got {X.shape[1]}")
+        
+        np.ascontiguousarray(X, dtype=np.float64).tofile(self._features)
+        np.asarray(y, dtype=np.int8).tofile(self._labels)
+        np.asarray(hashes, dtype=np.uint32).tofile(self._hashes)
+        self.meta['n_rows'] += len(y)
+    
+    def close(self) -> FeatureStore:
+        """
+        完成寫入並開啟唯讀特徵庫
+        
+        Returns:
+            FeatureStore
+        """
+        for f in (self._features, self._labels, self._hashes):
+            f.close()
+        
+        self.meta['created'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        with open(self.path / META_FILE, 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, ensure_ascii=False, indent=2)
+        
+        return FeatureStore(self.path)
@@ -0,0 +1,302 @@
+"""
+啟發式評分模組 - 未載入訓練模型時使用的 AI 偵測評分邏輯
+
+標記比對皆在建構時預先編譯：ASCII 標記每一族合併成一條交替式 regex，
+中文標記以單一 Aho–Corasick 自動機一次掃描全文，文本只切詞、斷句各一次。
+"""
+
+import re
+from collections import deque
+from typing import Dict, Iterable, List, Set
+
+import numpy as np
+
+
+# 古文/經典文學標記 (應該懲罰)
+CLASSICAL_LITERARY_MARKERS = {
+    # 中文古文詞彙
+    '然而', '既然', '莫若', '其實', '況且', '而況', '不料', '豈料',
+    '想不到', '怎料', '誰知', '卻', '竟', '竟然', '偏偏', '恰好',
+    '恰恰', '正好', '湊巧', '怪不得', '也難怪', '也怪得',
+    '橫豎', '仔細', '戰慄', '歪歪斜斜', '吃人', '字縫',
+    '翻開', '歷史', '仁義', '道德', '滿本',
+    # 英文古典詞彙
+    'alas', 'behold', 'hark', 'lo', 'methinks', 'perchance',
+    'forsooth', 'thus', 'verily', 'hence', 'whence', 'thence',
+    'thee', 'thou', 'thy', 'hath', 'doth', 'wherefore',
+}
+
+# 現代浪漫/感情詞彙 (不懲罰，僅作為標籤)
+ROMANTIC_EMOTIONAL_WORDS = {
+    # 英文浪漫詞彙
+    'love', 'heart', 'smile', 'warmth', 'embrace', 'promise',
+    'fire', 'silence', 'perfect', 'familiar', 'softly', 'closer',
+    'traced', 'whisper', 'blurred', 'watercolors', 'amber', 'glow',
+    'breathing', 'murmured', 'kissing', 'admitted', 'troubled',
+    'borrowed', 'countered', 'foreheads', 'scent', 'clung',
+    'sweater', 'stillness', 'chaos', 'undeniable', 'pensive',
+    'wrapped', 'completely', 'whispered', 'storms', 'waiting',
+    'tightening', 'moon', 'vow', 'fireworks', 'solidity',
+    'surveillance', 'tender', 'gentle', 'passionate', 'desire',
+    'longing', 'yearning', 'adore', 'cherish', 'beloved',
+    # 中文浪漫詞彙
+    '愛', '心', '溫暖', '擁抱', '承諾', '火', '沉默', '完美',
+    '熟悉', '輕輕', '靠近', '描繪', '低語', '親吻', '承認',
+}
+
+# 人性化標記
+PERSONAL_WORDS = {'我', '我覺得', '我認為', '我想', '我發現', '我看',
+                  'i think', 'i feel', 'i believe', 'in my opinion'}
+
+# 英文功能詞
+FUNCTION_WORDS = {'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'of',
+                  'is', 'are', 'was', 'were', 'be', 'been', 'have', 'has', 'had'}
+
+PUNCT_CHARS = '.,!?;:\'"—-。！？；：''""'
+
+# 在句末標點之後 (以及既有的 '|') 斷句
+SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?。！？])|\|')
+
+
+def _is_cjk(marker: str) -> bool:
+    return '\u4e00' <= marker[0] <= '\u9fff'
+
+
+def _word_alternation(markers: Iterable[str]) -> re.Pattern:
+    """
+    將一族 ASCII 標記合併成一條 regex
+    
+    交替式依長度由長到短排列，並以零寬度的 lookahead 包住，每個位置都會嘗試比對，
+    但同一位置只回報最長的標記。因此只有在沒有任何標記是另一標記在詞界處的前綴
+    (例如 "i" 之於 "i'm") 時，找到的標記集合才與逐一執行
+    re.search(r'\\b' + marker + r'\\b') 相同；目前使用的標記族都符合這個條件。
+    """
+    alternation = '|'.join(re.escape(m) for m in sorted(markers, key=len, reverse=True))
+    return re.compile(r'(?=\b(' + alternation + r')\b)')
+
+
+class MultiPatternMatcher:
+    """Aho–Corasick 多模式字串比對：單次掃描即找出文本中出現的所有模式"""
+    
+    def __init__(self, patterns: Iterable[str]):
+        """
+        建立自動機
+        
+        Args:
+            patterns: 要比對的字串
+        """
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Set[str]] = [set()]
+        
+        for pattern in patterns:
+            state = 0
+            for char in pattern:
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(set())
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+            self._output[state].add(pattern)
+        
+        # 以 BFS 建立失敗連結，並合併後綴狀態的輸出
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._output[next_state] |= self._output[self._fail[next_state]]
+    
+    def find_all(self, text: str) -> Set[str]:
+        """
+        找出文本中出現過的所有模式
+        
+        Args:
+            text: 輸入文本
+            
+        Returns:
+            出現過的模式集合
+        """
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            if self._output[state]:
+                found |= self._output[state]
+        return found
+
+
+class HeuristicScorer:
+    """
+    啟發式 AI 偵測評分
+    
+    權重配置：詞彙多樣性 31%、句子一致性 29%、功能詞 8%、標點 6%、
+    古文懲罰 10%、人性化標記 7%、結構規律性 9%。
+    """
+    
+    def __init__(self):
+        self._classical_cjk = {m for m in CLASSICAL_LITERARY_MARKERS if _is_cjk(m)}
+        self._romantic_cjk = {m for m in ROMANTIC_EMOTIONAL_WORDS if _is_cjk(m)}
+        self._personal_cjk = {m for m in PERSONAL_WORDS if _is_cjk(m)}
+        
+        self._classical_re = _word_alternation(
+            m for m in CLASSICAL_LITERARY_MARKERS if not _is_cjk(m) and ord(m[0]) < 128
+        )
+        self._personal_re = _word_alternation(m for m in PERSONAL_WORDS if not _is_cjk(m))
+        
+        self._cjk_matcher = MultiPatternMatcher(
+            self._classical_cjk | self._romantic_cjk | self._personal_cjk
+        )
+    
+    def score(self, input_text: str) -> Dict:
+        """
+        計算文本的啟發式 AI 分數
+        
+        Args:
+            input_text: 輸入文本
+            
+        Returns:
+            包含 prediction、ai_probability、human_probability、confidence
+            與 score_factors 的字典
+        """
+        ai_score = 0
+        score_factors = {}
+        
+        # 清理和準備文本 (只切詞一次)
+        text_lower = input_text.lower()
+        words_lower = text_lower.split()
+        cjk_found = self._cjk_matcher.find_all(text_lower)
+        
+        # 1. 詞彙多樣性 (31% ↑)
+        if len(words_lower) > 0:
+            unique_words = len(set(words_lower))
+            vocab_ratio = unique_words / len(words_lower)
+            vocab_score = max(0, min((vocab_ratio - 0.54) / 0.26, 1)) * 0.31
+            ai_score += vocab_score
+            score_factors['vocabulary_diversity'] = vocab_score
+        
+        # 2. 句子一致性 (29% ↓)
+        sentences = [s.strip() for s in SENTENCE_SPLIT_RE.split(input_text) if s.strip()]
+        if len(sentences) > 1:
+            sent_lengths = [len(s.split()) for s in sentences]
+            mean_len = np.mean(sent_lengths)
+            std_len = np.std(sent_lengths)
+            cv = std_len / (mean_len + 1e-6) if mean_len > 0 else 0
+            consistency_score = max(0, 1 - min(cv, 1.3) / 1.3) * 0.29
+            ai_score += consistency_score
+            score_factors['sentence_consistency'] = consistency_score
+        
+        # 3. 英文功能詞 (8%)
+        if any(ord(c) < 128 for c in input_text):
+            if len(words_lower) > 0:
+                func_word_count = sum(1 for w in words_lower if w in FUNCTION_WORDS)
+                func_ratio = func_word_count / len(words_lower)
+                func_score = min(func_ratio / 0.30, 1) * 0.08
+                ai_score += func_score
+                score_factors['function_words'] = func_score
+        
+        # 4. 標點符號密度 (6%)
+        total_punct = sum(1 for c in input_text if c in PUNCT_CHARS)
+        punct_density = total_punct / max(len(input_text), 1)
+        
+        if punct_density < 0.015:
+            punct_score = 0.0
+        elif punct_density < 0.03:
+            punct_score = 0.03
+        else:
+            punct_score = 0.06
+        
+        ai_score += punct_score
+        score_factors['punctuation_pattern'] = punct_score
+        
+        # 5. 古文/經典文學檢測 (10% ↓)
+        classical_count = (
+            len({m.group(1) for m in self._classical_re.finditer(text_lower)})
+            + len(cjk_found & self._classical_cjk)
+        )
+        
+        if classical_count > 0:
+            classical_penalty = min(classical_count * 0.25, 0.40)
+            ai_score -= classical_penalty
+            score_factors['literary_style'] = -classical_penalty
+        else:
+            score_factors['literary_style'] = 0.0
+        
+        # 5.5 浪漫/情感內容檢測 (不懲罰，僅作為標籤)
+        romantic_count = sum(
+            1 for word in words_lower if word.strip('.,!?;:\'"') in ROMANTIC_EMOTIONAL_WORDS
+        )
+        romantic_count += len(cjk_found & self._romantic_cjk)
+        
+        score_factors['romantic_content'] = romantic_count
+        # 注意: 不會減少 ai_score，因為浪漫內容可以與 AI 生成並存
+        
+        # 6. 人性化標記 (7%)
+        humanization_score = 0
+        
+        question_count = input_text.count('?') + input_text.count('？')
+        question_ratio = question_count / max(len(sentences), 1)
+        if question_ratio > 0.15:
+            humanization_score += 0.035
+        
+        ellipsis_count = input_text.count('...') + input_text.count('。。。')
+        if ellipsis_count > 0:
+            humanization_score += 0.02
+        
+        personal_count = (
+            len({m.group(1) for m in self._personal_re.finditer(text_lower)})
+            + len(cjk_found & self._personal_cjk)
+        )
+        
+        if personal_count > 1:
+            humanization_score += min(personal_count * 0.015, 0.015)
+        
+        ai_score -= min(humanization_score, 0.07)
+        score_factors['humanization'] = -min(humanization_score, 0.07)
+        
+        # 7. 結構規律性 (9%)
+        paragraphs = [p.strip() for p in input_text.split('\n\n') if p.strip()]
+        if len(paragraphs) <= 1:
+            ai_score += 0.045
+            score_factors['structure'] = 0.045
+        else:
+            para_lengths = [len(p.split()) for p in paragraphs]
+            para_std = np.std(para_lengths)
+            para_mean = np.mean(para_lengths)
+            para_cv = para_std / (para_mean + 1e-6) if para_mean > 0 else 0
+            struct_score = max(0, 1 - min(para_cv, 1)) * 0.09
+            ai_score += struct_score
+            score_factors['structure'] = struct_score
+        
+        # 確保分數在 [0, 1] 範圍內
+        ai_prob = max(0, min(ai_score, 1.0))
+        
+        # 計算置信度
+        confidence = max(abs(ai_prob - 0.5) * 2, 0.5)
+        
+        return {
+            'prediction': 1 if ai_prob >= 0.5 else 0,
+            'ai_probability': ai_prob,
+            'human_probability': 1 - ai_prob,
+            'confidence': confidence,
+            'score_factors': score_factors,
+        }
+    
+    def score_batch(self, texts: List[str]) -> List[Dict]:
+        """
+        批量計算啟發式分數
+        
+        Args:
+            texts: 文本列表
+            
+        Returns:
+            與 texts 順序對應的評分字典列表
+        """
+        return [self.score(text) for text in texts]
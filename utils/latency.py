@@ -0,0 +1,89 @@
+"""
+延遲預算模組 - 記錄每個請求各階段的耗時，並在超出預算時提示降級
+"""
+
+import time
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Sequence
+
+
+class LatencyBudget:
+    """
+    單一請求的延遲預算與分段計時
+    
+    計時從建立物件開始。各階段以 stage() 包住即可記錄耗時；
+    特徵提取器會在預算吃緊時截短困惑度視窗、超出預算時略過詞性標註，
+    並以 degrade() 記錄所做的降級。
+    """
+    
+    def __init__(self, budget_ms: float = None, min_perplexity_tokens: int = 64):
+        """
+        建立延遲預算
+        
+        Args:
+            budget_ms: 預算 (毫秒)；None 表示只計時、不降級
+            min_perplexity_tokens: 降級時困惑度至少計算的 token 數
+        """
+        self.budget_ms = budget_ms
+        self.min_perplexity_tokens = min_perplexity_tokens
+        self.timings = OrderedDict()
+        self.degradations = []
+        self.skipped_features = []
+        self._start = time.perf_counter()
+    
+    @contextmanager
+    def stage(self, name: str):
+        """記錄一個階段的耗時 (同名階段累加)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed_ms
+    
+    def elapsed_ms(self) -> float:
+        """從建立至今的耗時 (毫秒)"""
+        return (time.perf_counter() - self._start) * 1000
+    
+    def remaining_ms(self) -> float:
+        """剩餘預算 (毫秒)；沒有預算時為無限大"""
+        if self.budget_ms is None:
+            return float('inf')
+        return self.budget_ms - self.elapsed_ms()
+    
+    def exceeded(self) -> bool:
+        """是否已超出預算"""
+        return self.remaining_ms() <= 0
+    
+    def degrade(self, reason: str, skipped_features: Sequence[str] = ()):
+        """
+        記錄一次降級
+        
+        Args:
+            reason: 降級說明
+            skipped_features: 因此沒有計算的特徵名稱 (分類時以訓練集平均值填補)
+        """
+        self.degradations.append(reason)
+        self.skipped_features.extend(skipped_features)
+    
+    def report(self) -> Dict:
+        """
+        彙整計時結果
+        
+        Returns:
+            包含各階段耗時、總耗時、預算與降級紀錄的字典
+        """
+        total_ms = self.elapsed_ms()
+        return {
+            'stages_ms': dict(self.timings),
+            'total_ms': total_ms,
+            'budget_ms': self.budget_ms,
+            'within_budget': self.budget_ms is None or total_ms <= self.budget_ms,
+            'degradations': list(self.degradations),
+        }
+
+
+def stage(budget: LatencyBudget, name: str):
+    """budget 為 None 時不計時的 stage()"""
+    return budget.stage(name) if budget is not None else nullcontext()
@@ -0,0 +1,543 @@
+"""
+語言模型後端模組 - 困惑度特徵可由不同的評分模型提供 (transformers、TorchScript、ONNX、n-gram)
+"""
+
+import gzip
+import json
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from utils.model_registry import get_language_model
+
+
+# 匯出的計算圖目錄內的檔案
+BACKEND_META_FILE = 'backend.json'
+TORCHSCRIPT_FILE = 'model.pt'
+ONNX_FILE = 'model.onnx'
+
+LN_10 = math.log(10)
+
+# Hugging Face fast tokenizer 每次編碼都可能改寫內部的截斷 / 補齊設定，
+# 多執行緒同時呼叫會出現 "Already borrowed" 錯誤；tokenizer 由模型登錄表共用，
+# 因此以行程層級的鎖保護 (編碼耗時遠小於前向傳播，序列化的成本可以忽略)
+_tokenizer_lock = threading.Lock()
+
+
+class LanguageModelBackend:
+    """
+    困惑度評分後端的共同介面
+    
+    FeatureExtractor 只透過此介面取得 token id 與每個 token 的 log probability，
+    滑動視窗、批次補齊與統計量彙總都在提取器中完成，因此各後端的特徵定義一致。
+    
+    token_log_probs 必須可由多個執行緒同時呼叫 (torch 推論、ONNX Runtime 與 n-gram 查表
+    本身即可並行)；共用的 tokenizer 以 _tokenizer_lock 保護。
+    
+    子類別需提供：
+        encode(text)                 文本 → token id 列表
+        decode_tokens(ids)           token id → 各 token 的顯示字串 (逐 token 熱力圖使用)
+        token_log_probs(ids, mask)   (batch, seq_len) → (batch, seq_len - 1) 的自然對數機率
+        model_id                     影響特徵數值的模型識別 (納入特徵快取鍵)
+        config()                     重建後端所需的建構參數 (工作行程使用)
+        max_positions / pad_id       一次可評分的最大 token 數 / 補齊用的 token id
+    """
+    
+    max_positions: int = 1024
+    pad_id: int = 0
+    
+    def encode(self, text: str) -> List[int]:
+        raise NotImplementedError
+    
+    def decode_tokens(self, ids: List[int]) -> List[str]:
+        raise NotImplementedError
+    
+    def token_log_probs(self, input_ids: np.ndarray, attention_mask: np.ndarray = None) -> np.ndarray:
+        raise NotImplementedError
+    
+    @property
+    def model_id(self) -> str:
+        raise NotImplementedError
+    
+    def config(self) -> Dict:
+        raise NotImplementedError
+
+
+def _torch_token_log_probs(logits: 'torch.Tensor', input_ids: 'torch.Tensor') -> np.ndarray:
+    """由 (batch, seq_len, vocab) logits 取出每個 token 的 log probability"""
+    import torch
+    
+    logits = logits[:, :-1, :].float()
+    targets = input_ids[:, 1:].unsqueeze(-1)
+    # log_softmax(x)[t] = x[t] - logsumexp(x)，避免再配置一份 vocab 大小的張量
+    token_logits = logits.gather(-1, targets).squeeze(-1)
+    return (token_logits - torch.logsumexp(logits, dim=-1)).cpu().numpy()
+
+
+def _numpy_token_log_probs(logits: np.ndarray, input_ids: np.ndarray) -> np.ndarray:
+    """_torch_token_log_probs 的 NumPy 版本 (ONNX Runtime 輸出)"""
+    logits = logits[:, :-1, :].astype(np.float32, copy=False)
+    targets = input_ids[:, 1:, None]
+    token_logits = np.take_along_axis(logits, targets, axis=-1)[..., 0]
+    peak = logits.max(axis=-1, keepdims=True)
+    logsumexp = peak[..., 0] + np.log(np.exp(logits - peak).sum(axis=-1))
+    return (token_logits - logsumexp).astype(np.float32)
+
+
+def _pad_id(tokenizer) -> int:
+    """補齊用的 token id (GPT-2 沒有 pad token，改用 eos)"""
+    if tokenizer.pad_token_id is not None:
+        return tokenizer.pad_token_id
+    return tokenizer.eos_token_id or 0
+
+
+class TransformersBackend(LanguageModelBackend):
+    """Hugging Face 因果語言模型 (預設後端)，權重由模型登錄表共用"""
+    
+    def __init__(self, model_name: str = "distilgpt2", device: str = None, local_files_only: bool = False,
+                 precision: str = 'fp32'):
+        """
+        Args:
+            model_name: 模型名稱或本地路徑
+            device: 目標裝置 (預設 CUDA 可用時用 CUDA，否則 CPU)
+            local_files_only: 只從本地檔案載入模型 (離線模型包使用)
+            precision: 推論精度 ('fp32'、'bf16' 或 'int8')
+        """
+        import torch
+        
+        self.model_name = model_name
+        self.local_files_only = local_files_only
+        self.precision = precision
+        self.device = torch.device(device) if device else torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        
+        self.tokenizer, self.model = get_language_model(
+            model_name, self.device, local_files_only=local_files_only, precision=precision
+        )
+        self.max_positions = getattr(self.model.config, 'n_positions', None) or 1024
+        self.pad_id = _pad_id(self.tokenizer)
+    
+    def encode(self, text: str) -> List[int]:
+        with _tokenizer_lock:
+            return self.tokenizer.encode(text)
+    
+    def decode_tokens(self, ids: List[int]) -> List[str]:
+        with _tokenizer_lock:
+            return [self.tokenizer.decode([token_id]) for token_id in ids]
+    
+    def token_log_probs(self, input_ids: np.ndarray, attention_mask: np.ndarray = None) -> np.ndarray:
+        import torch
+        
+        ids = torch.from_numpy(input_ids).to(self.device)
+        mask = torch.from_numpy(attention_mask).to(self.device) if attention_mask is not None else None
+        with torch.no_grad():
+            logits = self.model(ids, attention_mask=mask).logits
+            return _torch_token_log_probs(logits, ids)
+    
+    @property
+    def model_id(self) -> str:
+        if self.precision != 'fp32':
+            return f"{self.model_name}|precision={self.precision}"
+        return self.model_name
+    
+    def config(self) -> Dict:
+        return {
+            'model_name': self.model_name,
+            'device': str(self.device),
+            'local_files_only': self.local_files_only,
+            'precision': self.precision,
+        }
+
+
+class _ExportedGraphBackend(LanguageModelBackend):
+    """export_graph() 匯出的計算圖目錄 (含 tokenizer 與 backend.json)"""
+    
+    graph_format = None
+    
+    def __init__(self, path: str):
+        """
+        Args:
+            path: 匯出目錄
+        """
+        from transformers import AutoTokenizer
+        
+        self.path = Path(path)
+        with open(self.path / BACKEND_META_FILE, 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta['format'] != self.graph_format:
+            raise ValueError(f"{path} contains a {self.meta['format']} graph, not {self.graph_format}")
+        
+        self.tokenizer = AutoTokenizer.from_pretrained(str(self.path), local_files_only=True)
+        self.max_positions = self.meta['max_positions']
+        self.pad_id = _pad_id(self.tokenizer)
+    
+    def encode(self, text: str) -> List[int]:
+        with _tokenizer_lock:
+            return self.tokenizer.encode(text)
+    
+    def decode_tokens(self, ids: List[int]) -> List[str]:
+        with _tokenizer_lock:
+            return [self.tokenizer.decode([token_id]) for token_id in ids]
+    
+    @property
+    def model_id(self) -> str:
+        return f"{self.graph_format}:{self.meta['source']}"
+    
+    def config(self) -> Dict:
+        return {'path': str(self.path)}
+
+
+class TorchScriptBackend(_ExportedGraphBackend):
+    """以 torch.jit 追蹤後的模型評分，不需 transformers 的模型類別"""
+    
+    graph_format = 'torchscript'
+    
+    def __init__(self, path: str):
+        import torch
+        
+        super().__init__(path)
+        self.module = torch.jit.load(str(self.path / TORCHSCRIPT_FILE), map_location='cpu')
+        self.module.eval()
+    
+    def token_log_probs(self, input_ids: np.ndarray, attention_mask: np.ndarray = None) -> np.ndarray:
+        import torch
+        
+        ids = torch.from_numpy(input_ids)
+        mask = torch.from_numpy(attention_mask) if attention_mask is not None else torch.ones_like(ids)
+        with torch.no_grad():
+            return _torch_token_log_probs(self.module(ids, mask), ids)
+
+
+class OnnxBackend(_ExportedGraphBackend):
+    """以 ONNX Runtime 執行匯出的模型 (需安裝 onnxruntime)"""
+    
+    graph_format = 'onnx'
+    
+    def __init__(self, path: str):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("OnnxBackend requires onnxruntime (pip install onnxruntime)")
+        
+        super().__init__(path)
+        self.session = onnxruntime.InferenceSession(
+            str(self.path / ONNX_FILE), providers=['CPUExecutionProvider']
+        )
+    
+    def token_log_probs(self, input_ids: np.ndarray, attention_mask: np.ndarray = None) -> np.ndarray:
+        input_ids = input_ids.astype(np.int64, copy=False)
+        if attention_mask is None:
+            attention_mask = np.ones_like(input_ids)
+        logits = self.session.run(
+            ['logits'], {'input_ids': input_ids, 'attention_mask': attention_mask.astype(np.int64, copy=False)}
+        )[0]
+        return _numpy_token_log_probs(logits, input_ids)
+
+
+def export_graph(model_name: str, output_dir: str, graph_format: str = 'torchscript',
+                 local_files_only: bool = False) -> Path:
+    """
+    將 Hugging Face 因果語言模型匯出為 TorchScript 或 ONNX 計算圖
+    
+    Args:
+        model_name: 模型名稱或本地路徑
+        output_dir: 輸出目錄 (tokenizer、計算圖與 backend.json)
+        graph_format: 'torchscript' 或 'onnx'
+        local_files_only: 只從本地檔案載入模型
+    
+    Returns:
+        輸出目錄
+    """
+    import torch
+    from transformers import AutoTokenizer, AutoModelForCausalLM
+    
+    if graph_format not in ('torchscript', 'onnx'):
+        raise ValueError(f"graph_format must be 'torchscript' or 'onnx', got {graph_format!r}")
+    
+    class _LogitsOnly(torch.nn.Module):
+        """只輸出 logits 的包裝，讓追蹤與匯出得到單一張量輸出"""
+        
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+        
+        def forward(self, input_ids, attention_mask):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask, use_cache=False).logits
+    
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    
+    tokenizer = AutoTokenizer.from_pretrained(model_name, local_files_only=local_files_only)
+    model = AutoModelForCausalLM.from_pretrained(model_name, local_files_only=local_files_only)
+    model.eval()
+    wrapper = _LogitsOnly(model).eval()
+    
+    example_ids = torch.tensor([tokenizer.encode("An example sentence used for tracing the model.")])
+    example_mask = torch.ones_like(example_ids)
+    
+    with torch.no_grad():
+        if graph_format == 'torchscript':
+            traced = torch.jit.trace(wrapper, (example_ids, example_mask), check_trace=False)
+            traced.save(str(output_dir / TORCHSCRIPT_FILE))
+        else:
+            dynamic = {0: 'batch', 1: 'sequence'}
+            torch.onnx.export(
+                wrapper, (example_ids, example_mask), str(output_dir / ONNX_FILE),
+                input_names=['input_ids', 'attention_mask'], output_names=['logits'],
+                dynamic_axes={'input_ids': dynamic, 'attention_mask': dynamic, 'logits': dynamic},
+                opset_version=17, dynamo=False,
+            )
+    
+    tokenizer.save_pretrained(str(output_dir))
+    meta = {
+        'format': graph_format,
+        'source': model_name,
+        'max_positions': getattr(model.config, 'n_positions', None) or 1024,
+    }
+    with open(output_dir / BACKEND_META_FILE, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    
+    print(f"Exported {model_name} as {graph_format} to {output_dir}")
+    return output_dir
+
+
+# ===== n-gram 語言模型 =====
+
+NGRAM_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+BOS, EOS, UNK = '<s>', '</s>', '<unk>'
+
+
+def ngram_tokenize(text: str) -> List[str]:
+    """n-gram 模型的斷詞：小寫後切成單詞與標點"""
+    return NGRAM_TOKEN_RE.findall(text.lower())
+
+
+def _open_arpa(path: Path, mode: str):
+    """開啟 ARPA 檔 (.gz 自動解壓)"""
+    if path.suffix == '.gz':
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def train_ngram_model(texts: Iterable[str], output_path: str, order: int = 3) -> Path:
+    """
+    從語料訓練插值 Witten-Bell n-gram 模型，並寫成 ARPA 格式 (與 KenLM 等工具相容)
+    
+    P(w|h) = (c(h,w) + T(h)·P(w|h')) / (c(h) + T(h))，T(h) 為 h 之後出現過的相異詞數；
+    退回權重 T(h) / (c(h) + T(h)) 即為未見詞分到的機率質量，因此可直接寫成退回式模型。
+    
+    Args:
+        texts: 訓練文本
+        output_path: ARPA 檔路徑 (.arpa 或 .arpa.gz)
+        order: n-gram 階數
+    
+    Returns:
+        輸出路徑
+    """
+    counts = [Counter() for _ in range(order + 1)]  # counts[k]: k-gram 次數
+    for text in texts:
+        tokens = [BOS] + ngram_tokenize(text) + [EOS]
+        for k in range(1, order + 1):
+            for i in range(len(tokens) - k + 1):
+                counts[k][tuple(tokens[i:i + k])] += 1
+    
+    # 一元：加一平滑，<unk> 取得未見詞的機率；<s> 不會被預測
+    unigram_counts = counts[1]
+    vocab = [w for (w,) in unigram_counts if w != BOS] + [UNK]
+    total = sum(c for (w,), c in unigram_counts.items() if w != BOS)
+    log_probs = {(w,): math.log10((unigram_counts.get((w,), 0) + 1) / (total + len(vocab))) for w in vocab}
+    log_probs[(BOS,)] = -99.0
+    backoffs = {}
+    
+    def lookup(context: Tuple, word: str) -> float:
+        """目前已計算的各階機率下的退回式 log10 P(word | context)"""
+        bow = 0.0
+        for start in range(len(context) + 1):
+            prob = log_probs.get(context[start:] + (word,))
+            if prob is not None:
+                return bow + prob
+            bow += backoffs.get(context[start:], 0.0)
+        return bow + log_probs[(UNK,)]
+    
+    for k in range(2, order + 1):
+        followers = defaultdict(list)
+        for ngram, count in counts[k].items():
+            followers[ngram[:-1]].append((ngram[-1], count))
+        
+        new_probs = {}
+        for context, words in followers.items():
+            context_count = sum(count for _, count in words)
+            types = len(words)
+            denominator = context_count + types
+            for word, count in words:
+                lower = 10 ** lookup(context[1:], word)
+                new_probs[context + (word,)] = math.log10((count + types * lower) / denominator)
+            backoffs[context] = math.log10(types / denominator)
+        log_probs.update(new_probs)
+    
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    by_order = defaultdict(list)
+    for ngram in log_probs:
+        by_order[len(ngram)].append(ngram)
+    
+    with _open_arpa(output_path, 'w') as f:
+        f.write("\n\\data\\\n")
+        for k in range(1, order + 1):
+            f.write(f"ngram {k}={len(by_order[k])}\n")
+        for k in range(1, order + 1):
+            f.write(f"\n\\{k}-grams:\n")
+            for ngram in sorted(by_order[k]):
+                line = f"{log_probs[ngram]:.6f}\t{' '.join(ngram)}"
+                if ngram in backoffs:
+                    line += f"\t{backoffs[ngram]:.6f}"
+                f.write(line + "\n")
+        f.write("\n\\end\\\n")
+    
+    print(f"n-gram model ({order}-gram, {len(vocab)} words) written to {output_path}")
+    return output_path
+
+
+class NgramBackend(LanguageModelBackend):
+    """
+    ARPA 格式的退回式 n-gram 模型 (train_ngram_model 或 KenLM lmplz 產生)
+    
+    評分只需查表，不做矩陣運算，適合毫秒級的延遲需求。文本前補上 <s>，
+    因此第一個詞也會被評分；模型沒有長度上限，不需要滑動視窗。
+    """
+    
+    max_positions = 2 ** 31 - 1
+    
+    def __init__(self, path: str):
+        """
+        Args:
+            path: ARPA 檔路徑 (.arpa 或 .arpa.gz)
+        """
+        self.path = Path(path)
+        self.order = 0
+        words: Dict[Tuple[str, ...], Tuple[float, float]] = {}
+        
+        with _open_arpa(self.path, 'r') as f:
+            section = 0
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('ngram ') or line in ('\\data\\', '\\end\\'):
+                    continue
+                if line.startswith('\\') and line.endswith('-grams:'):
+                    section = int(line[1:line.index('-')])
+                    self.order = max(self.order, section)
+                    continue
+                parts = line.split('\t')
+                if len(parts) == 1:
+                    parts = line.split()
+                    parts = [parts[0], ' '.join(parts[1:section + 1])] + parts[section + 1:]
+                backoff = float(parts[2]) if len(parts) > 2 else 0.0
+                words[tuple(parts[1].split(' '))] = (float(parts[0]), backoff)
+        
+        # 以整數 id 查表，比字串 tuple 更省記憶體
+        vocabulary = sorted({w for ngram in words for w in ngram})
+        self.vocab = {word: i for i, word in enumerate(vocabulary)}
+        self._words = vocabulary
+        self.bos_id = self.vocab[BOS]
+        self.unk_id = self.vocab.get(UNK)
+        self.pad_id = self.bos_id
+        self._log_probs = {}
+        self._backoffs = {}
+        for ngram, (log_prob, backoff) in words.items():
+            key = tuple(self.vocab[w] for w in ngram)
+            self._log_probs[key] = log_prob
+            if backoff:
+                self._backoffs[key] = backoff
+        self._unk_log_prob = self._log_probs.get((self.unk_id,), -99.0) if self.unk_id is not None else -99.0
+    
+    def encode(self, text: str) -> List[int]:
+        unk = self.unk_id if self.unk_id is not None else -1
+        return [self.bos_id] + [self.vocab.get(token, unk) for token in ngram_tokenize(text)]
+    
+    def decode_tokens(self, ids: List[int]) -> List[str]:
+        return [self._words[token_id] if token_id >= 0 else UNK for token_id in ids]
+    
+    def _score(self, context: Tuple[int, ...], word: int) -> float:
+        """退回式 log10 P(word | context)"""
+        bow = 0.0
+        for start in range(len(context) + 1):
+            prob = self._log_probs.get(context[start:] + (word,))
+            if prob is not None:
+                return bow + prob
+            bow += self._backoffs.get(context[start:], 0.0)
+        return bow + self._unk_log_prob
+    
+    def token_log_probs(self, input_ids: np.ndarray, attention_mask: np.ndarray = None) -> np.ndarray:
+        batch, seq_len = input_ids.shape
+        log_probs = np.zeros((batch, max(seq_len - 1, 0)), dtype=np.float32)
+        history = self.order - 1
+        for row in range(batch):
+            ids = input_ids[row].tolist()
+            length = int(attention_mask[row].sum()) if attention_mask is not None else seq_len
+            for i in range(1, length):
+                context = tuple(ids[max(0, i - history):i])
+                log_probs[row, i - 1] = self._score(context, ids[i]) * LN_10
+        return log_probs
+    
+    @property
+    def model_id(self) -> str:
+        stat = self.path.stat()
+        return f"ngram:{self.path.name}:{stat.st_size}:{stat.st_mtime_ns}"
+    
+    def config(self) -> Dict:
+        return {'path': str(self.path)}
+
+
+BACKENDS = {
+    'transformers': TransformersBackend,
+    'torchscript': TorchScriptBackend,
+    'onnx': OnnxBackend,
+    'ngram': NgramBackend,
+}
+
+
+def backend_from_spec(spec: str, **kwargs) -> LanguageModelBackend:
+    """
+    由 "種類:位置" 字串建立後端
+    
+    例如 "transformers:distilgpt2"、"torchscript:models/lm_ts"、"onnx:models/lm_onnx"、
+    "ngram:models/lm.arpa"；沒有種類前綴時視為 transformers 模型名稱。
+    
+    Args:
+        spec: 後端描述
+        **kwargs: 傳給 TransformersBackend 的其他參數 (例如 precision)
+    """
+    kind, _, location = spec.partition(':')
+    if kind not in BACKENDS or not location:
+        return TransformersBackend(spec, **kwargs)
+    if kind == 'transformers':
+        return TransformersBackend(location, **kwargs)
+    return BACKENDS[kind](location)
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Export graph backends or train an n-gram backend")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    export_parser = subparsers.add_parser('export', help="export a causal LM as TorchScript or ONNX")
+    export_parser.add_argument('output_dir')
+    export_parser.add_argument('--model', default='distilgpt2')
+    export_parser.add_argument('--format', choices=['torchscript', 'onnx'], default='torchscript')
+    
+    ngram_parser = subparsers.add_parser('train-ngram', help="train an ARPA n-gram model from a dataset")
+    ngram_parser.add_argument('dataset')
+    ngram_parser.add_argument('output_path')
+    ngram_parser.add_argument('--order', type=int, default=3)
+    
+    args = parser.parse_args()
+    if args.command == 'export':
+        export_graph(args.model, args.output_dir, graph_format=args.format)
+    else:
+        from utils.data_manager import load_dataset
+        train_ngram_model((item['text'] for item in load_dataset(args.dataset)), args.output_path, args.order)
@@ -0,0 +1,196 @@
+"""
+微批次排程模組 - 將多個執行緒同時送出的單篇困惑度請求合併成一次補齊的前向傳播
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List
+
+import numpy as np
+
+from utils.lm_backends import LanguageModelBackend
+
+
+class _Request:
+    """排隊中的單篇評分請求"""
+    
+    __slots__ = ('input_ids', 'future')
+    
+    def __init__(self, input_ids: np.ndarray):
+        self.input_ids = input_ids
+        self.future = Future()
+
+
+class MicroBatcher(LanguageModelBackend):
+    """
+    在評分後端前加上動態微批次
+    
+    單篇 (batch = 1) 的 token_log_probs 呼叫會排入佇列，由背景排程執行緒收集：
+    從第一個請求起最多等待 max_wait_ms，或補齊後的 token 數 (篇數 × 最長長度)
+    將超過 max_batch_tokens 時即送出，以右側補齊加 attention mask 做一次前向傳播，
+    再把各自的結果交回呼叫端。因果注意力下右側補齊不影響真實 token 的 logits，
+    所以結果與逐篇計算相同 (僅有浮點誤差)。
+    
+    本身也是 LanguageModelBackend，可直接傳給 FeatureExtractor(backend=...)，
+    或以 FeatureExtractor.enable_micro_batching() 包住既有的後端。
+    已經是多篇的呼叫 (例如 compute_perplexity_batch) 直接交給內部後端。
+    """
+    
+    def __init__(self, backend: LanguageModelBackend = None, max_wait_ms: float = 5.0,
+                 max_batch_tokens: int = 4096, max_batch_size: int = 32,
+                 backend_class: type = None, backend_config: Dict = None):
+        """
+        Args:
+            backend: 實際執行前向傳播的評分後端
+            max_wait_ms: 從批次中第一個請求起最多等待的毫秒數
+            max_batch_tokens: 每批補齊後的 token 數上限 (單篇超過上限時單獨執行)
+            max_batch_size: 每批最多的文本數
+            backend_class / backend_config: 未提供 backend 時以此重建 (工作行程使用，見 config())
+        """
+        self.backend = backend if backend is not None else backend_class(**backend_config)
+        self.max_wait_ms = max_wait_ms
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        
+        self.max_positions = self.backend.max_positions
+        self.pad_id = self.backend.pad_id
+        
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+        
+        # 統計：實際送出的批次數與合併的請求數
+        self.batches = 0
+        self.requests = 0
+    
+    def encode(self, text: str) -> List[int]:
+        return self.backend.encode(text)
+    
+    def decode_tokens(self, ids: List[int]) -> List[str]:
+        return self.backend.decode_tokens(ids)
+    
+    @property
+    def model_id(self) -> str:
+        # 微批次不改變特徵數值，與內部後端共用快取鍵
+        return self.backend.model_id
+    
+    def config(self) -> Dict:
+        return {
+            'backend_class': type(self.backend),
+            'backend_config': self.backend.config(),
+            'max_wait_ms': self.max_wait_ms,
+            'max_batch_tokens': self.max_batch_tokens,
+            'max_batch_size': self.max_batch_size,
+        }
+    
+    def token_log_probs(self, input_ids: np.ndarray, attention_mask: np.ndarray = None) -> np.ndarray:
+        """單篇請求經由排程器合併；多篇或帶 mask 的請求直接執行"""
+        if input_ids.shape[0] != 1 or input_ids.shape[1] < 2 or attention_mask is not None:
+            return self.backend.token_log_probs(input_ids, attention_mask)
+        
+        request = _Request(input_ids[0])
+        self._submit(request)
+        return request.future.result()[None, :]
+    
+    def stats(self) -> Dict:
+        """合併效果統計"""
+        return {
+            'batches': self.batches,
+            'requests': self.requests,
+            'mean_batch_size': self.requests / self.batches if self.batches else 0.0,
+        }
+    
+    def close(self):
+        """
+        停止排程執行緒：結束訊號之前排入的請求仍會完成，之後的提交會拋出 RuntimeError，
+        排程執行緒結束後仍留在佇列中的請求一律以 RuntimeError 結束，呼叫端不會永遠等待
+        """
+        with self._start_lock:
+            self._closed = True
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join()
+                self._thread = None
+        
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is not None:
+                request.future.set_exception(RuntimeError("MicroBatcher is closed"))
+    
+    def _submit(self, request: _Request):
+        """將請求排入佇列 (第一次使用時才啟動排程執行緒)"""
+        # 在鎖內檢查與排入，確保請求不會排在 close() 的結束訊號之後
+        with self._start_lock:
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+                self._thread.start()
+            self._queue.put(request)
+    
+    def _run(self):
+        """排程迴圈：收集一批請求後執行，直到收到結束訊號 (None)"""
+        carry = None
+        while True:
+            first = carry if carry is not None else self._queue.get()
+            carry = None
+            if first is None:
+                return
+            
+            batch = [first]
+            max_len = len(first.input_ids)
+            deadline = time.perf_counter() + self.max_wait_ms / 1000
+            stop = False
+            
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                new_max = max(max_len, len(request.input_ids))
+                if new_max * (len(batch) + 1) > self.max_batch_tokens:
+                    # 加入後會超過 token 上限：留到下一批
+                    carry = request
+                    break
+                batch.append(request)
+                max_len = new_max
+            
+            self._execute(batch, max_len)
+            if stop:
+                return
+    
+    def _execute(self, batch: List[_Request], max_len: int):
+        """以一次補齊的前向傳播評分整批請求，並將結果分送給各呼叫端"""
+        input_ids = np.full((len(batch), max_len), self.pad_id, dtype=np.int64)
+        attention_mask = np.zeros((len(batch), max_len), dtype=np.int64)
+        for row, request in enumerate(batch):
+            length = len(request.input_ids)
+            input_ids[row, :length] = request.input_ids
+            attention_mask[row, :length] = 1
+        
+        try:
+            if len(batch) == 1:
+                log_probs = self.backend.token_log_probs(input_ids)
+            else:
+                log_probs = self.backend.token_log_probs(input_ids, attention_mask)
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+        
+        self.batches += 1
+        self.requests += len(batch)
+        for row, request in enumerate(batch):
+            request.future.set_result(log_probs[row, :len(request.input_ids) - 1])
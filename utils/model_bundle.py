@@ -0,0 +1,257 @@
+"""
+離線模型包模組 - 將語言模型、tokenizer、NLTK 資料與分類器打包成附雜湊清單的單一目錄
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from utils.feature_extractor import FeatureExtractor, FEATURE_VERSION
+
+
+BUNDLE_FORMAT = 1
+MANIFEST_FILE = 'manifest.json'
+LM_DIR = 'lm'
+NLTK_DIR = 'nltk_data'
+CLASSIFIER_FILE = 'classifier.pkl'
+
+# 各 NLTK 資源的候選路徑：新版 NLTK 讀取 punkt_tab / *_eng，舊版讀取 punkt 等。
+# 找到的路徑全部打包，每組至少要有一個。
+NLTK_BUNDLE_RESOURCES = {
+    'sentence_tokenizer': ('tokenizers/punkt_tab', 'tokenizers/punkt'),
+    'pos_tagger': ('taggers/averaged_perceptron_tagger_eng', 'taggers/averaged_perceptron_tagger'),
+    'stopwords': ('corpora/stopwords',),
+}
+
+
+def _sha256(path: Path) -> str:
+    """以 1 MB 區塊串流計算檔案的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _copy_nltk_resources(target: Path) -> Dict[str, list]:
+    """
+    將目前環境中的 NLTK 資源複製到模型包
+    
+    Args:
+        target: 模型包內的 nltk_data 目錄
+    
+    Returns:
+        {資源類別: [已打包的資源路徑]}
+    """
+    import nltk
+    
+    copied = {}
+    for group, candidates in NLTK_BUNDLE_RESOURCES.items():
+        copied[group] = []
+        for resource_path in candidates:
+            try:
+                found = Path(str(nltk.data.find(resource_path)))
+            except LookupError:
+                continue
+            
+            # 資源可能是解壓後的目錄或 zip 內的路徑；zip 內時複製整個 zip 檔
+            if found.is_dir():
+                shutil.copytree(found, target / resource_path)
+            else:
+                archive = next(p for p in found.parents if p.suffix == '.zip')
+                destination = target / Path(resource_path).parent / archive.name
+                destination.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(archive, destination)
+            copied[group].append(resource_path)
+        
+        if not copied[group]:
+            raise FileNotFoundError(
+                f"NLTK resource for {group} not found (tried {', '.join(candidates)}); "
+                f"download it before building the bundle"
+            )
+    return copied
+
+
+def build_bundle(bundle_dir: str, model_name: str = "distilgpt2",
+                 classifier_path: str = "models/ai_detector_model.pkl") -> Dict:
+    """
+    建立離線模型包
+    
+    權重以 safetensors 格式儲存，載入時可直接記憶體映射。先寫入暫存目錄，
+    manifest.json 最後寫入後再整個改名，因此中斷的建立不會留下看似完整的模型包。
+    
+    Args:
+        bundle_dir: 輸出目錄 (不可已存在)
+        model_name: 語言模型名稱或本地路徑
+        classifier_path: 已訓練的分類器 (不存在時模型包只含特徵提取所需的檔案)
+    
+    Returns:
+        清單內容
+    """
+    from transformers import AutoTokenizer, AutoModelForCausalLM
+    
+    bundle_dir = Path(bundle_dir)
+    if bundle_dir.exists():
+        raise FileExistsError(f"Bundle directory already exists: {bundle_dir}")
+    
+    staging = bundle_dir.with_name(bundle_dir.name + '.partial')
+    if staging.exists():
+        shutil.rmtree(staging)
+    staging.mkdir(parents=True)
+    
+    print(f"Packing language model {model_name}...")
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForCausalLM.from_pretrained(model_name)
+    tokenizer.save_pretrained(staging / LM_DIR)
+    model.save_pretrained(staging / LM_DIR, safe_serialization=True)
+    
+    print("Packing NLTK data...")
+    nltk_resources = _copy_nltk_resources(staging / NLTK_DIR)
+    
+    classifier = None
+    if classifier_path and Path(classifier_path).exists():
+        shutil.copy2(classifier_path, staging / CLASSIFIER_FILE)
+        classifier = CLASSIFIER_FILE
+    else:
+        print(f"Warning: classifier {classifier_path} not found, bundle will not include one")
+    
+    files = {}
+    for path in sorted(staging.rglob('*')):
+        if path.is_file():
+            relative = path.relative_to(staging).as_posix()
+            files[relative] = {'sha256': _sha256(path), 'bytes': path.stat().st_size}
+    
+    # 模型包版本 = 所有檔案雜湊的雜湊，內容相同的模型包版本相同
+    bundle_id = hashlib.sha256(
+        ''.join(f"{name}\0{entry['sha256']}\n" for name, entry in files.items()).encode('utf-8')
+    ).hexdigest()[:16]
+    
+    manifest = {
+        'format': BUNDLE_FORMAT,
+        'bundle_id': bundle_id,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'model_name': model_name,
+        'feature_version': FEATURE_VERSION,
+        'classifier': classifier,
+        'nltk_resources': nltk_resources,
+        'files': files,
+    }
+    with open(staging / MANIFEST_FILE, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    
+    staging.rename(bundle_dir)
+    total_mb = sum(entry['bytes'] for entry in files.values()) / 2**20
+    print(f"Bundle {bundle_id} written to {bundle_dir} ({len(files)} files, {total_mb:.1f} MB)")
+    return manifest
+
+
+class ModelBundle:
+    """
+    已建立的離線模型包 (唯讀)
+    
+    開啟時依清單驗證每個檔案的大小與 SHA-256；之後建立的特徵提取器與
+    偵測器只從模型包讀取，不連網、不使用 HF 快取，也不下載 NLTK 資源。
+    """
+    
+    def __init__(self, bundle_dir: str, verify: bool = True):
+        """
+        開啟模型包
+        
+        Args:
+            bundle_dir: 模型包目錄
+            verify: 是否驗證檔案雜湊 (大小一律檢查)
+        """
+        self.path = Path(bundle_dir)
+        with open(self.path / MANIFEST_FILE, 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        
+        if self.manifest.get('format') != BUNDLE_FORMAT:
+            raise ValueError(f"Unsupported bundle format: {self.manifest.get('format')}")
+        if self.manifest['feature_version'] != FEATURE_VERSION:
+            raise ValueError(
+                f"Bundle was built for feature version {self.manifest['feature_version']}, "
+                f"this code expects {FEATURE_VERSION}"
+            )
+        
+        self.verify(check_hashes=verify)
+        
+        self.bundle_id: str = self.manifest['bundle_id']
+        self.lm_path = self.path / LM_DIR
+        self.nltk_path = self.path / NLTK_DIR
+        self.classifier_path: Optional[Path] = (
+            self.path / self.manifest['classifier'] if self.manifest['classifier'] else None
+        )
+    
+    def verify(self, check_hashes: bool = True):
+        """
+        依清單檢查檔案是否齊全、未被修改
+        
+        Args:
+            check_hashes: 是否重新計算 SHA-256 (False 時只比對大小)
+        """
+        for relative, entry in self.manifest['files'].items():
+            path = self.path / relative
+            if not path.is_file():
+                raise FileNotFoundError(f"Bundle file missing: {relative}")
+            if path.stat().st_size != entry['bytes']:
+                raise ValueError(f"Bundle file size mismatch: {relative}")
+            if check_hashes and _sha256(path) != entry['sha256']:
+                raise ValueError(f"Bundle file hash mismatch: {relative}")
+    
+    def activate(self):
+        """讓本行程只從模型包讀取 NLTK 資料，並停用 Hugging Face 的網路存取"""
+        from utils.text_analysis import use_nltk_data
+        
+        os.environ['HF_HUB_OFFLINE'] = '1'
+        os.environ['TRANSFORMERS_OFFLINE'] = '1'
+        use_nltk_data(str(self.nltk_path))
+    
+    def create_feature_extractor(self, **kwargs) -> FeatureExtractor:
+        """
+        建立從模型包載入語言模型的特徵提取器
+        
+        Args:
+            **kwargs: 傳給 FeatureExtractor 的其他參數 (例如 cache)
+        """
+        self.activate()
+        return FeatureExtractor(model_name=str(self.lm_path), local_files_only=True, **kwargs)
+    
+    def create_detector(self, feature_extractor: FeatureExtractor = None):
+        """
+        建立使用模型包分類器的偵測器
+        
+        Args:
+            feature_extractor: 共用的特徵提取器 (省略時從模型包建立)
+        """
+        from models.ai_detector import AIDetector
+        
+        if self.classifier_path is None:
+            raise FileNotFoundError(f"Bundle {self.bundle_id} does not include a classifier")
+        extractor = feature_extractor or self.create_feature_extractor()
+        return AIDetector(model_path=str(self.classifier_path), feature_extractor=extractor)
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Build or verify an offline model bundle")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    build_parser = subparsers.add_parser('build', help="pack model, tokenizer, NLTK data and classifier")
+    build_parser.add_argument('bundle_dir')
+    build_parser.add_argument('--model', default='distilgpt2')
+    build_parser.add_argument('--classifier', default='models/ai_detector_model.pkl')
+    
+    verify_parser = subparsers.add_parser('verify', help="check every file against the manifest")
+    verify_parser.add_argument('bundle_dir')
+    
+    args = parser.parse_args()
+    if args.command == 'build':
+        build_bundle(args.bundle_dir, model_name=args.model, classifier_path=args.classifier)
+    else:
+        bundle = ModelBundle(args.bundle_dir)
+        print(f"Bundle {bundle.bundle_id} OK ({len(bundle.manifest['files'])} files)")
@@ -0,0 +1,188 @@
+"""
+模型登錄模組 - 每個語言模型在行程內只載入一次，所有使用者共用同一份權重
+"""
+
+import threading
+from typing import Dict, Tuple
+
+# torch 與 transformers 在第一次載入模型時才匯入，匯入本模組本身不需付出這段成本
+
+
+# 推論精度：fp32 為原始權重；bf16 將權重轉為 bfloat16；
+# int8 對所有線性層做動態 int8 量化 (僅 CPU)
+PRECISIONS = ('fp32', 'bf16', 'int8')
+
+_registry: Dict[Tuple[str, str, str], Tuple] = {}
+_registry_lock = threading.Lock()
+_load_locks: Dict[Tuple[str, str, str], threading.Lock] = {}
+
+
+def _model_tensors(model: 'torch.nn.Module') -> list:
+    """模型的參數、buffer 與量化後打包的權重 (共用儲存空間的張量只算一次)"""
+    tensors = list(model.parameters()) + list(model.buffers())
+    for module in model.modules():
+        # 動態量化的 Linear 不再以 parameter 形式保存權重
+        weight_bias = getattr(module, '_weight_bias', None)
+        if callable(weight_bias):
+            tensors.extend(t for t in weight_bias() if t is not None)
+    
+    unique = {}
+    for t in tensors:
+        unique.setdefault((t.data_ptr(), t.numel(), t.dtype), t)
+    return list(unique.values())
+
+
+def _model_nbytes(model: 'torch.nn.Module') -> int:
+    """計算模型參數與 buffer 佔用的位元組數"""
+    return sum(t.numel() * t.element_size() for t in _model_tensors(model))
+
+
+def _conv1d_to_linear(model: 'torch.nn.Module'):
+    """
+    將 GPT-2 的 Conv1D 投影層換成等價的 nn.Linear
+    
+    Conv1D 計算 x @ W + b (W 的形狀為 in × out)，數學上與權重轉置後的
+    Linear 相同；轉換後動態量化才會涵蓋注意力與 MLP 層。
+    """
+    import torch
+    from transformers.pytorch_utils import Conv1D
+    
+    for module in list(model.modules()):
+        for child_name, child in list(module.named_children()):
+            if isinstance(child, Conv1D):
+                in_features, out_features = child.weight.shape
+                linear = torch.nn.Linear(in_features, out_features)
+                linear.weight.data = child.weight.data.t().contiguous()
+                linear.bias.data = child.bias.data
+                setattr(module, child_name, linear)
+
+
+def _apply_precision(model: 'torch.nn.Module', precision: str, device: 'torch.device') -> 'torch.nn.Module':
+    """
+    依推論精度轉換已載入的模型
+    
+    Args:
+        model: fp32 模型 (eval 模式)
+        precision: PRECISIONS 之一
+        device: 模型所在裝置
+    
+    Returns:
+        轉換後的模型
+    """
+    import torch
+    
+    if precision == 'bf16':
+        return model.to(torch.bfloat16)
+    if precision == 'int8':
+        if device.type != 'cpu':
+            raise ValueError("int8 dynamic quantisation is only supported on CPU")
+        _conv1d_to_linear(model)
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def configure_torch_threads(intra_op: int = None, inter_op: int = None) -> Dict[str, int]:
+    """
+    設定本行程 torch 的 intra-op / inter-op 執行緒數
+    
+    torch 預設每個行程使用與 CPU 核心數相同的 intra-op 執行緒；同一台機器上
+    有多個推論執行緒或工作行程時，應讓 (並行請求數 × intra_op) 約等於核心數，
+    否則執行緒互相搶占，總吞吐量反而下降。inter-op 執行緒數只能在 torch
+    開始平行運算前設定一次，之後的設定會被忽略並印出警告。
+    
+    Args:
+        intra_op: 單一運算子內的執行緒數 (None 表示不變)
+        inter_op: 運算子之間的執行緒數 (None 表示不變)
+    
+    Returns:
+        設定後的 {'intra_op': ..., 'inter_op': ...}
+    """
+    import torch
+    
+    if intra_op is not None:
+        torch.set_num_threads(max(1, intra_op))
+    if inter_op is not None and inter_op != torch.get_num_interop_threads():
+        try:
+            torch.set_num_interop_threads(max(1, inter_op))
+        except RuntimeError as e:
+            print(f"Warning: could not set inter-op threads: {e}")
+    return {'intra_op': torch.get_num_threads(), 'inter_op': torch.get_num_interop_threads()}
+
+
+def get_language_model(model_name: str, device: 'torch.device' = None, local_files_only: bool = False,
+                       precision: str = 'fp32') -> Tuple:
+    """
+    取得共用的 tokenizer 與語言模型
+    
+    第一次請求時才載入 (lazy)，之後直接回傳同一份參考。每個鍵有獨立的
+    載入鎖，多個執行緒同時請求同一模型時只會載入一次，且不會阻塞
+    其他模型的載入。
+    
+    Args:
+        model_name: 模型名稱或本地路徑
+        device: 目標裝置 (預設 CUDA 可用時用 CUDA，否則 CPU)
+        local_files_only: 只從本地檔案載入，不連線到 Hugging Face Hub
+        precision: 推論精度 ('fp32'、'bf16' 或 'int8')，不同精度各自載入一份
+    
+    Returns:
+        (tokenizer, model)，model 已設為 eval 模式
+    """
+    import torch
+    
+    if precision not in PRECISIONS:
+        raise ValueError(f"precision must be one of {PRECISIONS}, got {precision!r}")
+    if device is None:
+        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    key = (model_name, str(device), precision)
+    
+    entry = _registry.get(key)
+    if entry is not None:
+        return entry
+    
+    with _registry_lock:
+        load_lock = _load_locks.setdefault(key, threading.Lock())
+    
+    with load_lock:
+        entry = _registry.get(key)
+        if entry is None:
+            from transformers import AutoTokenizer, AutoModelForCausalLM
+            
+            print(f"Loading model {model_name} ({precision})...")
+            tokenizer = AutoTokenizer.from_pretrained(model_name, local_files_only=local_files_only)
+            model = AutoModelForCausalLM.from_pretrained(model_name, local_files_only=local_files_only)
+            model.to(device)
+            model.eval()
+            model = _apply_precision(model, precision, device)
+            
+            entry = (tokenizer, model)
+            _registry[key] = entry
+            print(f"Model {model_name} loaded ({precision}, {_model_nbytes(model) / 2**20:.1f} MB)")
+    
+    return entry
+
+
+def memory_report() -> Dict[str, Dict]:
+    """
+    回報已載入模型的記憶體用量
+    
+    Returns:
+        {"模型名稱@裝置[/精度]": {'parameters': 參數數量, 'bytes': 位元組數, 'megabytes': MB}}
+    """
+    report = {}
+    for (model_name, device, precision), (tokenizer, model) in list(_registry.items()):
+        tensors = _model_tensors(model)
+        nbytes = sum(t.numel() * t.element_size() for t in tensors)
+        label = f"{model_name}@{device}" if precision == 'fp32' else f"{model_name}@{device}/{precision}"
+        report[label] = {
+            'parameters': sum(t.numel() for t in tensors),
+            'bytes': nbytes,
+            'megabytes': nbytes / 2**20,
+        }
+    return report
+
+
+def clear_registry():
+    """釋放所有已載入的模型 (之後的請求會重新載入)"""
+    with _registry_lock:
+        _registry.clear()
+        _load_locks.clear()
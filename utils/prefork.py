@@ -0,0 +1,249 @@
+"""
+預先分叉 (pre-fork) 工作行程模組 - 父行程載入一次模型，多個工作行程以 copy-on-write 共用權重
+
+父行程載入語言模型與分類器後再 fork，權重所在的記憶體分頁由所有工作行程共用，
+只有被寫入的分頁才會複製；推論不會寫入權重，因此每個工作行程的額外記憶體
+只有 Python 直譯器、暫存張量與自己的快取。僅支援提供 fork 的平台 (Linux / macOS)。
+"""
+
+import gc
+import multiprocessing
+import os
+import queue
+from typing import Dict, List
+
+# /proc/<pid>/smaps_rollup 中需要的欄位 (單位 kB)
+_SMAPS_FIELDS = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty')
+
+
+def process_memory(pid: int = None) -> Dict[str, float]:
+    """
+    讀取行程的記憶體用量 (MB)
+    
+    RSS 會把共用的分頁算進每個行程，無法反映實際成本；PSS 將共用分頁依共用的
+    行程數平均分攤，private 則是該行程獨有的分頁，即多開一個工作行程的真正代價。
+    
+    Args:
+        pid: 行程 id (預設為目前行程)
+    
+    Returns:
+        {'pid', 'rss_mb', 'pss_mb', 'shared_mb', 'private_mb'}；無法讀取 (非 Linux) 時數值為 None
+    """
+    pid = pid or os.getpid()
+    values = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup', 'r') as f:
+            for line in f:
+                name, _, rest = line.partition(':')
+                if name in _SMAPS_FIELDS:
+                    values[name] = int(rest.split()[0]) / 1024
+    except OSError:
+        return {'pid': pid, 'rss_mb': None, 'pss_mb': None, 'shared_mb': None, 'private_mb': None}
+    
+    return {
+        'pid': pid,
+        'rss_mb': values.get('Rss'),
+        'pss_mb': values.get('Pss'),
+        'shared_mb': values.get('Shared_Clean', 0.0) + values.get('Shared_Dirty', 0.0),
+        'private_mb': values.get('Private_Clean', 0.0) + values.get('Private_Dirty', 0.0),
+    }
+
+
+def prepare_for_fork(detector):
+    """
+    在父行程 fork 之前呼叫：預先載入所有共用資源並凍結垃圾回收
+    
+    - 預先載入 NLTK 詞性標註器，讓工作行程繼承而不必各自載入
+    - 關閉 tokenizers 的平行化 (fork 後的子行程無法使用父行程的執行緒池)
+    - gc.freeze() 把現有物件移出垃圾回收的追蹤範圍，避免回收器掃描時
+      寫入物件標頭，使共用分頁被逐一複製
+    
+    父行程在 fork 前不可執行任何前向傳播，否則 torch 已啟動的執行緒池
+    會讓子行程卡住。
+    
+    Args:
+        detector: 已載入模型的 AIDetector
+    """
+    from utils.text_analysis import get_pos_tagger
+    
+    os.environ.setdefault('TOKENIZERS_PARALLELISM', 'false')
+    get_pos_tagger()
+    
+    model = getattr(detector.feature_extractor.backend, 'model', None)
+    if model is not None:
+        model.eval()
+    
+    gc.collect()
+    gc.freeze()
+
+
+def reinitialize_after_fork(detector, torch_threads: int = None):
+    """
+    在工作行程 fork 之後呼叫：重建不能跨行程共用的資源
+    
+    SQLite 連線不能在 fork 後共用，特徵快取改由每個工作行程各自開啟；
+    torch 的 intra-op 執行緒數依工作行程數縮減，避免彼此搶占核心。
+    
+    Args:
+        detector: 從父行程繼承的 AIDetector
+        torch_threads: 每個工作行程的 torch intra-op 執行緒數 (None 表示不調整)
+    """
+    import sys
+    from utils.feature_cache import FeatureCache
+    
+    extractor = detector.feature_extractor
+    cache = extractor.cache
+    if cache is not None:
+        extractor.cache = FeatureCache(max_entries=cache.max_entries, db_path=cache.db_path)
+    
+    if torch_threads is not None and 'torch' in sys.modules:
+        from utils.model_registry import configure_torch_threads
+        configure_torch_threads(intra_op=torch_threads, inter_op=1)
+
+
+# 工作行程繼承的偵測器 (在 fork 之前由父行程設定)
+_shared_detector = None
+
+
+def _worker_loop(tasks, results, torch_threads: int):
+    """工作行程主迴圈：從任務佇列取出文本並回傳結果，收到 None 時結束"""
+    detector = _shared_detector
+    reinitialize_after_fork(detector, torch_threads)
+    
+    while True:
+        item = tasks.get()
+        if item is None:
+            return
+        task_id, kind, text = item
+        try:
+            if kind == 'predict' and detector.classifier is not None:
+                value = detector.predict(text)
+            elif kind == 'predict':
+                value = {'prediction': None, 'ai_probability': None,
+                         'extracted_features': detector.feature_extractor.extract_all_features(text)}
+            else:
+                value = detector.feature_extractor.extract_all_features(text)
+            results.put((task_id, True, value))
+        except Exception as e:
+            results.put((task_id, False, f"{type(e).__name__}: {e}"))
+
+
+class PreforkWorkerPool:
+    """
+    以 fork 建立、共用父行程模型權重的推論工作行程池
+    
+    用法:
+        detector = AIDetector(model_path=..., feature_extractor=FeatureExtractor())
+        with PreforkWorkerPool(detector, n_workers=8) as pool:
+            results = pool.predict(texts)
+            print(pool.memory_report())
+    """
+    
+    def __init__(self, detector, n_workers: int = None, torch_threads: int = None):
+        """
+        載入完成的偵測器在此 fork 成 n_workers 個工作行程
+        
+        Args:
+            detector: 已載入語言模型與分類器的 AIDetector (尚未執行過前向傳播)
+            n_workers: 工作行程數 (預設為 CPU 核心數)
+            torch_threads: 每個工作行程的 torch intra-op 執行緒數 (預設 CPU 核心數 / n_workers)
+        """
+        global _shared_detector
+        
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise RuntimeError("PreforkWorkerPool requires the 'fork' start method (Linux / macOS)")
+        
+        cores = os.cpu_count() or 1
+        self.n_workers = n_workers or cores
+        self.torch_threads = torch_threads or max(1, cores // self.n_workers)
+        self.parent_memory = process_memory()
+        
+        prepare_for_fork(detector)
+        _shared_detector = detector
+        
+        context = multiprocessing.get_context('fork')
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+        self._workers = [
+            context.Process(target=_worker_loop, args=(self._tasks, self._results, self.torch_threads),
+                            name=f'prefork-worker-{i}', daemon=True)
+            for i in range(self.n_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+        self._next_id = 0
+    
+    def _run(self, kind: str, texts: List[str]) -> List:
+        """分派任務並依輸入順序收集結果"""
+        base = self._next_id
+        self._next_id += len(texts)
+        for offset, text in enumerate(texts):
+            self._tasks.put((base + offset, kind, text))
+        
+        results = [None] * len(texts)
+        remaining = len(texts)
+        while remaining:
+            try:
+                task_id, ok, value = self._results.get(timeout=1.0)
+            except queue.Empty:
+                dead = [w.name for w in self._workers if not w.is_alive()]
+                if dead:
+                    raise RuntimeError(f"Worker processes exited unexpectedly: {', '.join(dead)}")
+                continue
+            if task_id < base:
+                # 先前失敗的呼叫留下的結果
+                continue
+            if not ok:
+                raise RuntimeError(f"Task {task_id - base} failed in worker: {value}")
+            results[task_id - base] = value
+            remaining -= 1
+        return results
+    
+    def predict(self, texts: List[str]) -> List[Dict]:
+        """
+        在工作行程中逐篇預測
+        
+        Returns:
+            與 texts 順序對應的預測結果字典列表 (沒有已訓練的分類器時只含特徵)
+        """
+        return self._run('predict', texts)
+    
+    def extract_features(self, texts: List[str]) -> List[Dict]:
+        """在工作行程中逐篇提取特徵"""
+        return self._run('features', texts)
+    
+    @property
+    def pids(self) -> List[int]:
+        return [worker.pid for worker in self._workers]
+    
+    def memory_report(self) -> Dict:
+        """
+        父行程與各工作行程的記憶體用量
+        
+        Returns:
+            {'parent': process_memory(), 'parent_before_fork': fork 前的父行程,
+             'workers': [各工作行程的 process_memory()],
+             'total_pss_mb': 全部行程的 PSS 總和 (實際占用的記憶體)}
+        """
+        parent = process_memory()
+        workers = [process_memory(pid) for pid in self.pids]
+        report = {'parent': parent, 'parent_before_fork': self.parent_memory, 'workers': workers}
+        if parent['pss_mb'] is not None:
+            report['total_pss_mb'] = parent['pss_mb'] + sum(w['pss_mb'] or 0.0 for w in workers)
+        return report
+    
+    def close(self):
+        """通知所有工作行程結束並等待"""
+        for _ in self._workers:
+            self._tasks.put(None)
+        for worker in self._workers:
+            worker.join(timeout=10)
+            if worker.is_alive():
+                worker.terminate()
+        gc.unfreeze()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,143 @@
+"""
+文本解析模組 - 一次完成斷句、斷詞與詞性標註，供各特徵族共用
+"""
+
+import os
+import threading
+from typing import List, Tuple
+from collections import Counter
+
+# nltk 匯入本身需要數秒，延後到第一次解析文本時才載入
+
+
+# 特徵提取所需的 NLTK 資源 (資源路徑, 下載名稱)
+NLTK_RESOURCES = (
+    ('tokenizers/punkt', 'punkt'),
+    ('taggers/averaged_perceptron_tagger', 'averaged_perceptron_tagger'),
+    ('corpora/stopwords', 'stopwords'),
+)
+
+# 設定後只從此目錄讀取 NLTK 資料、不再下載 (spawn 的工作行程經由環境變數繼承)
+NLTK_DATA_ENV = 'AI_DETECTOR_NLTK_DATA'
+
+_nltk_checked = False
+_nltk_lock = threading.Lock()
+
+_pos_tagger = None
+_pos_tagger_lock = threading.Lock()
+
+
+def ensure_nltk_resources():
+    """
+    確認必要的 NLTK 資源已存在，缺少時下載
+    
+    每個行程只檢查一次；在第一次建立 FeatureExtractor 或解析文本時呼叫，
+    而不是在模組匯入時執行。
+    """
+    global _nltk_checked
+    if _nltk_checked:
+        return
+    with _nltk_lock:
+        if _nltk_checked:
+            return
+        import nltk
+        bundled = os.environ.get(NLTK_DATA_ENV)
+        if bundled:
+            nltk.data.path[:] = [bundled]
+        else:
+            for resource_path, package in NLTK_RESOURCES:
+                try:
+                    nltk.data.find(resource_path)
+                except LookupError:
+                    nltk.download(package)
+        _nltk_checked = True
+
+
+def use_nltk_data(path: str):
+    """
+    只從指定目錄讀取 NLTK 資料，並停用資源檢查與下載
+    
+    Args:
+        path: 含 tokenizers/、taggers/、corpora/ 的 NLTK 資料目錄
+    """
+    global _nltk_checked
+    import nltk
+    
+    with _nltk_lock:
+        os.environ[NLTK_DATA_ENV] = path
+        nltk.data.path[:] = [path]
+        _nltk_checked = True
+
+
+def get_pos_tagger():
+    """
+    取得行程內共用的詞性標註器
+    
+    nltk.pos_tag() 在較舊的 NLTK 版本每次呼叫都會重新從磁碟載入感知器權重，
+    這裡只載入一次並在所有文本、執行緒之間共用。
+    
+    Returns:
+        PerceptronTagger 實例
+    """
+    global _pos_tagger
+    if _pos_tagger is None:
+        with _pos_tagger_lock:
+            if _pos_tagger is None:
+                from nltk.tag import PerceptronTagger
+                _pos_tagger = PerceptronTagger()
+    return _pos_tagger
+
+
+class AnalyzedDocument:
+    """
+    已解析的文本
+    
+    斷句與斷詞在建構時各只做一次；詞性標註成本較高，僅在第一次存取
+    pos_tags 時才執行。Burstiness、Stylometry 與 Zipf 特徵皆從此物件讀取，
+    不再各自重複呼叫 NLTK。
+    """
+    
+    def __init__(self, text: str):
+        """
+        解析文本
+        
+        Args:
+            text: 輸入文本
+        """
+        from nltk import sent_tokenize, word_tokenize
+        ensure_nltk_resources()
+        
+        self.text = text
+        self.sentences: List[str] = sent_tokenize(text)
+        
+        # 逐句斷詞；串接後即等同 word_tokenize(text) 的結果
+        self.sentence_tokens: List[List[str]] = [
+            word_tokenize(sentence, preserve_line=True) for sentence in self.sentences
+        ]
+        self.tokens: List[str] = [token for sentence in self.sentence_tokens for token in sentence]
+        
+        self.alpha_tokens: List[str] = [token for token in self.tokens if token.isalpha()]
+        self.alpha_tokens_lower: List[str] = [token.lower() for token in self.alpha_tokens]
+        self.word_counts: Counter = Counter(self.alpha_tokens_lower)
+        
+        self._pos_tags = None
+        self._pos_counts = None
+    
+    @property
+    def sentence_lengths(self) -> List[int]:
+        """每個句子的 token 數"""
+        return [len(tokens) for tokens in self.sentence_tokens]
+    
+    @property
+    def pos_tags(self) -> List[Tuple[str, str]]:
+        """(token, POS tag) 列表，第一次存取時才標註"""
+        if self._pos_tags is None:
+            self._pos_tags = get_pos_tagger().tag(self.tokens)
+        return self._pos_tags
+    
+    @property
+    def pos_counts(self) -> Counter:
+        """各 POS tag 的出現次數"""
+        if self._pos_counts is None:
+            self._pos_counts = Counter(tag for word, tag in self.pos_tags)
+        return self._pos_counts
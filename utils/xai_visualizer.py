@@ -3,14 +3,10 @@ XAI 可視化模組 - 展示模型如何判斷文本
 """
 
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 from typing import Dict, List, Tuple
-import plotly.graph_objects as go
-import plotly.express as px
 
-plt.rcParams['font.sans-serif'] = ['Arial', 'SimHei']  # 支持中文
-sns.set_style("whitegrid")
+# plotly 在第一次繪圖時才匯入；本模組的圖表全部以 plotly 繪製，
+# 不再於匯入時載入 matplotlib / seaborn
 
 
 class XAIVisualizer:
@@ -20,7 +16,7 @@ class XAIVisualizer:
     def plot_feature_importance(
         top_features: List[Tuple[str, float]],
         title: str = "Feature Importance for AI Detection"
-    ) -> go.Figure:
+    ) -> 'go.Figure':
         """
         繪製特徵重要性圖
         
@@ -31,6 +27,8 @@ class XAIVisualizer:
         Returns:
             Plotly Figure
         """
+        import plotly.graph_objects as go
+        
         names = [f[0] for f in top_features]
         values = [f[1] for f in top_features]
         colors = ['red' if v > 0 else 'blue' for v in values]
@@ -61,7 +59,7 @@ class XAIVisualizer:
     def plot_probability_gauge(
         ai_probability: float,
         title: str = "AI Detection Probability"
-    ) -> go.Figure:
+    ) -> 'go.Figure':
         """
         繪製概率量表
         
@@ -72,6 +70,8 @@ class XAIVisualizer:
         Returns:
             Plotly Figure
         """
+        import plotly.graph_objects as go
+        
         fig = go.Figure(go.Indicator(
             mode="gauge+number+delta",
             value=ai_probability * 100,
@@ -102,7 +102,7 @@ class XAIVisualizer:
     def plot_feature_distribution(
         features_dict: Dict[str, float],
         top_n: int = 10
-    ) -> go.Figure:
+    ) -> 'go.Figure':
         """
         繪製特徵分布
         
@@ -113,6 +113,8 @@ class XAIVisualizer:
         Returns:
             Plotly Figure
         """
+        import plotly.graph_objects as go
+        
         # 選擇前 top_n 個特徵
         sorted_features = sorted(
             features_dict.items(),
@@ -149,7 +151,7 @@ class XAIVisualizer:
         tokens: List[str],
         token_scores: List[float],
         title: str = "Token Importance Heatmap"
-    ) -> go.Figure:
+    ) -> 'go.Figure':
         """
         繪製 Token 重要性熱力圖
         
@@ -161,23 +163,28 @@ class XAIVisualizer:
         Returns:
             Plotly Figure
         """
-        # 整理成矩陣形狀以方便視覺化
+        import plotly.graph_objects as go
+        
+        # 整理成矩陣形狀以方便視覺化 (最後一列不足時以 None 補齊)
         chunk_size = 20
         heatmap_data = []
         token_labels = []
         
         for i in range(0, len(tokens), chunk_size):
-            chunk = tokens[i:i+chunk_size]
-            scores = token_scores[i:i+chunk_size]
-            heatmap_data.append(scores)
-            token_labels.extend(chunk)
+            chunk = [str(token) for token in tokens[i:i+chunk_size]]
+            scores = [float(score) for score in token_scores[i:i+chunk_size]]
+            padding = chunk_size - len(chunk)
+            heatmap_data.append(scores + [None] * padding)
+            token_labels.append(chunk + [''] * padding)
         
         fig = go.Figure(
             data=go.Heatmap(
                 z=heatmap_data,
                 colorscale='RdYlGn',
-                colorbar=dict(title="Importance"),
+                colorbar=dict(title="Score"),
                 text=token_labels,
+                texttemplate="%{text}",
+                hovertemplate="%{text}<br>%{z:.3f}<extra></extra>",
             )
         )
         
@@ -185,7 +192,8 @@ class XAIVisualizer:
             title=title,
             xaxis_title="Token Position",
             yaxis_title="Text Chunk",
-            height=300,
+            yaxis=dict(autorange='reversed'),
+            height=max(300, 40 * len(heatmap_data) + 120),
             template="plotly_white",
         )
         
@@ -194,7 +202,7 @@ class XAIVisualizer:
     @staticmethod
     def plot_prediction_comparison(
         prediction_results: Dict
-    ) -> go.Figure:
+    ) -> 'go.Figure':
         """
         繪製 Human vs AI 概率對比
         
@@ -204,6 +212,8 @@ class XAIVisualizer:
         Returns:
             Plotly Figure
         """
+        import plotly.graph_objects as go
+        
         fig = go.Figure(
             data=[
                 go.Bar(
@@ -236,7 +246,7 @@ class XAIVisualizer:
     def plot_feature_radar(
         features_dict: Dict[str, float],
         categories: List[str] = None
-    ) -> go.Figure:
+    ) -> 'go.Figure':
         """
         繪製雷達圖
         
@@ -247,6 +257,8 @@ class XAIVisualizer:
         Returns:
             Plotly Figure
         """
+        import plotly.graph_objects as go
+        
         if categories is None:
             categories = list(features_dict.keys())[:8]  # 限制為 8 個特徵
         